@@ -1,10 +1,33 @@
 #!/usr/bin/env python3
+import time
+STARTUP_BEGIN = time.perf_counter()
 import os
 import sys
-import time
+import asyncio
 import argparse
 import textwrap
 from datetime import datetime
+from stream import StreamRenderer
+import daemon
+from context import ContextWindow, MODEL_CONTEXT, content_text, vision_model
+from history import HistoryStore, remove_store, migrate_legacy, migrate_line_file
+from search import SearchIndex, print_hits, backfill_log
+from logfile import append_record, Rotation, disk_usage
+from cache import DiskCache, response_key, print_stats, cached_extract
+from ooxml import OOXML_TYPES, extract_text
+from pdftext import iter_text
+from images import encode_image, image_content, split_content, user_content
+from ingest import ingest_files
+from chunking import map_reduce, complete
+from knowledge import KnowledgeIndex
+from batch import RateLimiter, load_items, run_batch, print_batch_stats
+from fanout import race, compare, status, print_summary, print_columns
+from retry import RetryPolicy, RequestFailed, stream_with_retry, is_retryable
+from promptcache import apply_cache, forget_cache
+from metrics import RequestMetrics, save_metrics, load_metrics, print_metrics
+from session import (StreamControl, LineReader, BackgroundWriter, run_interruptible,
+                     install_interrupt, remove_interrupt)
+STARTUP_IMPORTS_DONE = time.perf_counter()
 
 # 全局配置
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,14 +37,68 @@ if not os.path.exists(DATA_FOLDER):
     os.makedirs(DATA_FOLDER, exist_ok=True)
 
 # 更新文件路径
-TMP_FILE = os.path.join(DATA_FOLDER, 'chat_history.txt')  # 普通文件名，非隐藏
+TMP_FILE = os.path.join(DATA_FOLDER, 'chat_history.db')  # 普通文件名，非隐藏
+LEGACY_TMP_FILE = os.path.join(DATA_FOLDER, 'chat_history.txt')  # 旧 role|content 格式，首次加载时迁移
 LOG_FILE = os.path.join(DATA_FOLDER, 'chat_log.txt')      # 普通文件名，非隐藏
+LOG_INDEX_FILE = os.path.join(DATA_FOLDER, 'chat_log.idx')  # 日志全文索引
+CACHE_FILE = os.path.join(DATA_FOLDER, 'response_cache.db')  # 响应缓存
+EXTRACT_CACHE_FILE = os.path.join(DATA_FOLDER, 'extract_cache.db')  # 文件提取缓存（按内容哈希）
+BKG_FILE = os.path.join(SCRIPT_DIR, 'bkg.txt')  # 背景知识
+BKG_INDEX_FILE = os.path.join(DATA_FOLDER, 'bkg_index.db')  # 背景知识检索索引
+METRICS_FILE = os.path.join(DATA_FOLDER, 'metrics.jsonl')  # 每次请求的耗时统计
+CONTEXT_CACHE_FILE = os.path.join(DATA_FOLDER, 'context_cache.db')  # 前缀哈希 -> 服务端上下文缓存 ID
 MODELS = ['kimi-latest', 'moonshot-v1-128k']
 MODEL_INDEX = 0  # 当前使用的模型索引
 TEMPERATURE = 0.3
-API_URL = 'https://api.moonshot.cn/v1'
+API_URL = os.getenv('MOONSHOT_BASE_URL', 'https://api.moonshot.cn/v1')
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_HISTORY = 10  # 上下文中最多保留的对话轮数
+CONTEXT_RESERVE = 2048  # 上下文中为回答预留的 tokens
 TERMINAL_WIDTH = 80  # 默认终端宽度
+STREAM_FRAME_MS = 30  # 流式输出每帧最长合并时间(毫秒)
+STREAM_FRAME_BYTES = 512  # 流式输出每帧最多合并字节数
+TYPEWRITER = False  # 打字机效果（仅影响显示，不影响网络流读取）
+TYPEWRITER_CPS = 200  # 打字机效果每秒字符数
+RESPONSE_CACHE = False  # 响应缓存（默认关闭，--cache 开启）
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # 响应缓存有效期(秒)
+RESPONSE_CACHE_MAX_MB = 50  # 响应缓存总大小上限(MB)
+EXTRACT_CACHE_MAX_MB = 200  # 文件提取缓存总大小上限(MB)
+CONTEXT_CACHE = True  # 背景知识和较早的对话作为不变前缀缓存在服务端（moonshot-v1 模型组；kimi-latest 自动缓存）
+CONTEXT_CACHE_TTL = 900  # 上下文缓存有效期(秒)，每次使用时续期
+CONTEXT_CACHE_MIN_TOKENS = 1024  # 之前请求中出现过的前缀，新增部分不少于此 tokens 时才创建缓存
+CONTEXT_CACHE_BKG_TOKENS = 8000  # 背景知识不超过此值时整体发送（前缀不随问题变化），超出时仍按问题检索
+PDF_LOCAL = True  # PDF 优先在本地读取文字层，只把扫描页上传提取
+PDF_PART_PAGES = 20  # 需要上传提取的页按此页数（且不超过 MAX_FILE_SIZE）分段并发提取
+PDF_WORKERS = 4  # 同一 PDF 同时上传提取的部分数上限
+IMAGE_TYPES = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
+IMAGE_MAX_SIDE = 1280  # 图片长边超过此像素数时在本地缩小（需要 Pillow）
+IMAGE_MAX_KB = 1024  # 编码前的图片大小上限(KB)，超出时降低质量或继续缩小
+IMAGE_QUALITY = 85  # 重新编码为 JPEG 的质量
+INGEST_WORKERS = 4  # 同时处理的文件数上限
+INGEST_TIMEOUT = 120  # 单个文件的处理超时(秒)
+TEXT_TYPES = ['.txt', '.py', '.md', '.json', '.html', '.csv', '.log']
+LARGE_TEXT_SIZE = 200 * 1024  # 超过此大小的文本文件分段处理（不受 MAX_FILE_SIZE 限制）
+CHUNK_TOKENS = 32000  # 大文本文件每段最多 tokens（另受所选模型的上下文窗口限制）
+CHUNK_RESULT_TOKENS = 16000  # 合并后的分段结果最多 tokens
+BKG_TOP_K = 5  # 每次提问最多选取的背景知识部分数
+BKG_TOKENS = 4000  # 背景知识最多占用的 tokens（全部不超过时全部发送）
+BKG_SECTION_TOKENS = 1000  # 背景知识按分隔符和空行切分，每部分最多 tokens
+BATCH_CONCURRENCY = 4  # 批量模式并发请求数
+BATCH_RPM = 60  # 批量模式每分钟请求数上限（0 表示不限制）
+BATCH_TPM = 100000  # 批量模式每分钟 tokens 上限（0 表示不限制）
+RETRY_ATTEMPTS = 4  # 可重试错误（429、5xx、超时）最多尝试次数
+RETRY_BASE = 0.5  # 退避基数(秒)，第 n 次等待 0 ~ base*2^n 之间的随机值
+RETRY_CAP = 8.0  # 单次退避等待上限(秒)
+RETRY_DEADLINE = 60.0  # 重试总耗时上限(秒)
+LOG_FSYNC = 'batch'  # 日志 fsync 策略: always / batch（每个文件至多每秒一次）/ never
+LOG_FSYNC_INTERVAL = 1.0  # batch 模式的 fsync 间隔(秒)
+LOG_ROTATE_MB = 20  # 日志超过此大小时压缩为 gzip 分段(MB)，检索仍可读取；0 表示不轮转
+LOG_ROTATE_DAYS = 30  # 日志使用超过此天数时轮转（0 表示不按时间轮转）
+LOG_MAX_TOTAL_MB = 200  # 归档分段总大小上限(MB)，超出时删除最早的分段
+METRICS = True  # 记录每次请求的耗时和吞吐（--stats 查看）
+METRICS_MAX_MB = 5  # 统计文件大小上限(MB)，超出时丢弃较早的记录
+DAEMON_SOCKET = daemon.default_socket_path()  # 守护进程套接字
+DAEMON_IDLE_TIMEOUT = 1800  # 守护进程空闲超时(秒)
 
 def get_terminal_width():
     """获取终端宽度"""
@@ -31,8 +108,8 @@ def get_terminal_width():
     except:
         return TERMINAL_WIDTH
 
-def init_openai_client():
-    """初始化OpenAI客户端 - 更健壮的密钥处理"""
+def get_api_key():
+    """获取API密钥 - 环境变量、key.txt、手动输入"""
     try:
         # 1. 尝试从环境变量获取
         api_key = os.getenv('MOONSHOT_API_KEY')
@@ -62,12 +139,46 @@ def init_openai_client():
                 print("必须提供API密钥才能继续")
                 sys.exit(1)
         
+        return api_key
+    except Exception as e:
+        print(f"获取API密钥失败: {e}")
+        sys.exit(1)
+
+def init_openai_client():
+    """初始化OpenAI客户端 - 更健壮的密钥处理"""
+    api_key = get_api_key()
+    try:
         from openai import OpenAI
         return OpenAI(api_key=api_key, base_url=API_URL)
     except Exception as e:
         print(f"初始化API客户端失败: {e}")
         sys.exit(1)
 
+def connect_client(use_daemon=True):
+    """优先通过守护进程复用连接，未运行时直接创建客户端"""
+    if use_daemon:
+        return daemon.connect(DAEMON_SOCKET, API_URL, fallback=init_openai_client)
+    return init_openai_client()
+
+def daemon_command(action):
+    """守护进程管理: start / stop / status"""
+    if action == 'start':
+        if daemon.start(DAEMON_SOCKET, get_api_key(), API_URL, DAEMON_IDLE_TIMEOUT):
+            print(f"守护进程已启动: {DAEMON_SOCKET}")
+        else:
+            print("守护进程启动失败")
+    elif action == 'stop':
+        if daemon.stop(DAEMON_SOCKET):
+            print("守护进程已停止")
+        else:
+            print("守护进程未运行")
+    else:
+        info = daemon.ping(DAEMON_SOCKET)
+        if info:
+            print(f"守护进程运行中 (pid {info.get('pid')}, {info.get('base_url')})")
+        else:
+            print("守护进程未运行")
+
 def print_formatted(text, prefix="", width=None):
     """格式化输出文本，自动换行"""
     if width is None:
@@ -96,37 +207,113 @@ def print_formatted(text, prefix="", width=None):
         # 段落间空行
         print()
 
-def process_file(file_path, client):
+def open_context_cache():
+    """打开上下文缓存记录（有效期略短于服务端，不引用即将过期的缓存）"""
+    return DiskCache(CONTEXT_CACHE_FILE, 1024 * 1024, CONTEXT_CACHE_TTL * 0.9)
+
+def open_extract_cache():
+    """打开文件提取缓存"""
+    return DiskCache(EXTRACT_CACHE_FILE, EXTRACT_CACHE_MAX_MB * 1024 * 1024)
+
+def extract_pdf(file_path, client):
+    """上传PDF到API提取文本，失败时抛出异常"""
+    from pathlib import Path
+    file_obj = client.files.create(file=Path(file_path), purpose="file-extract")
+    try:
+        content = client.files.retrieve_content(file_id=file_obj.id)
+    except:
+        content = client.files.content(file_id=file_obj.id).text
+    client.files.delete(file_id=file_obj.id)
+    return content
+
+def is_large_text(file_path):
+    """是否为需要分段处理的大文本文件"""
+    ext = os.path.splitext(file_path)[1].lower()
+    return ext in TEXT_TYPES and os.path.getsize(file_path) > LARGE_TEXT_SIZE
+
+def is_large_pdf(file_path):
+    """是否为超过 MAX_FILE_SIZE、需要分段提取的 PDF"""
+    return os.path.splitext(file_path)[1].lower() == '.pdf' and os.path.getsize(file_path) > MAX_FILE_SIZE
+
+def process_large_text(file_path, client, question=None, text=None):
+    """大文本文件（或 PDF 提取出的大段文字 text）分段提问（每段一次调用），返回合并后的各段结果"""
+    model = MODELS[MODEL_INDEX]
+    try:
+        notes, count = map_reduce(lambda messages: complete(client, messages, model, TEMPERATURE),
+                                  file_path, question, CHUNK_TOKENS, CHUNK_RESULT_TOKENS,
+                                  INGEST_WORKERS, text=text, context=MODEL_CONTEXT.get(model),
+                                  reserve=CONTEXT_RESERVE)
+        return f"文件 {os.path.basename(file_path)} 已分 {count} 段处理，各段结果:\n{notes}"
+    except Exception as e:
+        return f"分段处理文件时出错: {str(e)}"
+
+def process_file(file_path, client, question=None):
     """处理文件内容 - 更友好的错误处理"""
     try:
         if not os.path.isfile(file_path):
             return f"文件不存在: {file_path}"
         
-        file_size = os.path.getsize(file_path)
-        if file_size > MAX_FILE_SIZE:
-            return f"文件过大 ({file_size/1024/1024:.2f}MB)，最大支持{MAX_FILE_SIZE/1024/1024}MB"
+        # 大文本文件逐段处理，不整体读入
+        if is_large_text(file_path):
+            return process_large_text(file_path, client, question)
         
+        file_size = os.path.getsize(file_path)
         ext = os.path.splitext(file_path)[1].lower()
+        if file_size > MAX_FILE_SIZE and ext != '.pdf' and ext not in IMAGE_TYPES:
+            return f"文件过大 ({file_size/1024/1024:.2f}MB)，最大支持{MAX_FILE_SIZE/1024/1024}MB"
         
-        # PDF处理
+        # PDF处理：文字层在本地读取，扫描页分段并发上传提取，不受大小限制（相同内容的文件直接使用缓存的提取结果）
         if ext == '.pdf':
-            from pathlib import Path
-            file_obj = client.files.create(file=Path(file_path), purpose="file-extract")
+            metrics = RequestMetrics('pdf')
+            metrics.extra.update(bytes=file_size, cached=True)
+            
+            def on_part(label, error, seconds):
+                if label is not None:
+                    status = '完成' if error is None else f'失败: {error}'
+                    print(f"  {os.path.basename(file_path)} 第 {label} 页提取{status} ({seconds:.1f}s)")
+            
+            def extract(path):
+                metrics.extra['cached'] = False
+                return ''.join(iter_text(path, lambda part: extract_pdf(part, client), metrics.extra,
+                                         PDF_LOCAL, PDF_WORKERS, MAX_FILE_SIZE, PDF_PART_PAGES, on_part))
+            
             try:
-                content = client.files.retrieve_content(file_id=file_obj.id)
-            except:
-                content = client.files.content(file_id=file_obj.id).text
-            client.files.delete(file_id=file_obj.id)
+                with open_extract_cache() as cache:
+                    content = cached_extract(cache, 'pdftext' if PDF_LOCAL else 'pdf', file_path, extract,
+                                             uploaded=not PDF_LOCAL)
+            except Exception as e:
+                record_request(metrics.finish(e))
+                raise
+            record_request(metrics.finish())
+            # 提取出的文字过长时与大文本文件一样分段提问
+            if len(content.encode('utf-8')) > LARGE_TEXT_SIZE:
+                return process_large_text(file_path, client, question, content)
             return f"PDF文件内容: {content}"
         
+        # 图片在本地缩小到字节预算内，编码结果同样按内容缓存
+        elif ext in IMAGE_TYPES:
+            def encode(path):
+                return encode_image(path, IMAGE_MAX_SIDE, IMAGE_MAX_KB * 1024, IMAGE_QUALITY)
+            
+            with open_extract_cache() as cache:
+                url = cached_extract(cache, f'image:{IMAGE_MAX_SIDE}:{IMAGE_MAX_KB}:{IMAGE_QUALITY}',
+                                     file_path, encode)
+            return image_content(url, f"图片文件: {os.path.basename(file_path)}")
+        
+        # Office 文档在本地解析，同样按内容缓存
+        elif ext in OOXML_TYPES:
+            with open_extract_cache() as cache:
+                content = cached_extract(cache, 'ooxml', file_path, extract_text)
+            return f"文件内容:\n{content}"
+        
         # 文本文件处理
-        elif ext in ['.txt', '.py', '.md', '.json', '.html', '.csv']:
+        elif ext in TEXT_TYPES:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
             return f"文件内容:\n{content}"
         
-        # 图片和音频处理
-        elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.mp3', '.wav', '.ogg']:
+        # 音频处理
+        elif ext in ['.mp3', '.wav', '.ogg']:
             return f"已添加{ext.upper()[1:]}文件: {os.path.basename(file_path)}"
         
         else:
@@ -134,42 +321,152 @@ def process_file(file_path, client):
     except Exception as e:
         return f"处理文件时出错: {str(e)}"
 
-def get_chat_response(client, messages):
-    """获取AI响应 - 添加重试机制"""
+def ask_models(client, messages, models, race_mode=False):
+    """同时请求多个模型：竞速模式只输出最先响应的模型，否则并排比较全部回答
+
+    返回 [(模型, 回答), ...]，只包含成功的回答。
+    """
+    width = get_terminal_width()
+    print("\n" + "=" * width)
+    if race_mode:
+        print(f"AI 回答 (竞速: {', '.join(models)}):")
+        print("=" * width)
+        with new_renderer() as renderer:
+            winner, runs = race(client, messages, models, TEMPERATURE, renderer.write)
+        print("\n" + "=" * width)
+        print_summary(runs, winner)
+        # 获胜的模型输出首个 token 后失败时，已显示的部分不作为完整回答记录
+        if winner is None or winner.error is not None or not winner.text:
+            return []
+        return [(winner.model, winner.text)]
+    
+    print(f"AI 回答 (比较: {', '.join(models)}):")
+    print("=" * width)
+    runs = compare(client, messages, models, TEMPERATURE,
+                   on_done=lambda run: print(f"  {run.model} {status(run)}"))
+    print_columns(runs, width)
+    print("=" * width)
+    print_summary(runs)
+    return [(run.model, run.text) for run in runs if run.error is None and run.text]
+
+def run_batch_file(client, args):
+    """批量模式：共用一个客户端，限制并发和速率，结果逐条追加到输出文件"""
+    try:
+        items = load_items(args.batch)
+    except Exception as e:
+        print(f"读取批量输入失败: {e}")
+        return
+    out_path = args.out or os.path.splitext(args.batch)[0] + '.results.jsonl'
+    print(f"批量执行 {len(items)} 条提示 -> {out_path}（并发 {args.concurrency}，"
+          f"每分钟 {args.rpm or '不限'} 请求 / {args.tpm or '不限'} tokens）")
+    stats = run_batch(client, items, out_path, MODELS[MODEL_INDEX], TEMPERATURE,
+                      args.concurrency, RateLimiter(args.rpm, args.tpm),
+                      policy=RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE, RETRY_CAP, RETRY_DEADLINE))
+    print_batch_stats(stats)
+
+def open_cache():
+    """打开响应缓存"""
+    return DiskCache(CACHE_FILE, RESPONSE_CACHE_MAX_MB * 1024 * 1024, RESPONSE_CACHE_TTL)
+
+def new_renderer():
+    """按配置创建流式渲染器"""
+    return StreamRenderer(frame_ms=STREAM_FRAME_MS, frame_bytes=STREAM_FRAME_BYTES,
+                          typewriter=TYPEWRITER, cps=TYPEWRITER_CPS)
+
+def record_request(metrics, client=None, fresh=False):
+    """写入一次请求的耗时统计（fresh 表示客户端是在本次请求中创建的）"""
+    if not METRICS:
+        return
+    if fresh:
+        metrics.client_init = getattr(client, 'init_seconds', None)
+    save_metrics(METRICS_FILE, metrics, METRICS_MAX_MB * 1024 * 1024)
+
+def get_chat_response(client, messages, model=None, control=None):
+    """获取AI响应 - 添加重试机制和响应缓存（control 可中断，中断后返回部分内容；最终失败时返回 None）"""
     global MODEL_INDEX  # 声明使用全局变量
     
-    max_retries = 3
-    for attempt in range(max_retries):
+    model = vision_model(model or MODELS[MODEL_INDEX], messages)
+    
+    cache_key = None
+    if RESPONSE_CACHE:
+        cache_key = response_key(model, TEMPERATURE, messages)
         try:
-            stream = client.chat.completions.create(
-                model=MODELS[MODEL_INDEX],
-                messages=messages,
-                temperature=TEMPERATURE,
-                stream=True
-            )
-            
-            full_response = ""
+            with open_cache() as cache:
+                cached = cache.get_text(cache_key)
+        except Exception as e:
+            print(f"读取缓存失败: {e}")
+            cached = None
+        if cached is not None:
             print("\n" + "=" * get_terminal_width())
-            print("AI 回答:")
+            print("AI 回答 (缓存):")
             print("=" * get_terminal_width())
-            
-            # 流式接收响应
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    print(content, end='', flush=True)
-                    full_response += content
-            
+            with new_renderer() as renderer:
+                renderer.write(cached)
             print("\n" + "=" * get_terminal_width())
-            return full_response
+            return cached
+    
+    policy = RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE, RETRY_CAP, RETRY_DEADLINE)
+    metrics = RequestMetrics('chat', model)
+    fresh = not getattr(client, 'initialized', True)  # 本次请求是否需要创建客户端
+    
+    # 不变的前缀（背景知识、较早的对话）用服务端上下文缓存代替
+    request, context_cache = messages, None
+    if CONTEXT_CACHE:
+        try:
+            with open_context_cache() as registry:
+                request, context_cache = apply_cache(client, registry, model, messages,
+                                                     CONTEXT_CACHE_TTL, CONTEXT_CACHE_MIN_TOKENS)
         except Exception as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"\n请求失败，{wait_time}秒后重试... ({str(e)})")
-                time.sleep(wait_time)
-            else:
-                print(f"\n最终请求失败: {str(e)}")
-                return "抱歉，处理您的请求时出现问题。"
+            print(f"读取上下文缓存失败: {e}")
+    
+    print("\n" + "=" * get_terminal_width())
+    print("AI 回答:")
+    print("=" * get_terminal_width())
+    renderer = new_renderer()
+    
+    def on_retry(error, wait, resumed):
+        action = '继续' if resumed else '重试'
+        renderer.write(f"\n[请求失败，{wait:.1f}秒后{action}... ({error})]\n")
+    
+    try:
+        try:
+            answer = stream_with_retry(client, request, renderer.write, policy, control, on_retry,
+                                       metrics, model=model, temperature=TEMPERATURE)
+        except RequestFailed as e:
+            if context_cache is None or e.partial or is_retryable(e.error):
+                raise
+            # 缓存已过期或被删除：删除记录后发送完整消息
+            with open_context_cache() as registry:
+                forget_cache(registry, context_cache)
+            context_cache = None
+            answer = stream_with_retry(client, messages, renderer.write, policy, control, on_retry,
+                                       metrics, model=model, temperature=TEMPERATURE)
+    except RequestFailed as e:
+        renderer.close()
+        record_request(metrics.finish(e), client, fresh)
+        print(f"\n最终请求失败（共尝试{e.attempts}次）: {e}")
+        print("=" * get_terminal_width())
+        return None
+    renderer.close()
+    metrics.cancelled = control is not None and control.cancelled
+    if context_cache is not None and metrics.cached_tokens is None:
+        metrics.extra['cached_tokens'] = context_cache['tokens']  # 服务端未返回时按缓存大小计
+    record_request(metrics.finish(), client, fresh)
+    
+    if control is not None and control.cancelled:
+        print("\n[回答已中断]")
+        print("=" * get_terminal_width())
+        return answer
+    
+    print("\n" + "=" * get_terminal_width())
+    
+    if cache_key:
+        try:
+            with open_cache() as cache:
+                cache.set_text(cache_key, answer)
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+    return answer
 
 def save_history(messages, file_path):
     """保存对话历史 - 添加错误处理"""
@@ -177,7 +474,7 @@ def save_history(messages, file_path):
         with open(file_path, 'w', encoding='utf-8') as f:
             for msg in messages:
                 role = msg['role'].upper()
-                content = msg['content']
+                content = content_text(msg['content'])
                 f.write(f"{role}:\n")
                 # 使用textwrap.fill处理内容
                 wrapped_content = textwrap.fill(content, width=80)
@@ -219,82 +516,174 @@ def print_help():
     
     print("=" * terminal_width + "\n")
 
+def handle_tmp_command(user_input):
+    """处理临时文件命令 (stoptmp, usetmp, cleantmp)，已处理时返回 True"""
+    command = user_input.strip().lower()
+    
+    if command in ['stoptmp', 'rmtmp']:
+        if remove_store(TMP_FILE):
+            print(f"临时文件已删除: {os.path.abspath(TMP_FILE)}")
+        else:
+            print(f"临时文件不存在: {os.path.abspath(TMP_FILE)}")
+        return True
+
+    if command in ['usetmp', 'tmp']:
+        try:
+            # 确保目录存在
+            os.makedirs(os.path.dirname(TMP_FILE), exist_ok=True)
+            HistoryStore(TMP_FILE).close()
+            print(f"临时文件已创建在: {os.path.abspath(TMP_FILE)}")
+        except Exception as e:
+            print(f"创建失败: {e}")
+        return True
+
+    if command == 'cleantmp':
+        try:
+            remove_store(TMP_FILE)
+            # 确保目录存在
+            os.makedirs(os.path.dirname(TMP_FILE), exist_ok=True)
+            HistoryStore(TMP_FILE).close()
+            print(f"临时文件已清理并重新创建: {os.path.abspath(TMP_FILE)}")
+        except Exception as e:
+            print(f"清理失败: {e}")
+        return True
+    
+    return False
+
+def append_history(question, answer, model):
+    """追加一轮对话到历史库"""
+    try:
+        with HistoryStore(TMP_FILE) as store:
+            store.append(question, answer or None, model=model)
+    except Exception as e:
+        print(f"写入历史记录失败: {e}")
+
+def write_log(user_content, response, model):
+    """追加日志并更新全文索引"""
+    now = datetime.now()
+    timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    record = f"[{timestamp}] USER: {user_content}\n[{timestamp}] AI: {response}\n\n"
+    try:
+        rotation = Rotation(LOG_ROTATE_MB * 1024 * 1024, LOG_ROTATE_DAYS, LOG_MAX_TOTAL_MB * 1024 * 1024)
+        offset, length = append_record(LOG_FILE, record, 0o600, LOG_FSYNC, LOG_FSYNC_INTERVAL,
+                                       rotation)
+    except Exception as e:
+        print(f"写入日志失败: {e}")
+        return
+    try:
+        with SearchIndex(LOG_INDEX_FILE) as index:
+            index.add(user_content + '\n' + response, now.timestamp(), os.getcwd(), model,
+                      user_content, LOG_FILE, offset, length)
+    except Exception as e:
+        print(f"更新日志索引失败: {e}")
+
+def search_log(query, limit=10):
+    """在日志全文索引中检索"""
+    if not os.path.exists(LOG_INDEX_FILE) and not os.path.exists(LOG_FILE):
+        print("日志索引不存在")
+        return
+    with SearchIndex(LOG_INDEX_FILE) as index:
+        backfill_log(index, LOG_FILE)
+        start = time.perf_counter()
+        hits = index.search(query, limit)
+    print_hits(hits, query, time.perf_counter() - start)
+
+def print_startup_profile(client, marks):
+    """打印启动各阶段耗时"""
+    print("\n启动耗时:")
+    print(f"  {'模块导入'.ljust(16)} {(STARTUP_IMPORTS_DONE - STARTUP_BEGIN) * 1000:8.1f} ms")
+    previous = STARTUP_IMPORTS_DONE
+    for name, moment in marks:
+        print(f"  {name.ljust(16)} {(moment - previous) * 1000:8.1f} ms")
+        previous = moment
+    if client is not None and client.init_seconds is not None:
+        print(f"  {'(其中)客户端创建'.ljust(16)} {client.init_seconds * 1000:8.1f} ms")
+    print(f"  {'总计'.ljust(16)} {(time.perf_counter() - STARTUP_BEGIN) * 1000:8.1f} ms")
+    print(f"  已加载模块: {len(sys.modules)}，已导入SDK: {'是' if 'openai' in sys.modules else '否'}")
+    print("  详细导入耗时: python3 -X importtime ai.py ...")
+
+def load_knowledge(query):
+    """检索与问题最相关的背景知识，返回系统消息列表"""
+    if not os.path.exists(BKG_FILE):
+        return []
+    try:
+        with KnowledgeIndex(BKG_INDEX_FILE, BKG_FILE, '#---FILE_SPLIT---', BKG_SECTION_TOKENS) as index:
+            sections = index.select(query, BKG_TOP_K, BKG_TOKENS,
+                                    CONTEXT_CACHE_BKG_TOKENS if CONTEXT_CACHE else None)
+        return [{"role": "system", "content": section} for section in sections]
+    except Exception as e:
+        print(f"加载背景知识失败: {e}")
+        return []
+
 def interactive_mode(client):
     """交互模式主函数 - 优化输出格式"""
+    asyncio.run(interactive_session(client))
+
+async def interactive_session(client):
+    """交互会话：回答输出期间可继续输入，Ctrl-C 中断当前回答并保留已输出的部分"""
     global MODEL_INDEX  # 声明使用全局变量
     
-    messages = []
+    # 按 token 预算管理上下文，超出时丢弃最早的对话
+    context = ContextWindow(model=MODELS[MODEL_INDEX], max_turns=MAX_HISTORY,
+                            reserve=CONTEXT_RESERVE)
     
-    # 加载背景知识
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    bkg_path = os.path.join(script_dir, 'bkg.txt')
-    if os.path.exists(bkg_path):
-        try:
-            with open(bkg_path, 'r', encoding='utf-8') as f:
-                bkg_content = f.read()
-            messages.append({"role": "system", "content": bkg_content})
-            print("已加载背景知识")
-        except Exception as e:
-            print(f"加载背景知识失败: {e}")
+    # 背景知识按每次的问题检索，只发送最相关的部分
+    if os.path.exists(BKG_FILE):
+        print("已启用背景知识检索")
     
-    # 加载历史记录
-    if os.path.exists(TMP_FILE):
+    # 加载历史记录（只读取最近 MAX_HISTORY 轮）
+    if os.path.exists(TMP_FILE) or os.path.exists(LEGACY_TMP_FILE):
         try:
-            with open(TMP_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        parts = line.split('|')
-                        if len(parts) >= 2:
-                            role = parts[0].strip()
-                            content = parts[1].strip()
-                            messages.append({"role": role, "content": content})
-            print(f"已加载{len(messages)}条历史记录")
+            with HistoryStore(TMP_FILE) as store:
+                count = migrate_legacy(store, LEGACY_TMP_FILE, migrate_line_file)
+                if count:
+                    print(f"已迁移{count}条旧格式历史记录")
+                context.extend(store.last_messages(MAX_HISTORY))
+            print(f"已加载{len(context.history)}条历史记录")
         except Exception as e:
             print(f"加载历史记录失败: {e}")
     
     terminal_width = get_terminal_width()
     print("\n" + "=" * terminal_width)
     print("AI 助手交互模式")
-    print("输入 '!help' 查看帮助, '!exit' 退出")
+    print("输入 '!help' 查看帮助, '!exit' 退出, 回答输出时按 Ctrl-C 中断")
     print("=" * terminal_width + "\n")
     
     last_response = None
+    current = None  # 正在输出的回答
+    
+    def on_interrupt():
+        if current is not None and not current.cancelled:
+            current.cancel()
+        else:
+            print("\n输入 '!exit' 退出")
+    
+    async def ask(model):
+        """在后台线程请求回答，可被 Ctrl-C 中断"""
+        nonlocal current
+        messages = context.messages()
+        control = current = StreamControl()
+        try:
+            return await run_interruptible(
+                lambda: get_chat_response(client, messages, model, control), control)
+        finally:
+            current = None
+    
+    loop = asyncio.get_running_loop()
+    reader = LineReader(loop)
+    writer = BackgroundWriter()  # 历史记录在后台写入
+    install_interrupt(loop, on_interrupt)
     
     while True:
         try:
-            user_input = input("> ").strip()
+            user_input = await reader.readline("> ")
+            if user_input is None:
+                print("\n退出交互模式")
+                break
+            user_input = user_input.strip()
            
-            # 添加特殊命令处理 (stoptmp, usetmp, cleantmp)
-            if user_input.lower() in ['stoptmp', 'rmtmp']:
-                if os.path.exists(TMP_FILE):
-                    os.remove(TMP_FILE)
-                    print(f"临时文件已删除: {os.path.abspath(TMP_FILE)}")
-                else:
-                    print(f"临时文件不存在: {os.path.abspath(TMP_FILE)}")
-                continue
-
-            if user_input.lower() in ['usetmp', 'tmp']:
-                try:
-                    # 确保目录存在
-                    os.makedirs(os.path.dirname(TMP_FILE), exist_ok=True)
-                    with open(TMP_FILE, 'a+', encoding='utf-8') as file:
-                        file.write('\n')
-                    print(f"临时文件已创建在: {os.path.abspath(TMP_FILE)}")
-                except Exception as e:
-                    print(f"创建失败: {e}")
-                continue
-
-            if user_input.lower() == 'cleantmp': # type: ignore
-                try:
-                    if os.path.exists(TMP_FILE):
-                        os.remove(TMP_FILE)
-                     # 确保目录存在
-                    os.makedirs(os.path.dirname(TMP_FILE), exist_ok=True)
-                    with open(TMP_FILE, 'a+', encoding='utf-8') as file:
-                        file.write('\n')
-                    print(f"临时文件已清理并重新创建: {os.path.abspath(TMP_FILE)}")
-                except Exception as e:
-                    print(f"清理失败: {e}")
+            # 特殊命令处理 (stoptmp, usetmp, cleantmp)
+            if handle_tmp_command(user_input):
                 continue
             
             # 处理空输入
@@ -319,11 +708,12 @@ def interactive_mode(client):
                     print(f"{prefix}{i+1}. {model}")
                 
                 try:
-                    choice = input("\n输入模型编号切换 (按Enter取消): ").strip()
+                    choice = (await reader.readline("\n输入模型编号切换 (按Enter取消): ") or "").strip()
                     if choice:
                         new_index = int(choice) - 1
                         if 0 <= new_index < len(MODELS):
                             MODEL_INDEX = new_index
+                            context.model = MODELS[MODEL_INDEX]
                             print(f"已切换到模型: {MODELS[MODEL_INDEX]}")
                         else:
                             print("无效的模型编号")
@@ -333,7 +723,7 @@ def interactive_mode(client):
                 
             # 重置对话
             if user_input.lower() == '!reset':
-                messages = []
+                context.clear()
                 print("\n对话已重置\n")
                 continue
                 
@@ -341,11 +731,8 @@ def interactive_mode(client):
             if user_input.lower().startswith('!save'):
                 parts = user_input.split(maxsplit=1)
                 save_path = parts[1] if len(parts) > 1 else "ai_chat_history.txt"
-                if save_history(messages, save_path):
-                    # 同时更新历史文件
-                    with open(TMP_FILE, 'w', encoding='utf-8') as f:
-                        for msg in messages:
-                            f.write(f"{msg['role']}|{msg['content']}\n")
+                # 每轮对话已追加到历史库，这里只导出当前会话
+                save_history(context.messages(), save_path)
                 continue
                 
             # 添加文件
@@ -356,24 +743,22 @@ def interactive_mode(client):
                     continue
                     
                 file_path = parts[1].strip()
-                file_content = process_file(file_path, client)
+                file_content, images = split_content(process_file(file_path, client))
                 
-                # 格式化文件内容提示
+                # 格式化文件内容提示（图片随消息发送）
                 file_prompt = f"请分析以下内容: {file_content}"
-                messages.append({"role": "user", "content": file_prompt})
+                context.append({"role": "user", "content": user_content(file_prompt, images)})
+                context.set_system(load_knowledge(file_prompt))
                 print(f"\n已添加文件: {file_path}")
                 
                 # 获取AI响应
-                response = get_chat_response(client, messages)
+                model = context.fit()
+                response = await ask(model)
                 if response:
-                    messages.append({"role": "assistant", "content": response})
+                    context.append({"role": "assistant", "content": response})
                     last_response = response
-                
-                # 保存到历史
-                with open(TMP_FILE, 'a', encoding='utf-8') as f:
-                    f.write(f"user|分析文件: {file_path}\n")
-                    if response:
-                        f.write(f"assistant|{response}\n")
+                    # 保存到历史（请求失败时不记录）
+                    writer.submit(append_history, f"分析文件: {file_path}", response, model)
                 continue
                 
             # 显示上一条回复
@@ -395,32 +780,52 @@ def interactive_mode(client):
                 
             # 普通用户输入
             user_message = {"role": "user", "content": user_input}
-            messages.append(user_message)
+            context.append(user_message)
+            context.set_system(load_knowledge(user_input))
             
             # 获取AI响应
-            response = get_chat_response(client, messages)
+            model = context.fit()
+            response = await ask(model)
             if response:
-                messages.append({"role": "assistant", "content": response})
+                context.append({"role": "assistant", "content": response})
                 last_response = response
-            
-            # 保存到历史
-            with open(TMP_FILE, 'a', encoding='utf-8') as f:
-                f.write(f"user|{user_input}\n")
-                if response:
-                    f.write(f"assistant|{response}\n")
+                # 保存到历史（请求失败时不记录）
+                writer.submit(append_history, user_input, response, model)
                     
         except KeyboardInterrupt:
             print("\n输入 '!exit' 退出")
         except Exception as e:
             print(f"\n处理错误: {e}")
+    
+    remove_interrupt(loop)
+    writer.close()
 
 def main():
     """主函数 - 添加参数处理"""
-    global MODEL_INDEX  # 声明使用全局变量
+    global MODEL_INDEX, TYPEWRITER, RESPONSE_CACHE  # 声明使用全局变量
     
     parser = argparse.ArgumentParser(description='AI命令行助手', 
                                     formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-i', '--interactive', action='store_true', help='进入交互模式')
+    parser.add_argument('--typewriter', action='store_true', help='打字机效果输出（不影响接收速度）')
+    parser.add_argument('--daemon', choices=['start', 'stop', 'status'],
+                        help='管理常驻守护进程（复用连接，减少握手延迟）')
+    parser.add_argument('--no-daemon', action='store_true', help='不使用守护进程，直接连接API')
+    parser.add_argument('--profile-startup', action='store_true', help='结束时打印导入和初始化耗时')
+    parser.add_argument('--cache', action='store_true', help='启用响应缓存（相同请求直接回放）')
+    parser.add_argument('--no-cache', action='store_true', help='禁用响应缓存')
+    parser.add_argument('--cache-stats', action='store_true', help='显示响应缓存和文件提取缓存统计')
+    parser.add_argument('--stats', nargs='?', type=int, const=200, metavar='N',
+                        help='显示最近 N 次请求（默认 200）按模型统计的首字耗时、总耗时和吞吐')
+    parser.add_argument('--search', metavar='QUERY', help='检索历史日志')
+    parser.add_argument('--limit', type=int, default=10, help='检索结果数量')
+    parser.add_argument('--models', help='同时请求多个模型（逗号分隔），并排比较回答')
+    parser.add_argument('--race', action='store_true', help='与 --models 一起使用：只输出最先响应的模型')
+    parser.add_argument('--batch', metavar='FILE', help='批量执行 JSONL 文件中的提示（每行 id、prompt）')
+    parser.add_argument('--out', metavar='FILE', help='批量结果输出文件（默认 <输入名>.results.jsonl，已完成的 id 自动跳过）')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY, help='批量模式并发请求数')
+    parser.add_argument('--rpm', type=int, default=BATCH_RPM, help='批量模式每分钟请求数上限')
+    parser.add_argument('--tpm', type=int, default=BATCH_TPM, help='批量模式每分钟 tokens 上限')
     parser.add_argument('input', nargs='*', help='输入内容或文件路径')
     
     help_text = """
@@ -431,6 +836,26 @@ def main():
   
   交互模式:
     python3 ai.py -i
+  
+  守护进程（复用连接）:
+    python3 ai.py --daemon start
+    python3 ai.py --daemon stop
+  
+  启动耗时分析:
+    python3 ai.py --profile-startup stoptmp
+  
+  检索历史日志:
+    python3 ai.py --search "关键词"
+  
+  请求耗时统计（p50/p95/p99）:
+    python3 ai.py --stats 100
+  
+  批量执行:
+    python3 ai.py --batch prompts.jsonl --out results.jsonl --concurrency 8 --rpm 120
+  
+  多模型比较/竞速:
+    python3 ai.py --models kimi-latest,moonshot-v1-128k "你的问题"
+    python3 ai.py --models kimi-latest,moonshot-v1-128k --race "你的问题"
     
   交互模式命令:
     !help    - 显示帮助信息
@@ -441,12 +866,49 @@ def main():
     parser.epilog = help_text
     
     args = parser.parse_args()
+    if args.typewriter:
+        TYPEWRITER = True
+    if args.cache:
+        RESPONSE_CACHE = True
+    if args.no_cache:
+        RESPONSE_CACHE = False
     
-    client = init_openai_client()
-    
-    if args.interactive:
-        interactive_mode(client)
-    else:
+    marks = [('参数解析', time.perf_counter())]
+    client = None
+    try:
+        if args.daemon:
+            daemon_command(args.daemon)
+            return
+        
+        if args.cache_stats:
+            with open_cache() as cache:
+                print_stats(cache.stats(), "响应缓存统计")
+            with open_extract_cache() as cache:
+                print_stats(cache.stats(), "文件提取缓存统计")
+            active, segments, archived = disk_usage(LOG_FILE)
+            print(f"\n日志占用: 活动文件 {active / 1024 / 1024:.2f}MB，"
+                  f"归档 {segments} 段 {archived / 1024 / 1024:.2f}MB")
+            return
+        
+        if args.stats:
+            print_metrics(load_metrics(METRICS_FILE, args.stats))
+            return
+        
+        if args.search:
+            search_log(args.search, args.limit)
+            return
+        
+        # 客户端在首次调用API时才创建，本地命令不导入SDK
+        client = daemon.LazyClient(lambda: connect_client(not args.no_daemon))
+        
+        if args.batch:
+            run_batch_file(client, args)
+            return
+        
+        if args.interactive:
+            interactive_mode(client)
+            return
+        
         if not args.input:
             print("请提供输入内容或文件路径")
             parser.print_help()
@@ -455,22 +917,60 @@ def main():
         # 处理输入
         user_input = " ".join(args.input)
         
-        # 如果是文件
+        # 本地命令无需访问API
+        if handle_tmp_command(user_input):
+            return
+        
+        # 如果是文件（多个文件并发处理，内容按参数顺序拼接）
         if os.path.isfile(user_input):
-            file_content = process_file(user_input, client)
-            user_message = {"role": "user", "content": f"请分析以下内容: {file_content}"}
+            files, question = [user_input], ""
+        else:
+            files = [arg for arg in args.input if os.path.isfile(arg)]
+            question = " ".join(arg for arg in args.input if not os.path.isfile(arg))
+        
+        if files:
+            # 大文本文件和大 PDF 内部已分段并发，不受单个文件超时限制
+            large = [path for path in files if is_large_text(path) or is_large_pdf(path)]
+            small = [path for path in files if path not in large]
+            contents = dict(zip(small, ingest_files(lambda path: process_file(path, client, question), small,
+                                                    INGEST_WORKERS, INGEST_TIMEOUT,
+                                                    progress=len(small) > 1)))
+            for path in large:
+                contents[path] = process_file(path, client, question)
+            texts, images = [], []
+            for path in files:
+                text, parts = split_content(contents[path])
+                texts.append(text)
+                images.extend(parts)
+            file_content = "\n\n".join(texts)
+            content = f"请分析以下内容: {file_content}"
+            if question:
+                content += f"\n\n{question}"
+            user_message = {"role": "user", "content": user_content(content, images)}
         else:
             user_message = {"role": "user", "content": user_input}
+        marks.append(('输入处理', time.perf_counter()))
+        
+        # 多模型并发请求
+        if args.models:
+            models = [model.strip() for model in args.models.split(',') if model.strip()]
+            answers = ask_models(client, [user_message], models, args.race)
+            marks.append(('请求与输出', time.perf_counter()))
+            for model, answer in answers:
+                write_log(content_text(user_message['content']), answer, model)
+            return
         
         # 获取响应
         response = get_chat_response(client, [user_message])
+        marks.append(('请求与输出', time.perf_counter()))
         
         # 保存到日志
         if response:
-            with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                f.write(f"[{timestamp}] USER: {user_message['content']}\n")
-                f.write(f"[{timestamp}] AI: {response}\n\n")
+            write_log(content_text(user_message['content']), response,
+                      vision_model(MODELS[MODEL_INDEX], [user_message]))
+    finally:
+        if args.profile_startup:
+            print_startup_profile(client, marks)
 
 if __name__ == "__main__":
     # 确保全局变量在函数中可修改
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import threading
+
+try:
+    from .context import message_tokens
+    from .ingest import map_ordered
+    from .metrics import RequestMetrics, percentile
+    from .retry import RetryPolicy, RequestFailed, stream_with_retry
+except ImportError:
+    from context import message_tokens
+    from ingest import map_ordered
+    from metrics import RequestMetrics, percentile
+    from retry import RetryPolicy, RequestFailed, stream_with_retry
+
+class TokenBucket:
+    """令牌桶：每分钟补充 per_minute 个令牌，最多积累 capacity 个（线程安全）
+
+    默认只积累一秒的量，任意一分钟内的用量不会明显超过上限。
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """取出 amount 个令牌，不足时等待；返回等待的秒数
+
+        超过 capacity 的请求等到桶满后全额扣除（余额为负），之后的请求等待补足差额。
+        """
+        needed = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def consume(self, amount):
+        """按实际用量扣除令牌（可为负数，之后的请求会相应等待）"""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+class RateLimiter:
+    """按每分钟请求数和 token 数限速，0 或 None 表示不限制"""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+        self.waited = 0.0  # 累计限速等待秒数
+
+    def acquire(self, estimated_tokens):
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += self.tokens.acquire(estimated_tokens)
+        with self.lock:
+            self.waited += waited
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """请求完成后按实际用量修正 token 桶"""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+
+def load_items(path):
+    """读取 JSONL 输入，每行 {"id", "prompt" 或 "messages", 可选 "model"}；无 id 时用行号"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'messages' not in record:
+                record['messages'] = [{'role': 'user', 'content': str(record.get('prompt', ''))}]
+            record['id'] = str(record.get('id', number))
+            items.append(record)
+    return items
+
+def load_results(path):
+    """读取输出文件，按 ID 返回每条的最新记录（已成功的记录不会被之后的失败覆盖）"""
+    results = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 上次中断时写了一半的行
+                if 'id' not in record:
+                    continue
+                key = str(record['id'])
+                if record.get('error') is None or results.get(key, record).get('error') is not None:
+                    results[key] = record
+    except FileNotFoundError:
+        pass
+    return results
+
+def rewrite_results(path, records):
+    """用 records 重写输出文件（先写临时文件再替换，中断时原文件不受影响）"""
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(temp, path)
+
+def run_batch(client, items, out_path, model, temperature, workers=4, limiter=None,
+              progress=True, policy=None):
+    """并发执行批量请求，每完成一条即追加写入 out_path，返回统计信息
+
+    断点续跑时跳过已成功的 ID；上次失败的记录先从输出文件中移除再重新执行，
+    每个 ID 在输出文件中只保留一条记录。请求按 policy 重试（与交互模式相同）。
+    """
+    results = load_results(out_path)
+    done = {key for key, record in results.items() if record.get('error') is None}
+    pending = [item for item in items if item['id'] not in done]
+    retried = {item['id'] for item in pending}
+    if results:
+        rewrite_results(out_path, [record for key, record in results.items() if key not in retried])
+    limiter = limiter or RateLimiter()
+    policy = policy or RetryPolicy()
+
+    def handle(item):
+        messages = item['messages']
+        estimated = sum(message_tokens(m) for m in messages)
+        limiter.acquire(estimated)
+        metrics = RequestMetrics('batch', item.get('model') or model)
+
+        def on_retry(error, wait, resumed):
+            # 重试同样计入速率限制
+            limiter.acquire(estimated)
+
+        try:
+            answer = stream_with_retry(client, messages, lambda text: None, policy, None, on_retry, metrics,
+                                       model=item.get('model') or model,
+                                       temperature=item.get('temperature', temperature))
+        except RequestFailed as e:
+            raise RuntimeError(f"{e} (尝试 {e.attempts} 次)") from e
+        usage = None
+        if metrics.prompt_tokens is not None or metrics.completion_tokens is not None:
+            usage = {'prompt_tokens': metrics.prompt_tokens or 0,
+                     'completion_tokens': metrics.completion_tokens or 0}
+        limiter.settle(estimated, usage and usage['prompt_tokens'] + usage['completion_tokens'])
+        return {'answer': answer, 'usage': usage, 'elapsed': time.perf_counter() - metrics.start,
+                'attempts': metrics.attempts}
+
+    stats = {'total': len(items), 'skipped': len(items) - len(pending), 'ok': 0, 'failed': 0,
+             'prompt_tokens': 0, 'completion_tokens': 0, 'latencies': []}
+    start = time.perf_counter()
+    with open(out_path, 'a', encoding='utf-8') as out:
+        def on_done(index, result):
+            ok, value = result
+            item = pending[index]
+            record = {'id': item['id'], 'model': item.get('model') or model}
+            if ok:
+                record.update(value)
+                stats['ok'] += 1
+                stats['latencies'].append(value['elapsed'])
+                if value['usage']:
+                    stats['prompt_tokens'] += value['usage']['prompt_tokens']
+                    stats['completion_tokens'] += value['usage']['completion_tokens']
+            else:
+                record['error'] = str(value)
+                stats['failed'] += 1
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            if progress:
+                finished = stats['ok'] + stats['failed']
+                print(f"[{finished}/{len(pending)}] {item['id']} "
+                      f"{'完成' if ok else f'失败: {value}'}")
+
+        map_ordered(handle, pending, workers, on_done=on_done)
+    stats['seconds'] = time.perf_counter() - start
+    stats['rate_wait'] = limiter.waited
+    return stats
+
+def print_batch_stats(stats):
+    """打印批量执行的吞吐统计"""
+    seconds = stats['seconds'] or 1e-9
+    finished = stats['ok'] + stats['failed']
+    tokens = stats['prompt_tokens'] + stats['completion_tokens']
+    print("\n批量执行统计:")
+    print(f"  总数: {stats['total']}，完成: {stats['ok']}，失败: {stats['failed']}，"
+          f"已跳过: {stats['skipped']}")
+    print(f"  耗时: {stats['seconds']:.2f}秒，吞吐: {finished / seconds:.2f} 请求/秒，"
+          f"{tokens / seconds:.0f} tokens/秒")
+    print(f"  tokens: 输入 {stats['prompt_tokens']}，输出 {stats['completion_tokens']}")
+    print(f"  单条耗时: p50 {percentile(stats['latencies'], 50):.2f}秒，"
+          f"p95 {percentile(stats['latencies'], 95):.2f}秒；限速等待累计 {stats['rate_wait']:.1f}秒")
@@ -0,0 +1,1087 @@
+#!/usr/bin/env python3
+"""性能基准测试
+
+用法:
+  python3 bench.py render [--record chunks.json] [--typewriter] [--legacy]
+  python3 bench.py accumulate [--size-kb 512]
+  python3 bench.py context [--turns 500]
+  python3 bench.py history [--size-mb 100]
+  python3 bench.py ingest [--files 4] [--workers 4]
+  python3 bench.py knowledge [--sections 300]
+  python3 bench.py e2e [--scenarios stream,retry,drop,pdf] [--targets ai,core] [--repeat 5]
+  python3 bench.py logwrite [--procs 32] [--records 50] [--fsync batch] [--legacy]
+  python3 bench.py ooxml [--paragraphs 20000] [--rows 20000]
+  python3 bench.py pdf [file.pdf ...] [--workers 4] [--part-pages 20] [--delay-per-mb 1.0]
+  python3 bench.py images [image.png ...] [--max-side 1280] [--max-kb 1024]
+  python3 bench.py ctxcache [--bkg-tokens 6000] [--turns 8] [--prompt-rate 5000] [--cache-build 1.0]
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import pty
+import shutil
+import random
+import select
+import base64
+import argparse
+import zipfile
+import tempfile
+import subprocess
+import multiprocessing
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from stream import StreamRenderer, StreamBuffer
+import context as context_module
+from context import ContextWindow, message_tokens
+from history import HistoryStore, migrate_tmp_file
+from ingest import map_ordered
+from knowledge import KnowledgeIndex
+from fanout import pad
+from logfile import append_record, Rotation, iter_log, disk_usage
+from ooxml import extract_text
+
+
+class TimingSink:
+    """记录最后一个字节写出时间的输出端"""
+
+    def __init__(self, echo=None):
+        self.echo = echo
+        self.bytes = 0
+        self.last_write = None
+
+    def write(self, data):
+        if self.echo is not None:
+            self.echo.write(data)
+        self.bytes += len(data)
+        self.last_write = time.perf_counter()
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+
+def load_chunks(record_file=None, chars=4000, gap_ms=2.0, seed=0):
+    """读取录制的增量序列 [[间隔秒, 文本], ...]，未提供时生成模拟序列"""
+    if record_file:
+        with open(record_file, 'r', encoding='utf-8') as f:
+            return [(float(delay), text) for delay, text in json.load(f)]
+
+    rng = random.Random(seed)
+    alphabet = '人工智能助手为科研人员提供帮助请用简洁明了的语言回答问题。，abcdefg \n'
+    chunks = []
+    total = 0
+    while total < chars:
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 8)))
+        chunks.append((rng.uniform(0, 2 * gap_ms) / 1000, text))
+        total += len(text)
+    return chunks
+
+
+def replay(chunks, write):
+    """按录制节奏回放增量，返回(首个增量时间, 网络流读取结束时间)"""
+    first_token = None
+    for delay, text in chunks:
+        time.sleep(delay)
+        if first_token is None:
+            first_token = time.perf_counter()
+        write(text)
+    return first_token, time.perf_counter()
+
+
+def bench_render(args):
+    chunks = load_chunks(args.record, args.chars, args.gap_ms)
+    total_chars = sum(len(text) for _, text in chunks)
+    print(f"增量数: {len(chunks)}，字符数: {total_chars}")
+
+    echo = sys.stdout.buffer if args.tty else None
+    modes = [('frame', False)]
+    if args.typewriter:
+        modes.append(('typewriter', True))
+
+    results = []
+    for name, typewriter in modes:
+        sink = TimingSink(echo)
+        renderer = StreamRenderer(out=sink, frame_ms=args.frame_ms, frame_bytes=args.frame_bytes,
+                                  typewriter=typewriter, cps=args.cps)
+        first_token, stream_end = replay(chunks, renderer.write)
+        renderer.close()
+        results.append((name, first_token, stream_end, sink.last_write))
+
+    if args.legacy:
+        # 旧实现：每5个字符 sleep 0.05 秒，阻塞网络流读取
+        sink = TimingSink(echo)
+
+        def legacy_write(text, chunk_size=5, delay=0.05):
+            for i in range(0, len(text), chunk_size):
+                sink.write(text[i:i + chunk_size].encode('utf-8'))
+                time.sleep(delay)
+
+        first_token, stream_end = replay(chunks, legacy_write)
+        results.append(('legacy', first_token, stream_end, sink.last_write))
+
+    print(f"\n{'模式':<12}{'读取完成(s)':>14}{'最后字节(s)':>14}")
+    for name, first_token, stream_end, last_write in results:
+        print(f"{name:<12}{stream_end - first_token:>14.3f}{last_write - first_token:>14.3f}")
+
+
+def bench_accumulate(args):
+    chunk = '人工智能助手 answer '
+    n = args.size_kb * 1024 // len(chunk.encode('utf-8'))
+    window = max(1, n // args.windows)
+
+    def run(append):
+        # 按窗口统计每个增量的平均耗时(微秒)
+        costs = []
+        start = time.perf_counter()
+        for i in range(1, n + 1):
+            append(chunk)
+            if i % window == 0:
+                now = time.perf_counter()
+                costs.append((now - start) / window * 1e6)
+                start = now
+        return costs
+
+    buf = StreamBuffer()
+    buffer_costs = run(buf.append)
+    text = buf.getvalue()
+
+    # 对照组：持有额外引用，使 += 无法原地扩展（与渲染、日志等同时引用结果时一致）
+    holder = {'s': ''}
+
+    def concat(content):
+        alias = holder['s']
+        holder['s'] = alias + content
+
+    concat_costs = run(concat)
+
+    print(f"增量数: {n}，最终大小: {len(text.encode('utf-8')) // 1024}KB，"
+          f"估算 tokens: {buf.tokens}")
+    print(f"\n{'已累计(KB)':<12}{'StreamBuffer(us)':>18}{'拼接(us)':>12}")
+    for i, (b, c) in enumerate(zip(buffer_costs, concat_costs), 1):
+        print(f"{args.size_kb * i // len(buffer_costs):<12}{b:>18.3f}{c:>12.3f}")
+
+
+def bench_context(args):
+    system = [{'role': 'system', 'content': '你是一个专业的人工智能助手。' * 50}]
+    rng = random.Random(0)
+
+    def turn_messages(i):
+        question = f'第{i}个问题：' + '请解释这一段内容。' * rng.randint(5, 40)
+        answer = f'第{i}个回答：' + '这是一个比较长的回答。' * rng.randint(20, 200)
+        return {'role': 'user', 'content': question}, {'role': 'assistant', 'content': answer}
+
+    turns = [turn_messages(i) for i in range(args.turns)]
+    window = max(1, args.turns // args.windows)
+
+    # 增量维护：每轮只计算新消息（统计 message_tokens 的调用次数）
+    estimated = []
+
+    def counting_tokens(message):
+        estimated.append(message)
+        return message_tokens(message)
+
+    context_module.message_tokens = counting_tokens
+    try:
+        context = ContextWindow(system, model=args.model, max_turns=args.max_turns)
+        costs = []
+        start = time.perf_counter()
+        for i, (question, answer) in enumerate(turns, 1):
+            context.append(question)
+            model = context.fit()
+            context.messages()  # 发送的消息列表只包含裁剪后的窗口
+            context.append(answer)
+            if i % window == 0:
+                now = time.perf_counter()
+                costs.append((now - start) / window * 1e6)
+                start = now
+    finally:
+        context_module.message_tokens = message_tokens
+
+    # 对照组：每轮重新统计全部历史
+    history = []
+    naive_costs = []
+    start = time.perf_counter()
+    for i, (question, answer) in enumerate(turns, 1):
+        history.append(question)
+        sum(message_tokens(m) for m in system + history)
+        history.append(answer)
+        if i % window == 0:
+            now = time.perf_counter()
+            naive_costs.append((now - start) / window * 1e6)
+            start = now
+
+    print(f"轮数: {args.turns}，最终上下文: {context.tokens} tokens，"
+          f"保留 {len(context.history)} 条，丢弃 {context.dropped} 条，模型: {model}")
+    print(f"\n{'轮次':<8}{'增量维护(us/轮)':>18}{'全量统计(us/轮)':>18}")
+    for i, (c, n) in enumerate(zip(costs, naive_costs), 1):
+        print(f"{window * i:<8}{c:>18.1f}{n:>18.1f}")
+
+    # 检查：每条消息只估算一次，每轮开销不随历史增长（容许计时波动）
+    failures = []
+    if len(estimated) != len(system) + 2 * len(turns):
+        failures.append(f"message_tokens 调用 {len(estimated)} 次，"
+                        f"应为 {len(system) + 2 * len(turns)} 次（每条消息一次）")
+    if len(costs) >= 2 and costs[-1] > 3 * costs[0] + 50:
+        failures.append(f"每轮开销从 {costs[0]:.1f}us 增长到 {costs[-1]:.1f}us")
+    if failures:
+        sys.exit("失败: " + "；".join(failures))
+    print("\n检查通过: 每条消息只估算一次，每轮开销与历史长度无关")
+
+
+def bench_history(args):
+    tmp_split, tmp_end = '\n_|_SPLIT_|_\n', '\n_|_END_|_\n'
+    question = '请解释这一段内容。' * 20
+    answer = '这是一个比较长的回答。' * 300
+    record = tmp_split.join(['2024-01-01 00:00:00', '/home/user', 'user', 'ai.py', 'kimi-latest',
+                             question, answer]) + tmp_end + '\n'
+    turns = args.size_mb * 1024 * 1024 // len(record.encode('utf-8'))
+
+    with tempfile.TemporaryDirectory() as folder:
+        legacy_path = os.path.join(folder, 'legacy.txt')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            for _ in range(turns):
+                f.write(record)
+        size_mb = os.path.getsize(legacy_path) / 1024 / 1024
+        print(f"历史记录: {turns} 轮，{size_mb:.1f}MB")
+
+        # 旧实现：读入整个文件并逐条切分
+        start = time.perf_counter()
+        with open(legacy_path, 'r', encoding='utf-8', errors='ignore') as f:
+            all_tmp = f.read()
+        messages = []
+        for line in all_tmp.rstrip().split(tmp_end):
+            parts = line.strip().split(tmp_split)
+            if len(parts) >= 2:
+                messages.append({'role': 'user', 'content': parts[-2]})
+                messages.append({'role': 'assistant', 'content': parts[-1]})
+        legacy_seconds = time.perf_counter() - start
+
+        store_path = os.path.join(folder, 'history.db')
+        start = time.perf_counter()
+        with HistoryStore(store_path) as store:
+            migrate_tmp_file(store, legacy_path, tmp_split, tmp_end)
+        migrate_seconds = time.perf_counter() - start
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            with HistoryStore(store_path) as store:
+                recent = store.last_messages(args.last)
+            timings.append(time.perf_counter() - start)
+
+    print(f"\n读取最近 {args.last} 轮:")
+    print(f"  旧格式全量解析   {legacy_seconds * 1000:10.1f} ms")
+    print(f"  历史库(含打开)   {min(timings) * 1000:10.3f} ms（{args.repeat} 次取最小）")
+    print(f"  一次性迁移       {migrate_seconds * 1000:10.1f} ms，读取到 {len(recent)} 条消息")
+
+
+def bench_ingest(args):
+    from pathlib import Path
+    from openai import OpenAI
+    import mock_server
+
+    options = mock_server.MockOptions(file_delay=args.file_delay,
+                                      file_delay_per_mb=args.delay_per_mb)
+    server = mock_server.start_in_thread(options)
+    client = OpenAI(api_key='test', base_url=server.base_url)
+
+    def extract(path):
+        # 与 f01_load.extract_pdf 相同的上传、读取、删除流程
+        file_object = client.files.create(file=Path(path), purpose='file-extract')
+        content = client.files.content(file_id=file_object.id).text
+        client.files.delete(file_id=file_object.id)
+        return content
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(folder, f'doc{i}.pdf')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(int((i + 1) * args.step_mb * 1024 * 1024)))
+            paths.append(path)
+
+        # 单独处理每个文件，得到各自的耗时
+        singles = []
+        for path in paths:
+            start = time.perf_counter()
+            extract(path)
+            singles.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        map_ordered(extract, paths, workers=1)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = map_ordered(extract, paths, workers=args.workers)
+        concurrent = time.perf_counter() - start
+    server.shutdown()
+
+    ordered = all(ok and f'doc{i}.pdf' in value for i, (ok, value) in enumerate(results))
+    print(f"{args.files} 个文件，单个耗时: {', '.join(f'{t:.2f}s' for t in singles)}")
+    print(f"  最慢单个文件     {max(singles):8.2f} s")
+    print(f"  单个耗时之和     {sum(singles):8.2f} s")
+    print(f"  顺序处理         {sequential:8.2f} s")
+    print(f"  并发处理({args.workers}线程) {concurrent:8.2f} s，结果顺序{'正确' if ordered else '错误'}")
+
+
+def bench_knowledge(args):
+    topics = ['数据库连接池配置', 'Python 异步编程', 'Kubernetes 部署流程', '日志轮转策略', '缓存失效设计']
+    sections = [f'{topics[i % len(topics)]} 第{i}篇：' + f'这里介绍{topics[i % len(topics)]}的细节。' * 60
+                for i in range(args.sections)]
+    marker = '\n#---FILE_SPLIT---\n'
+    query = '如何配置 Kubernetes 部署？'
+
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, 'bkg.txt')
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write(marker.join(sections))
+        with KnowledgeIndex(os.path.join(folder, 'bkg.db'), source, marker.strip()) as index:
+            start = time.perf_counter()
+            index.sync()
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index.sync()
+            unchanged = time.perf_counter() - start
+
+            # 修改一个部分后增量更新
+            sections[0] = '修改后的内容'
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write(marker.join(sections))
+            start = time.perf_counter()
+            added, removed = index.sync()
+            incremental = time.perf_counter() - start
+
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                selected = index.select(query, args.top_k, args.budget)
+                timings.append(time.perf_counter() - start)
+            total = index.total_tokens()
+
+    selected_tokens = sum(message_tokens({'content': s}) for s in selected)
+    print(f"背景知识: {args.sections} 部分，约 {total} tokens")
+    print(f"  首次建立索引     {build * 1000:10.1f} ms")
+    print(f"  未变化时检查     {unchanged * 1000:10.3f} ms")
+    print(f"  修改一部分后更新 {incremental * 1000:10.1f} ms（新增 {added}，删除 {removed}）")
+    print(f"  检索相关部分     {min(timings) * 1000:10.3f} ms（{args.repeat} 次取最小）")
+    print(f"  每次请求的背景知识: 全部发送约 {total} tokens，检索后 {len(selected)} 部分约 {selected_tokens} tokens")
+
+
+# 端到端场景：(说明, 模拟服务参数, 是否附带 PDF)
+E2E_SCENARIOS = {
+    'stream': ('正常流式回答', {}, False),
+    'retry': ('每隔一次请求返回 429（Retry-After 0.2s）', {'fail_every': 2, 'retry_after': 0.2}, False),
+    'drop': ('每隔一次流式请求中途断开', {'drop_every': 2}, False),
+    'pdf': ('上传 PDF 提取后提问', {}, True),
+}
+
+# 在子进程中以包方式运行 core.single_run
+CORE_RUNNER = """
+import os, sys, importlib
+tree = sys.argv[1]
+sys.path[:0] = [tree, os.path.dirname(tree)]
+import config
+package = os.path.basename(tree)
+for module in (config, importlib.import_module(package + '.config')):
+    module.API_URL = os.environ['MOONSHOT_BASE_URL']
+    module.USE_DAEMON = False
+importlib.import_module(package + '.core').single_run(sys.argv[2:])
+"""
+
+
+def copy_tree(folder):
+    """把源码复制到临时目录，运行时产生的日志、缓存和统计不写入当前目录"""
+    tree = os.path.join(folder, os.path.basename(SCRIPT_DIR))
+    os.makedirs(tree)
+    for name in os.listdir(SCRIPT_DIR):
+        if name.endswith('.py') or name == 'bkg.txt':
+            shutil.copy(os.path.join(SCRIPT_DIR, name), tree)
+    with open(os.path.join(tree, 'key.txt'), 'w') as f:
+        f.write('test\n')
+    return tree
+
+
+def run_measured(command, env, cwd, marker):
+    """在伪终端中运行命令，返回(总耗时, 回答首字上屏耗时, CPU 时间, 峰值 RSS KB, 退出码)"""
+    master, slave = pty.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=slave, stderr=slave,
+                               env=env, cwd=cwd, close_fds=True)
+    os.close(slave)
+    output, first = b'', None
+    while True:
+        ready, _, _ = select.select([master], [], [], 0.5)
+        if not ready:
+            if process.poll() is not None:
+                break
+            continue
+        try:
+            data = os.read(master, 65536)
+        except OSError:  # 子进程已关闭终端
+            break
+        if not data:
+            break
+        if first is None:
+            output += data
+            if marker in output:
+                first = time.perf_counter() - start
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    os.close(master)
+    return wall, first, usage.ru_utime + usage.ru_stime, usage.ru_maxrss, process.returncode
+
+
+def bench_e2e(args):
+    import mock_server
+
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    marker = mock_server.DEFAULT_ANSWER[:2].encode('utf-8')
+    print(f"模拟服务: 首字延迟 {args.ttft}s，{args.rate:.0f} 字符/秒，每个增量 {args.chunk_chars} 字符；"
+          f"每项运行 {args.repeat} 次（另预热 1 次），取中位数")
+    header = [('场景', 10, False), ('程序', 8, False), ('总耗时', 8, True), ('首字上屏', 10, True),
+              ('CPU', 8, True), ('峰值RSS', 10, True)]
+    print('\n' + ''.join(pad(text, width, right) for text, width, right in header) + '  失败')
+
+    with tempfile.TemporaryDirectory() as folder:
+        tree = copy_tree(folder)
+        for scenario in scenarios:
+            description, injected, with_pdf = E2E_SCENARIOS[scenario]
+            options = mock_server.MockOptions(args.ttft, args.rate, args.chunk_chars,
+                                              file_delay=args.file_delay, **injected)
+            server = mock_server.start_in_thread(options)
+            env = dict(os.environ, MOONSHOT_BASE_URL=server.base_url, MOONSHOT_API_KEY='test',
+                       HOME=folder, TMPDIR=folder, PYTHONDONTWRITEBYTECODE='')
+            for target in targets:
+                results = []
+                for i in range(args.repeat + 1):
+                    question = [args.question]
+                    if with_pdf:
+                        # 每次使用不同内容，避免命中提取缓存
+                        pdf = os.path.join(folder, f'doc{i}.pdf')
+                        with open(pdf, 'wb') as f:
+                            f.write(os.urandom(args.pdf_kb * 1024))
+                        question = [pdf] + question
+                    if target == 'ai':
+                        command = [sys.executable, os.path.join(tree, 'ai.py'), '--no-daemon'] + question
+                    else:
+                        command = [sys.executable, '-c', CORE_RUNNER, tree] + question
+                    result = run_measured(command, env, folder, marker)
+                    if i > 0:
+                        results.append(result)
+
+                median = lambda values: sorted(values)[len(values) // 2] if values else None
+                wall = median([r[0] for r in results])
+                first = median([r[1] for r in results if r[1] is not None])
+                cpu = median([r[2] for r in results])
+                rss = max(r[3] for r in results)
+                failed = sum(1 for r in results if r[4] != 0 or r[1] is None)
+                first_text = f'{first:9.3f}s' if first is not None else f"{'-':>10}"
+                print(f"{scenario:<10}{target:<8}{wall:7.3f}s{first_text}{cpu:7.3f}s"
+                      f"{rss / 1024:8.1f}MB  {failed}")
+            server.shutdown()
+            server.server_close()
+
+    print("\n场景说明:")
+    for scenario in scenarios:
+        print(f"  {scenario:<8}{E2E_SCENARIOS[scenario][0]}")
+
+
+def legacy_append(path, content):
+    """原来的追加方式：不加锁，偏移量在写入前取得，每次写入后 chmod"""
+    data = content.encode('utf-8')
+    with open(path, 'ab') as f:
+        offset = f.tell()
+        f.write(data)
+    os.chmod(path, 0o600)
+    return offset, len(data)
+
+
+def log_record(writer, seq, size):
+    char = chr(ord('a') + writer % 26)
+    return f'#REC {writer}:{seq} {size}\n{char * size}\n#END {writer}:{seq}\n'
+
+
+def log_writer(path, writer, args, barrier, results):
+    rng = random.Random(writer)
+    positions = []
+    barrier.wait()
+    start = time.perf_counter()
+    for seq in range(args.records):
+        content = log_record(writer, seq, rng.randint(args.min_kb * 1024, args.max_kb * 1024))
+        if args.legacy:
+            positions.append(legacy_append(path, content))
+        else:
+            rotation = Rotation(int(args.rotate_mb * 1024 * 1024)) if args.rotate_mb else None
+            positions.append(append_record(path, content, 0o600, args.fsync, rotation=rotation))
+    results.put((writer, time.perf_counter() - start, positions))
+
+
+def check_log(path, positions, size_range):
+    """逐条解析日志（包括轮转后的分段），返回(完整记录数, 损坏记录数, 偏移量错误数)"""
+    blocks = list(iter_log(path))
+    data = b''.join(block for _, block in blocks)
+    good = torn = 0
+    pos = 0
+    while pos < len(data):
+        end = data.find(b'\n', pos)
+        header = data[pos:end].decode('utf-8', errors='replace').split()
+        try:
+            writer, seq = map(int, header[1].split(':'))
+            size = int(header[2])
+            expected = log_record(writer, seq, size).encode('utf-8')
+        except (IndexError, ValueError):
+            expected = None
+        if header[:1] == ['#REC'] and expected and data[pos:pos + len(expected)] == expected:
+            good += 1
+            pos += len(expected)
+            continue
+        # 损坏：跳到下一个记录头
+        torn += 1
+        following = data.find(b'#REC ', pos + 1)
+        pos = following if following >= 0 else len(data)
+
+    wrong = 0
+    for writer, items in positions.items():
+        rng = random.Random(writer)
+        for seq, (offset, length) in enumerate(items):
+            expected = log_record(writer, seq, rng.randint(*size_range)).encode('utf-8')
+            if length != len(expected) or data[offset:offset + length] != expected:
+                wrong += 1
+    return good, torn, wrong
+
+
+def bench_logwrite(args):
+    context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'chat_log.txt')
+        barrier = context.Barrier(args.procs)
+        results = context.Queue()
+        processes = [context.Process(target=log_writer, args=(path, i, args, barrier, results))
+                     for i in range(args.procs)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        positions = {}
+        durations = []
+        for _ in processes:
+            writer, seconds, items = results.get()
+            positions[writer] = items
+            durations.append(seconds)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        active, segments, archived = disk_usage(path)
+        size = sum(len(block) for _, block in iter_log(path))
+        good, torn, wrong = check_log(path, positions, (args.min_kb * 1024, args.max_kb * 1024))
+
+    total = args.procs * args.records
+    mode = '旧方式（不加锁）' if args.legacy else f'加锁追加（fsync={args.fsync}）'
+    print(f"{mode}: {args.procs} 个进程各写 {args.records} 条，每条 {args.min_kb}-{args.max_kb}KB，"
+          f"共 {size / 1024 / 1024:.1f}MB")
+    print(f"  总耗时           {elapsed:8.2f} s（{total / elapsed:.0f} 条/秒）")
+    print(f"  单进程耗时中位数 {sorted(durations)[len(durations) // 2]:8.2f} s")
+    print(f"  完整记录         {good:8d} / {total}")
+    print(f"  损坏记录         {torn:8d}")
+    print(f"  偏移量错误       {wrong:8d}（全文索引按偏移量读取原始记录）")
+    if segments:
+        print(f"  轮转             {segments} 个 gzip 分段 {archived / 1024 / 1024:.1f}MB，"
+              f"活动文件 {active / 1024 / 1024:.1f}MB")
+    # 旧方式只用于对比，加锁追加出现损坏或偏移量错误时以非零状态退出
+    if not args.legacy and (torn or wrong or good != total):
+        sys.exit(f"失败: 完整记录 {good}/{total}，损坏 {torn}，偏移量错误 {wrong}")
+
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+S_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+P_NS = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _rels(items):
+    body = ''.join(f'<Relationship Id="{rid}" Type="x" Target="{target}"/>' for rid, target in items)
+    return f'<?xml version="1.0"?><Relationships xmlns="{REL_NS}">{body}</Relationships>'
+
+
+def make_docx(path, paragraphs, table_rows=20):
+    """生成只含正文段落和一个表格的 docx"""
+    body = ''.join(f'<w:p><w:r><w:t>第{i}段：这是用于测试本地提取的正文内容。</w:t></w:r></w:p>'
+                   for i in range(paragraphs))
+    rows = ''.join(f'<w:tr><w:tc><w:p><w:r><w:t>行{i}</w:t></w:r></w:p></w:tc>'
+                   f'<w:tc><w:p><w:r><w:t>{i * 3}</w:t></w:r></w:p></w:tc></w:tr>'
+                   for i in range(table_rows))
+    document = (f'<?xml version="1.0"?><w:document xmlns:w="{W_NS}"><w:body>{body}'
+                f'<w:tbl>{rows}</w:tbl></w:body></w:document>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('word/document.xml', document)
+
+
+def make_xlsx(path, rows, columns=6):
+    """生成一个工作表的 xlsx（共享字符串和数字混合）"""
+    strings = [f'项目{i}' for i in range(100)]
+    shared = ''.join(f'<si><t>{text}</t></si>' for text in strings)
+    data = ''.join(
+        f'<row r="{r + 1}">' + ''.join(
+            f'<c r="{chr(65 + c)}{r + 1}" t="s"><v>{(r + c) % 100}</v></c>' if c % 2 == 0 else
+            f'<c r="{chr(65 + c)}{r + 1}"><v>{r * c}</v></c>' for c in range(columns)) + '</row>'
+        for r in range(rows))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('xl/workbook.xml',
+                         f'<?xml version="1.0"?><workbook xmlns="{S_NS}" xmlns:r="{R_NS}"><sheets>'
+                         f'<sheet name="数据" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels', _rels([('rId1', 'worksheets/sheet1.xml')]))
+        archive.writestr('xl/sharedStrings.xml', f'<?xml version="1.0"?><sst xmlns="{S_NS}">{shared}</sst>')
+        archive.writestr('xl/worksheets/sheet1.xml',
+                         f'<?xml version="1.0"?><worksheet xmlns="{S_NS}"><sheetData>{data}</sheetData></worksheet>')
+
+
+def make_pptx(path, slides):
+    """生成每张幻灯片含标题和两段文字的 pptx"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        ids = ''.join(f'<p:sldId id="{256 + i}" r:id="rId{i + 1}"/>' for i in range(slides))
+        archive.writestr('ppt/presentation.xml',
+                         f'<?xml version="1.0"?><p:presentation xmlns:p="{P_NS}" xmlns:r="{R_NS}">'
+                         f'<p:sldIdLst>{ids}</p:sldIdLst></p:presentation>')
+        archive.writestr('ppt/_rels/presentation.xml.rels',
+                         _rels([(f'rId{i + 1}', f'slides/slide{i + 1}.xml') for i in range(slides)]))
+        for i in range(slides):
+            texts = ''.join(f'<a:p><a:r><a:t>{text}</a:t></a:r></a:p>'
+                            for text in (f'第{i + 1}页标题', '要点一：本地提取', '要点二：无需上传'))
+            archive.writestr(f'ppt/slides/slide{i + 1}.xml',
+                             f'<?xml version="1.0"?><p:sld xmlns:p="{P_NS}" xmlns:a="{A_NS}">'
+                             f'<p:cSld><p:spTree><p:sp><p:txBody>{texts}</p:txBody></p:sp>'
+                             f'</p:spTree></p:cSld></p:sld>')
+
+
+def bench_ooxml(args):
+    import tracemalloc
+
+    with tempfile.TemporaryDirectory() as folder:
+        files = [('docx', make_docx, args.paragraphs), ('xlsx', make_xlsx, args.rows),
+                 ('pptx', make_pptx, args.slides)]
+        header = [('类型', 6, False), ('文件大小', 11, True), ('提取耗时', 12, True),
+                  ('峰值内存', 12, True), ('文字', 12, True)]
+        print(''.join(pad(text, width, right) for text, width, right in header) + '  旧方式（按 UTF-8 读取）')
+        for ext, make, count in files:
+            path = os.path.join(folder, f'sample.{ext}')
+            make(path, count)
+            start = time.perf_counter()
+            text = extract_text(path)
+            elapsed = time.perf_counter() - start
+            # 内存单独测一遍，tracemalloc 会明显拖慢解析
+            tracemalloc.start()
+            extract_text(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                garbled = f.read()
+            print(f"{ext:<6}{os.path.getsize(path) / 1024:9.0f}KB{elapsed * 1000:10.1f}ms"
+                  f"{peak / 1024 / 1024:10.1f}MB{len(text):12d}  {len(garbled)} 个乱码字符")
+            if args.show:
+                print(text[:300])
+
+
+def make_pdf(path, pages, scanned=(), image_kb=150):
+    """生成测试用 PDF：普通页为压缩过的中英文文字，scanned 中的页（从 1 开始）只有一张整页图片"""
+    cjk = '本地读取文字层无需上传扫描页才远程提取'
+    cmap = ''.join(f'<{i + 1:04X}> <{ord(c):04X}>\n' for i, c in enumerate(cjk))
+    to_unicode = (f'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+                  f'1 begincodespacerange <0000> <FFFF> endcodespacerange\n'
+                  f'{len(cjk)} beginbfchar\n{cmap}endbfchar\nendcmap end end').encode()
+    cjk_codes = ''.join(f'{i + 1:04X}' for i in range(len(cjk)))
+    objects = [
+        b'<</Type/Catalog/Pages 2 0 R>>',
+        None,  # 页面树，最后填入
+        b'<</Type/Font/Subtype/Type1/BaseFont/Helvetica/Encoding/WinAnsiEncoding>>',
+        b'<</Type/Font/Subtype/Type0/BaseFont/STSong/Encoding/Identity-H'
+        b'/DescendantFonts[5 0 R]/ToUnicode 6 0 R>>',
+        b'<</Type/Font/Subtype/CIDFontType2/BaseFont/STSong/DW 1000'
+        b'/CIDSystemInfo<</Registry(Adobe)/Ordering(Identity)/Supplement 0>>>>',
+        b'<</Length %d>>stream\n' % len(to_unicode) + to_unicode + b'\nendstream',
+    ]
+    kids = []
+    for number in range(1, pages + 1):
+        if number in scanned:
+            image = os.urandom(image_kb * 1024)
+            objects.append(b'<</Type/XObject/Subtype/Image/Width 1700/Height 2200/ColorSpace/DeviceGray'
+                           b'/BitsPerComponent 8/Filter/DCTDecode/Length %d>>stream\n' % len(image)
+                           + image + b'\nendstream')
+            resources = b'<</XObject<</Im0 %d 0 R>>>>' % len(objects)
+            content = b'q 612 0 0 792 0 0 cm /Im0 Do Q'
+        else:
+            resources = b'<</Font<</F1 3 0 R/F2 4 0 R>>>>'
+            lines = [f'BT /F1 16 Tf 72 740 Td (Page {number}: local text layer extraction) Tj ET']
+            for row in range(40):
+                y = 700 - row * 16
+                if row % 5 == 4:
+                    lines.append(f'BT /F2 11 Tf 72 {y} Td <{cjk_codes}> Tj ET')
+                else:
+                    lines.append(f'BT /F1 11 Tf 72 {y} Td [(Line {row}: the quick brown fox jumps) -250 '
+                                 f'(over the lazy dog, page {number}.)] TJ ET')
+            content = '\n'.join(lines).encode()
+        data = zlib.compress(content)
+        objects.append(b'<</Length %d/Filter/FlateDecode>>stream\n' % len(data) + data + b'\nendstream')
+        objects.append(b'<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Resources %s/Contents %d 0 R>>'
+                       % (resources, len(objects)))
+        kids.append(len(objects))
+    objects[1] = b'<</Type/Pages/Kids[%s]/Count %d>>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids))
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.7\n')
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+        start = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        f.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+        f.write(b'trailer\n<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, start))
+
+
+# 样例文档：(名称, 页数, 扫描页, 每张扫描图片 KB)
+PDF_CORPUS = [('文字', 30, (), 0), ('混合', 30, (5, 6, 7, 20), 150),
+              ('扫描', 10, tuple(range(1, 11)), 150), ('大型扫描', 120, tuple(range(1, 121)), 50)]
+
+
+def bench_pdf(args):
+    from pathlib import Path
+    from openai import OpenAI
+    import mock_server
+    from pdftext import iter_text
+
+    options = mock_server.MockOptions(file_delay=args.file_delay, file_delay_per_mb=args.delay_per_mb)
+    server = mock_server.start_in_thread(options)
+    client = OpenAI(api_key='test', base_url=server.base_url)
+    uploads = []
+
+    def remote(path):
+        # 与 f01_load.extract_pdf 相同的上传、读取、删除流程
+        uploads.append(os.path.getsize(path))
+        file_object = client.files.create(file=Path(path), purpose='file-extract')
+        content = client.files.content(file_id=file_object.id).text
+        client.files.delete(file_id=file_object.id)
+        return content
+
+    def extract(path, workers):
+        uploads.clear()
+        stats = {}
+        start = time.perf_counter()
+        first = None
+        for _ in iter_text(path, remote, stats, workers=workers, part_size=int(args.part_mb * 1024 * 1024),
+                           part_pages=args.part_pages):
+            if first is None:
+                first = time.perf_counter() - start
+        return time.perf_counter() - start, first, stats, sum(uploads)
+
+    print(f"远程提取: 每个文件 {args.file_delay}s + 每 MB {args.delay_per_mb}s；"
+          f"分段: 每部分至多 {args.part_pages} 页、{args.part_mb}MB")
+    header = [('文档', 14, False), ('页数', 6, True), ('扫描页', 8, True), ('全部上传', 10, True),
+              ('顺序分段', 10, True), (f'并发{args.workers}', 10, True), ('部分', 6, True),
+              ('上传量', 16, True), ('首段', 10, True)]
+    print(''.join(pad(text, width, right) for text, width, right in header))
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = []
+        for name, pages, scanned, image_kb in PDF_CORPUS:
+            path = os.path.join(folder, f'{name}.pdf')
+            make_pdf(path, pages, scanned, image_kb)
+            corpus.append((name, path))
+        corpus += [(os.path.basename(path), path) for path in args.files]
+
+        for name, path in corpus:
+            start = time.perf_counter()
+            remote(path)
+            whole = time.perf_counter() - start
+            sequential = extract(path, 1)[0]
+            elapsed, first, stats, sent = extract(path, args.workers)
+            size = f"{os.path.getsize(path) / 1024:.0f}→{sent / 1024:.0f}KB"
+            print(pad(name[:14], 14) + f"{stats['pages'] if stats['pages'] is not None else '-':>6}"
+                  f"{stats['remote_pages'] if stats['remote_pages'] is not None else '全部':>8}"
+                  f"{whole * 1000:8.0f}ms{sequential * 1000:8.0f}ms{elapsed * 1000:8.0f}ms"
+                  f"{stats['parts']:>6}{size:>16}{first * 1000:8.0f}ms")
+    server.shutdown()
+
+
+def make_png(path, width, height, noise=False):
+    """生成测试用 PNG：noise 为随机像素（几乎不可压缩，类似照片），否则为色块和细线（类似截图）"""
+    rows = []
+    for y in range(height):
+        if noise:
+            row = os.urandom(width * 3)
+        elif y % 24 in (10, 11):
+            row = bytes((x * 7) % 256 for x in range(width * 3))
+        else:
+            row = bytes(((40 + y // 120 * 20) % 256, 90, 160)) * width
+        rows.append(b'\x00' + row)
+
+    def chunk(kind, data):
+        return (len(data).to_bytes(4, 'big') + kind + data
+                + zlib.crc32(kind + data).to_bytes(4, 'big'))
+
+    header = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + bytes((8, 2, 0, 0, 0))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+                + chunk(b'IDAT', zlib.compress(b''.join(rows), 6)) + chunk(b'IEND', b''))
+
+
+# 样例图片：(名称, 宽, 高, 随机像素)
+IMAGE_CORPUS = [('图标', 256, 256, True), ('小照片', 500, 400, True),
+                ('截图', 2560, 1440, False), ('大照片', 3000, 2000, True)]
+
+
+def bench_images(args):
+    import tracemalloc
+    from cache import DiskCache, cached_extract
+    from images import encode_image, image_info
+
+    def legacy(path, mime):
+        # 常见写法：整体读入、编码后再拼接，同时保留原图、base64 字节和两份字符串
+        with open(path, 'rb') as f:
+            data = f.read()
+        encoded = base64.b64encode(data).decode('ascii')
+        return f'data:{mime};base64,{encoded}'
+
+    def measure(func, *func_args):
+        start = time.perf_counter()
+        result = func(*func_args)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func(*func_args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    def encode(path):
+        return encode_image(path, args.max_side, args.max_kb * 1024, args.quality)
+
+    try:
+        import PIL
+        print(f"Pillow {PIL.__version__}：超出预算的图片在本地缩小后发送")
+    except ImportError:
+        print("未安装 Pillow：只能原样发送不超出预算的图片")
+    print(f"预算: 长边 {args.max_side}px，{args.max_kb}KB（内存为 Python 分配的峰值，不含 Pillow 内部缓冲）")
+    header = [('图片', 10, False), ('尺寸', 11, True), ('文件', 9, True), ('发送', 9, True),
+              ('旧方式', 9, True), ('旧内存', 9, True), ('编码', 9, True), ('内存', 9, True),
+              ('缓存命中', 10, True)]
+    print(''.join(pad(text, width, right) for text, width, right in header))
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = []
+        for name, width, height, noise in IMAGE_CORPUS:
+            path = os.path.join(folder, f'{name}.png')
+            make_png(path, width, height, noise)
+            corpus.append((name, path))
+        corpus += [(os.path.basename(path), path) for path in args.files]
+
+        with DiskCache(os.path.join(folder, 'cache.db'), 200 * 1024 * 1024) as cache:
+            for name, path in corpus:
+                mime, size = image_info(path)
+                _, legacy_time, legacy_peak = measure(legacy, path, mime)
+                row = (pad(name[:10], 10) + f"{'x'.join(map(str, size)) if size else '-':>11}"
+                       f"{os.path.getsize(path) / 1024:7.0f}KB")
+                try:
+                    url, elapsed, peak = measure(encode, path)
+                except ValueError as e:
+                    print(row + f"  {e}")
+                    continue
+                cached_extract(cache, 'image', path, encode)
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    cached_extract(cache, 'image', path, encode)
+                hit = (time.perf_counter() - start) / args.repeat
+                print(row + f"{len(url) / 1024:7.0f}KB{legacy_time * 1000:7.1f}ms"
+                      f"{legacy_peak / 1024 / 1024:7.1f}MB{elapsed * 1000:7.1f}ms"
+                      f"{peak / 1024 / 1024:7.1f}MB{hit * 1000:8.1f}ms")
+
+
+def bench_ctxcache(args):
+    from openai import OpenAI
+    import mock_server
+    from cache import DiskCache
+    from promptcache import apply_cache
+
+    options = mock_server.MockOptions(ttft=args.ttft, rate=20000, prompt_rate=args.prompt_rate)
+    server = mock_server.start_in_thread(options)
+    client = OpenAI(api_key='test', base_url=server.base_url)
+    model = 'moonshot-v1-32k'
+    section = '背景知识：人工智能助手为科研人员提供帮助，回答时引用相关资料。\n'
+    bkg = [{'role': 'system', 'content': section * (args.bkg_tokens // len(section) // 2)}
+           for _ in range(2)]
+
+    def run(registry):
+        """逐轮提问，返回每轮的 (首字耗时, 输入 tokens, 缓存命中 tokens) 和创建的缓存数"""
+        created = server.stats['caches']
+        history, rows = [], []
+        for turn in range(args.turns):
+            history.append({'role': 'user', 'content': f'第 {turn + 1} 个问题：' + '请详细说明。' * 20})
+            messages = bkg + history
+            start = time.perf_counter()
+            request = messages
+            if registry is not None:
+                # 创建缓存的耗时计入本轮
+                request, _ = apply_cache(client, registry, model, messages, min_tokens=args.min_tokens)
+            stream = client.chat.completions.create(model=model, messages=request, stream=True,
+                                                    stream_options={'include_usage': True})
+            first, answer, usage = None, [], None
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first is None:
+                        first = time.perf_counter() - start
+                    answer.append(chunk.choices[0].delta.content)
+                if chunk.usage:
+                    usage = chunk.usage
+            history.append({'role': 'assistant', 'content': ''.join(answer)})
+            rows.append((first, usage.prompt_tokens if usage else None,
+                         getattr(usage, 'cached_tokens', None) or 0))
+        return rows, server.stats['caches'] - created
+
+    print(f"背景知识约 {args.bkg_tokens} tokens，输入处理 {args.prompt_rate:.0f} tokens/秒，"
+          f"首个 token 延迟 {args.ttft}s")
+    with tempfile.TemporaryDirectory() as folder:
+        plain, _ = run(None)
+        with DiskCache(os.path.join(folder, 'context_cache.db')) as registry:
+            cached, created = run(registry)
+        # 服务端创建缓存需要时间、先返回 pending 的情况（如 Moonshot）
+        options.cache_build = args.cache_build
+        with DiskCache(os.path.join(folder, 'pending_cache.db')) as registry:
+            pending, pending_created = run(registry)
+    server.shutdown()
+
+    header = [('轮次', 6, False), ('输入', 8, True), ('不缓存', 10, True), ('缓存', 10, True),
+              ('命中', 8, True), ('pending', 10, True), ('命中', 8, True)]
+    print(''.join(pad(text, width, right) for text, width, right in header))
+    for turn, ((ttft, prompt, _), (cached_ttft, _, hit), (pending_ttft, _, pending_hit)) in enumerate(
+            zip(plain, cached, pending), 1):
+        print(pad(str(turn), 6) + f"{prompt:>8}{ttft * 1000:8.0f}ms{cached_ttft * 1000:8.0f}ms{hit:>8}"
+              f"{pending_ttft * 1000:8.0f}ms{pending_hit:>8}")
+    total = sum(r[1] for r in cached)
+    hits = sum(r[2] for r in cached)
+    pending_hits = sum(r[2] for r in pending)
+    print(f"合计首字耗时: 不缓存 {sum(r[0] for r in plain):.2f}s，缓存 {sum(r[0] for r in cached):.2f}s，"
+          f"pending {args.cache_build}s 时 {sum(r[0] for r in pending):.2f}s")
+    print(f"缓存提供输入 {hits}/{total} tokens（{hits / max(1, total) * 100:.0f}%），创建 {created} 个；"
+          f"pending 时 {pending_hits} tokens，创建 {pending_created} 个")
+    if pending_created > created:
+        sys.exit(f"失败: 缓存处于 pending 时重复创建了 {pending_created - created} 个缓存")
+    if hits and not pending_hits:
+        sys.exit("失败: pending 的缓存 ready 后没有被使用")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI命令行助手性能基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('render', help='回放增量序列，测量首个增量到最后字节的耗时')
+    p.add_argument('--record', help='录制的增量序列 JSON 文件')
+    p.add_argument('--chars', type=int, default=4000, help='模拟回答字符数')
+    p.add_argument('--gap-ms', type=float, default=2.0, help='模拟增量平均间隔(毫秒)')
+    p.add_argument('--frame-ms', type=int, default=30)
+    p.add_argument('--frame-bytes', type=int, default=512)
+    p.add_argument('--cps', type=int, default=200, help='打字机效果每秒字符数')
+    p.add_argument('--typewriter', action='store_true', help='同时测量打字机模式')
+    p.add_argument('--legacy', action='store_true', help='同时测量旧的 print_cn 实现（较慢）')
+    p.add_argument('--tty', action='store_true', help='同时输出到终端')
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser('accumulate', help='测量累加每个增量的开销随回答长度的变化')
+    p.add_argument('--size-kb', type=int, default=512, help='最终回答大小(KB)')
+    p.add_argument('--windows', type=int, default=8, help='统计窗口数')
+    p.set_defaults(func=bench_accumulate)
+
+    p = sub.add_parser('context', help='测量上下文管理每轮开销随历史长度的变化')
+    p.add_argument('--turns', type=int, default=500, help='模拟对话轮数')
+    p.add_argument('--windows', type=int, default=10, help='统计窗口数')
+    p.add_argument('--model', default='moonshot-v1-32k')
+    p.add_argument('--max-turns', type=int, default=None, help='最多保留的轮数')
+    p.set_defaults(func=bench_context)
+
+    p = sub.add_parser('history', help='比较旧 TMP 文本格式与历史库读取最近 N 轮的耗时')
+    p.add_argument('--size-mb', type=int, default=100, help='历史记录大小(MB)')
+    p.add_argument('--last', type=int, default=10, help='读取最近多少轮')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_history)
+
+    p = sub.add_parser('ingest', help='用模拟文件接口比较多文件顺序与并发处理的耗时')
+    p.add_argument('--files', type=int, default=4, help='文件数')
+    p.add_argument('--workers', type=int, default=4, help='并发数')
+    p.add_argument('--step-mb', type=float, default=0.5, help='第 i 个文件大小为 i * step(MB)')
+    p.add_argument('--file-delay', type=float, default=0.2, help='每个文件的提取耗时(秒)')
+    p.add_argument('--delay-per-mb', type=float, default=0.5, help='每 MB 额外的提取耗时(秒)')
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser('pdf', help='比较 PDF 全部上传提取、本地读取文字层和分段并发提取的耗时')
+    p.add_argument('files', nargs='*', help='额外加入比较的 PDF 文件')
+    p.add_argument('--file-delay', type=float, default=0.5, help='每个文件的远程提取耗时(秒)')
+    p.add_argument('--delay-per-mb', type=float, default=1.0, help='每 MB 额外的远程提取耗时(秒)')
+    p.add_argument('--workers', type=int, default=4, help='同一文件同时提取的部分数')
+    p.add_argument('--part-pages', type=int, default=20, help='每部分最多页数')
+    p.add_argument('--part-mb', type=float, default=5, help='每部分最大字节数(MB)')
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser('knowledge', help='测量背景知识索引的建立、增量更新和检索耗时')
+    p.add_argument('--sections', type=int, default=300, help='背景知识部分数')
+    p.add_argument('--top-k', type=int, default=5)
+    p.add_argument('--budget', type=int, default=4000, help='背景知识 token 预算')
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_knowledge)
+
+    p = sub.add_parser('e2e', help='用模拟服务端到端运行 ai.py 和 core.single_run，测量耗时、CPU 和内存')
+    p.add_argument('--targets', default='ai,core', help='ai（ai.py）和/或 core（包方式 single_run）')
+    p.add_argument('--scenarios', default=','.join(E2E_SCENARIOS),
+                   help='逗号分隔: ' + ', '.join(E2E_SCENARIOS))
+    p.add_argument('--repeat', type=int, default=5, help='每项运行次数')
+    p.add_argument('--question', default='请介绍一下你自己')
+    p.add_argument('--ttft', type=float, default=0.2, help='模拟首个 token 延迟(秒)')
+    p.add_argument('--rate', type=float, default=400.0, help='模拟每秒输出字符数')
+    p.add_argument('--chunk-chars', type=int, default=4, help='模拟每个增量的字符数')
+    p.add_argument('--file-delay', type=float, default=0.3, help='模拟每个文件的提取耗时(秒)')
+    p.add_argument('--pdf-kb', type=int, default=200, help='pdf 场景的文件大小(KB)')
+    p.set_defaults(func=bench_e2e)
+
+    p = sub.add_parser('logwrite', help='多进程同时追加日志，检查记录是否完整、偏移量是否正确')
+    p.add_argument('--procs', type=int, default=32, help='同时写入的进程数')
+    p.add_argument('--records', type=int, default=50, help='每个进程写入的记录数')
+    p.add_argument('--min-kb', type=int, default=1, help='每条记录最小大小(KB)')
+    p.add_argument('--max-kb', type=int, default=64, help='每条记录最大大小(KB)')
+    p.add_argument('--fsync', choices=['always', 'batch', 'never'], default='batch')
+    p.add_argument('--legacy', action='store_true', help='使用原来不加锁的追加方式对比')
+    p.add_argument('--rotate-mb', type=float, default=0, help='写入期间按此大小轮转(MB)，0 表示不轮转')
+    p.set_defaults(func=bench_logwrite)
+
+    p = sub.add_parser('ooxml', help='测量 docx/xlsx/pptx 本地提取的耗时和内存')
+    p.add_argument('--paragraphs', type=int, default=20000, help='docx 段落数')
+    p.add_argument('--rows', type=int, default=20000, help='xlsx 行数')
+    p.add_argument('--slides', type=int, default=200, help='pptx 幻灯片数')
+    p.add_argument('--show', action='store_true', help='显示提取结果开头')
+    p.set_defaults(func=bench_ooxml)
+
+    p = sub.add_parser('images', help='测量图片缩小、base64 编码的耗时和内存，以及按内容哈希缓存命中的耗时')
+    p.add_argument('files', nargs='*', help='额外加入比较的图片文件')
+    p.add_argument('--max-side', type=int, default=1280, help='长边上限(像素)')
+    p.add_argument('--max-kb', type=int, default=1024, help='编码前的大小上限(KB)')
+    p.add_argument('--quality', type=int, default=85, help='JPEG 质量')
+    p.add_argument('--repeat', type=int, default=20, help='缓存命中测量次数')
+    p.set_defaults(func=bench_images)
+
+    p = sub.add_parser('ctxcache', help='用模拟服务比较多轮对话中不缓存与使用上下文缓存的首字耗时')
+    p.add_argument('--bkg-tokens', type=int, default=6000, help='背景知识 tokens（模拟服务按字符计）')
+    p.add_argument('--turns', type=int, default=8, help='对话轮数')
+    p.add_argument('--prompt-rate', type=float, default=5000, help='模拟服务每秒处理的输入 tokens')
+    p.add_argument('--ttft', type=float, default=0.05, help='模拟服务的首个 token 延迟(秒)')
+    p.add_argument('--min-tokens', type=int, default=1024, help='创建缓存的最小新增 tokens')
+    p.add_argument('--cache-build', type=float, default=1.0,
+                   help='第三组测试中模拟服务的缓存处于 pending 状态的秒数')
+    p.set_defaults(func=bench_ctxcache)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    cost REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+'''
+
+class DiskCache:
+    """磁盘缓存（SQLite）：按 TTL 过期，总大小超出上限时淘汰最久未使用的条目
+
+    同时记录命中/未命中等计数，可用于统计节省的时间和流量。
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # 秒，None 表示不过期
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(entries)')]
+        if 'cost' not in columns:
+            self.conn.execute('ALTER TABLE entries ADD COLUMN cost REAL NOT NULL DEFAULT 0')
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回 None"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """读取缓存，返回 (值, 生成耗时秒数)，未命中或已过期时返回 None"""
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT value, created, cost FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is not None and self.ttl is not None and row[1] < now - self.ttl:
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            row = None
+        if row is None:
+            self.incr('misses')
+            return None
+        self.conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        self.incr('hits')
+        return row[0], row[2]
+
+    def set(self, key, value, cost=0.0):
+        """写入缓存并按需淘汰，cost 为生成该值的耗时(秒)"""
+        now = time.time()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, created, accessed, cost) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, value, len(value), now, now, cost)
+            )
+            self._evict(now)
+
+    def delete(self, key):
+        """删除一个条目"""
+        self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def get_text(self, key):
+        value = self.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set_text(self, key, text):
+        self.set(key, text.encode('utf-8'))
+
+    def _evict(self, now):
+        if self.ttl is not None:
+            self.conn.execute('DELETE FROM entries WHERE created < ?', (now - self.ttl,))
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        self.incr('evictions', evicted)
+
+    def incr(self, name, amount=1):
+        """累加计数器"""
+        self.conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+
+    def stats(self):
+        """返回条目数、总大小和各计数器"""
+        entries, size = self.conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        result = {'entries': entries, 'bytes': size}
+        result.update(self.conn.execute('SELECT name, value FROM counters').fetchall())
+        return result
+
+def file_digest(path, block_size=1024 * 1024):
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cached_extract(cache, namespace, file_path, extract, uploaded=False):
+    """按文件内容哈希缓存提取结果；extract 失败时抛出异常，不写入缓存
+
+    命中时累计节省的提取耗时；uploaded 表示 extract 会把文件上传到服务端，
+    此时还累计节省的上传字节数（本地解析的文件不计）。
+    """
+    key = f'{namespace}:{file_digest(file_path)}'
+    entry = cache.get_entry(key)
+    if entry is not None:
+        value, cost = entry
+        if uploaded:
+            cache.incr('bytes_saved', os.path.getsize(file_path))
+        cache.incr('seconds_saved', cost)
+        return value.decode('utf-8')
+
+    start = time.perf_counter()
+    text = extract(file_path)
+    cache.set(key, text.encode('utf-8'), time.perf_counter() - start)
+    return text
+
+def response_key(model, temperature, messages):
+    """按模型、温度和规范化后的消息列表计算缓存键"""
+    normalized = [
+        {'role': m['role'],
+         'content': m['content'].strip() if isinstance(m['content'], str) else m['content']}
+        for m in messages
+    ]
+    payload = json.dumps({'model': model, 'temperature': temperature, 'messages': normalized},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def print_stats(stats, title="缓存统计"):
+    """打印缓存统计信息"""
+    hits, misses = int(stats.get('hits', 0)), int(stats.get('misses', 0))
+    total = hits + misses
+    print(f"\n{title}:")
+    print(f"  条目数: {stats['entries']}，占用: {stats['bytes'] / 1024 / 1024:.2f}MB")
+    print(f"  命中: {hits}，未命中: {misses}，命中率: {hits / total * 100 if total else 0:.1f}%")
+    print(f"  淘汰: {int(stats.get('evictions', 0))}")
+    if 'bytes_saved' in stats or 'seconds_saved' in stats:
+        print(f"  节省上传: {stats.get('bytes_saved', 0) / 1024 / 1024:.2f}MB，"
+              f"节省时间: {stats.get('seconds_saved', 0):.1f}秒")
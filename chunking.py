@@ -0,0 +1,159 @@
+import os
+from itertools import islice
+
+try:
+    from .stream import estimate_tokens
+    from .ingest import map_ordered
+    from .context import MESSAGE_OVERHEAD
+except ImportError:
+    from stream import estimate_tokens
+    from ingest import map_ordered
+    from context import MESSAGE_OVERHEAD
+
+LINE_LIMIT = 64 * 1024  # 单次读取的最长行（字符），超长行按此截成多段
+PYTHON_STARTS = ('def ', 'class ', 'async def ', '@')
+
+MAP_PROMPT = ("以下是文件 '{name}' 的第 {index} 段内容:\n{text}\n# 分段内容结束\n\n"
+              "请只根据这一段内容回答问题或提取与问题相关的信息，"
+              "没有相关信息时只回答“无相关内容”。\n问题: {question}")
+REDUCE_PROMPT = ("以下是对文件 '{name}' 各段分别处理的结果:\n{notes}\n# 分段结果结束\n\n"
+                 "请把这些结果合并整理为一份，保留与问题相关的全部信息，去掉重复和无关内容。\n"
+                 "问题: {question}")
+DEFAULT_QUESTION = "概括这部分内容的要点"
+
+def read_lines(path, limit=LINE_LIMIT):
+    """逐行读取文本文件（按缓冲区分块读取，不会一次读入整个文件）"""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        yield from iter(lambda: f.readline(limit), '')
+
+def _is_boundary(line, previous, python):
+    """line 前是否为结构边界：空行分隔的段落，或 Python 顶层定义"""
+    if python and line.startswith(PYTHON_STARTS) and not previous.startswith('@'):
+        return True
+    return not previous.strip() and bool(line.strip())
+
+def _split_long(line, max_tokens):
+    """把超出预算的单行按字符切开（每个字符最多计 1 个 token）"""
+    return [line[i:i + max_tokens] for i in range(0, len(line), max_tokens)]
+
+def iter_segments(path, max_tokens=32000, python=None):
+    """把文本文件切分为不超过 max_tokens 的分段，尽量在段落或定义处断开"""
+    if python is None:
+        python = path.endswith('.py')
+    return split_segments(read_lines(path), max_tokens, python)
+
+def split_segments(source, max_tokens=32000, python=False):
+    """把逐行给出的文字切分为不超过 max_tokens 的分段（行保留换行符）"""
+    lines, tokens = [], []  # 当前分段的行及各行 token 数
+    total = 0               # 当前分段的 token 数
+    boundary = 0            # 当前分段内最后一个结构边界的位置
+    previous = ''
+
+    for line in source:
+        line_tokens = estimate_tokens(line)
+        pieces = _split_long(line, max_tokens) if line_tokens > max_tokens else [line]
+        for piece in pieces:
+            piece_tokens = line_tokens if len(pieces) == 1 else estimate_tokens(piece)
+            if lines and _is_boundary(piece, previous, python):
+                boundary = len(lines)
+            if lines and total + piece_tokens > max_tokens:
+                # 在最后一个边界处断开，边界之后的行留到下一段
+                cut = boundary or len(lines)
+                yield ''.join(lines[:cut])
+                lines, tokens = lines[cut:], tokens[cut:]
+                total = sum(tokens)
+                boundary = 0
+                if lines and total + piece_tokens > max_tokens:
+                    yield ''.join(lines)
+                    lines, tokens, total = [], [], 0
+            lines.append(piece)
+            tokens.append(piece_tokens)
+            total += piece_tokens
+            previous = piece
+    if lines:
+        yield ''.join(lines)
+
+def complete(client, messages, model, temperature):
+    """非流式调用，返回回答文本"""
+    response = client.chat.completions.create(
+        model=model, messages=messages, temperature=temperature, stream=False)
+    return response.choices[0].message.content or ''
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def segment_budget(name, question, max_tokens, context=None, reserve=0):
+    """每段（及每组待合并结果）的 tokens 上限
+
+    不超过 max_tokens；已知模型上下文窗口 context 时，还要留出提示本身和
+    reserve（回答）的空间，使每次请求都能放进所选模型。
+    """
+    if not context:
+        return max_tokens
+    prompt = max(estimate_tokens(template.format(name=name, index=999999, text='', notes='',
+                                                 question=question))
+                 for template in (MAP_PROMPT, REDUCE_PROMPT)) + MESSAGE_OVERHEAD
+    budget = context - reserve - prompt
+    if budget < 256:
+        raise ValueError(f"模型上下文 {context} tokens 放不下提示和 {reserve} tokens 的回答")
+    return min(max_tokens, budget)
+
+def map_reduce(ask, path, question=None, max_tokens=32000, result_tokens=16000,
+               workers=4, progress=True, text=None, context=None, reserve=0):
+    """对大文件逐段提问并合并结果，返回 (合并后的结果, 分段数)
+
+    ask(messages) 返回回答文本。分段按 workers 个一批并发处理，同一时间只有
+    这一批分段在内存中；各段结果超出 result_tokens 时再分组合并，直到符合预算。
+    text 为已提取的文字（如 PDF）时按 text 分段，path 只用于显示文件名。
+    context 为所用模型的上下文窗口时，分段大小和合并预算按 segment_budget 缩小。
+    """
+    name = os.path.basename(path)
+    question = question or DEFAULT_QUESTION
+    max_tokens = segment_budget(name, question, max_tokens, context, reserve)
+    result_tokens = min(result_tokens, max_tokens)
+
+    def ask_segment(item):
+        index, text = item
+        return ask([{'role': 'user', 'content': MAP_PROMPT.format(
+            name=name, index=index, text=text, question=question)}])
+
+    notes = []
+    if text is None:
+        segments = enumerate(iter_segments(path, max_tokens), 1)
+    else:
+        segments = enumerate(split_segments(text.splitlines(keepends=True), max_tokens), 1)
+    for batch in _batches(segments, max(1, workers)):
+        for (index, _), (ok, value) in zip(batch, map_ordered(ask_segment, batch, workers)):
+            notes.append(f"[第{index}段] {value if ok else f'处理失败: {value}'}")
+            if progress:
+                print(f"已处理 {name} 第 {index} 段{'' if ok else f'（失败: {value}）'}")
+    count = len(notes)
+
+    # 结果过长时分组合并，每轮至少两条合为一条
+    while len(notes) > 1 and estimate_tokens('\n'.join(notes)) > result_tokens:
+        groups, group, group_tokens = [], [], 0
+        for note in notes:
+            note_tokens = estimate_tokens(note)
+            if len(group) >= 2 and group_tokens + note_tokens > max_tokens:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(note)
+            group_tokens += note_tokens
+        groups.append(group)
+        if progress:
+            print(f"合并 {name} 的 {len(notes)} 条分段结果...")
+
+        def reduce_group(group):
+            if len(group) == 1:
+                return group[0]
+            return ask([{'role': 'user', 'content': REDUCE_PROMPT.format(
+                name=name, notes='\n'.join(group), question=question)}])
+
+        notes = [value if ok else '\n'.join(group)[:max_tokens]
+                 for group, (ok, value) in zip(groups, map_ordered(reduce_group, groups, workers))]
+    return '\n'.join(notes), count
@@ -11,13 +11,84 @@ MODEL=[
 MODEL_USE=0
 
 # 交互模式配置
-MAX_HISTORY = 10          # 最大对话历史记录数
+MAX_HISTORY = 10          # 最大对话历史记录数（轮）
+CONTEXT_RESERVE = 2048    # 上下文中为回答预留的 tokens
+AUTO_SELECT_MODEL = True  # 使用 moonshot-v1-8k/32k/128k 时按上下文长度自动选择最小可用模型
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB文件大小限制
 
+# 流式输出配置
+STREAM_FRAME_MS = 30      # 每帧最长合并时间(毫秒)
+STREAM_FRAME_BYTES = 512  # 每帧最多合并字节数
+TYPEWRITER = False        # 打字机效果（不影响网络流读取速度）
+TYPEWRITER_CPS = 200      # 打字机效果每秒字符数
+
+# 请求重试（429、5xx、超时可重试，遵循 Retry-After；中途断开时从已输出的内容继续）
+RETRY_ATTEMPTS = 4        # 最多尝试次数
+RETRY_BASE = 0.5          # 退避基数(秒)，第 n 次失败后随机等待 0 ~ base * 2^n 秒
+RETRY_CAP = 8.0           # 单次等待上限(秒)
+RETRY_DEADLINE = 60.0     # 一次请求（含重试）的总时限(秒)
+
+# 日志写入（多个会话同时写入时加文件锁，每条记录完整写入）
+LOG_FSYNC = 'batch'       # always: 每条记录都 fsync；batch: 每个文件至多每秒一次（退出时补做）；never
+LOG_FSYNC_INTERVAL = 1.0  # batch 模式的 fsync 间隔(秒)
+
+# 日志轮转（超出时压缩为 gzip 分段，检索仍可读取；0 表示不限制）
+LOG_ROTATE_MB = 20        # 活动日志超过此大小时轮转(MB)
+LOG_ROTATE_DAYS = 30      # 活动日志使用超过此天数时轮转
+LOG_MAX_TOTAL_MB = 200    # 归档分段总大小上限(MB)，超出时删除最早的分段
+
+# 请求耗时统计（ai_data/metrics.jsonl，python3 ai.py --stats 或 stats 命令查看）
+METRICS = True            # 记录每次请求的首字耗时、增量间隔、吞吐和 token 用量
+METRICS_MAX_MB = 5        # 统计文件大小上限(MB)，超出时丢弃较早的记录
+
+# 响应缓存配置（相同模型、温度和消息时直接回放缓存的回答）
+RESPONSE_CACHE = False            # 默认关闭
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # 缓存有效期(秒)
+RESPONSE_CACHE_MAX_MB = 50        # 缓存总大小上限(MB)，超出时淘汰最久未用的条目
+
+# 上下文缓存（背景知识和较早的对话作为不变前缀缓存在服务端，之后的请求只引用缓存 ID）
+# 仅 moonshot-v1 模型组需要显式创建；kimi-latest 由服务端自动缓存，同样受益于前缀不变
+CONTEXT_CACHE = True
+CONTEXT_CACHE_TTL = 900           # 缓存有效期(秒)，每次使用时续期
+CONTEXT_CACHE_MIN_TOKENS = 1024   # 在之前请求中出现过的前缀，新增部分不少于此 tokens 时才创建缓存
+CONTEXT_CACHE_BKG_TOKENS = 8000   # 背景知识不超过此值时整体发送（前缀不随问题变化），超出时仍按问题检索
+
+# 文件提取缓存（按文件内容哈希，位于 ai_data/）
+EXTRACT_CACHE_MAX_MB = 200        # 提取结果缓存总大小上限(MB)
+
+# PDF 优先在本地读取文字层，只把扫描页（或无法解码的页）上传提取
+PDF_LOCAL = True
+PDF_PART_PAGES = 20       # 需要上传提取的页按此页数（且不超过 MAX_FILE_SIZE）分段并发提取，大 PDF 不受 MAX_FILE_SIZE 限制
+PDF_WORKERS = 4           # 同一 PDF 同时上传提取的部分数上限
+
+# 图片随消息发送（本地缩小并重新编码，编码结果按内容哈希缓存；缩小和转换格式需要 Pillow）
+IMAGE_MAX_SIDE = 1280     # 长边超过此像素数时缩小
+IMAGE_MAX_KB = 1024       # 编码前的图片大小上限(KB)，超出时降低 JPEG 质量或继续缩小
+IMAGE_QUALITY = 85        # 重新编码为 JPEG 的质量
+
+# 多文件并发处理（上传、提取）
+INGEST_WORKERS = 4        # 同时处理的文件数上限
+INGEST_TIMEOUT = 120      # 单个文件的处理超时(秒)
+
+# 背景知识检索（bkg.txt 较大时只发送与问题最相关的部分）
+BKG_RETRIEVAL = True           # 关闭时每次发送全部背景知识
+BKG_TOP_K = 5                  # 最多选取的部分数
+BKG_TOKENS = 4000              # 背景知识最多占用的 tokens，全部内容不超过此值时全部发送
+BKG_SECTION_TOKENS = 1000      # 过长的部分按空行再切分，每段最多 tokens
+
+# 大文本文件分段处理（逐段提问后合并，不整体读入内存）
+LARGE_TEXT_SIZE = 200 * 1024   # 超过此大小(字节)的文本文件分段处理，不受 MAX_FILE_SIZE 限制
+CHUNK_TOKENS = 32000           # 每段最多 tokens（另受所选模型的上下文窗口限制）
+CHUNK_RESULT_TOKENS = 16000    # 合并后的分段结果最多 tokens
+
+# 守护进程配置（python3 daemon.py 或 ai.py --daemon start 启动）
+USE_DAEMON = True         # 守护进程运行时通过它复用连接
+DAEMON_SOCKET = None      # 套接字路径，None 表示使用默认路径
+
 # 支持的文件类型
-SUPPORTED_IMAGE_TYPES = ['.jpg', '.jpeg', '.png', '.gif']
+SUPPORTED_IMAGE_TYPES = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
 SUPPORTED_AUDIO_TYPES = ['.mp3', '.wav', '.ogg']
-SUPPORTED_TEXT_TYPES = ['.txt', '.md', '.py', '.js', '.html', '.css', '.json']
+SUPPORTED_TEXT_TYPES = ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.log', '.csv']
 SUPPORTED_DOC_TYPES = ['.pdf', '.docx', '.xlsx', '.pptx']
 
 # 多模态提示模板
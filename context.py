@@ -0,0 +1,164 @@
+from collections import deque
+
+try:
+    from .stream import estimate_tokens
+except ImportError:
+    from stream import estimate_tokens
+
+# 各模型的上下文窗口(tokens)
+MODEL_CONTEXT = {
+    'kimi-latest': 131072,
+    'moonshot-v1-auto': 131072,
+    'moonshot-v1-8k': 8192,
+    'moonshot-v1-32k': 32768,
+    'moonshot-v1-128k': 131072,
+    'moonshot-v1-8k-vision-preview': 8192,
+    'moonshot-v1-32k-vision-preview': 32768,
+    'moonshot-v1-128k-vision-preview': 131072,
+}
+# 可按长度自动切换的模型（从小到大）
+AUTO_MODELS = ['moonshot-v1-8k', 'moonshot-v1-32k', 'moonshot-v1-128k']
+# 消息中含图片时换用的视觉模型（kimi-latest 本身支持图片）
+VISION_MODELS = {
+    'moonshot-v1-auto': 'moonshot-v1-128k-vision-preview',
+    'moonshot-v1-8k': 'moonshot-v1-8k-vision-preview',
+    'moonshot-v1-32k': 'moonshot-v1-32k-vision-preview',
+    'moonshot-v1-128k': 'moonshot-v1-128k-vision-preview',
+}
+MESSAGE_OVERHEAD = 4  # 每条消息的格式开销(tokens)
+IMAGE_TOKENS = 1024  # 每张图片的估算 tokens（图片已在本地缩小）
+
+def content_text(content):
+    """消息内容中的文字（图文列表只取文字部分），用于日志、历史和检索"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return '\n'.join(part.get('text') or '' for part in content if part.get('type') == 'text')
+    return str(content or '')
+
+def message_images(message):
+    """消息中的图片数"""
+    content = message.get('content')
+    if not isinstance(content, list):
+        return 0
+    return sum(1 for part in content if part.get('type') == 'image_url')
+
+def vision_model(model, messages):
+    """消息中含图片时返回对应的视觉模型，否则原样返回"""
+    if any(message_images(message) for message in messages):
+        return VISION_MODELS.get(model, model)
+    return model
+
+def message_tokens(message):
+    """估算单条消息的 token 数（base64 图片按固定值计，不按编码长度）"""
+    content = message.get('content') or ''
+    return (estimate_tokens(content_text(content)) + message_images(message) * IMAGE_TOKENS
+            + MESSAGE_OVERHEAD)
+
+class ContextWindow:
+    """按 token 预算管理的对话上下文
+
+    背景知识作为固定的系统消息保留；对话历史按条缓存 token 估算值，
+    追加和裁剪时增量维护总数，每轮的开销只与新消息有关，与历史长度无关。
+    超出预算或轮数上限时从最早的对话开始丢弃。
+    """
+
+    def __init__(self, system_messages=(), history=(), model='moonshot-v1-auto',
+                 max_turns=None, reserve=2048, auto_select=True):
+        self.model = model
+        self.max_turns = max_turns
+        self.reserve = reserve  # 为回答预留的 tokens
+        self.auto_select = auto_select
+        self.system_messages = []
+        self._system_tokens = 0
+        for message in system_messages:
+            self.add_system(message)
+        self.clear()
+        self.extend(history)
+
+    def add_system(self, message):
+        """添加固定的系统消息"""
+        self.system_messages.append(message)
+        self._system_tokens += message_tokens(message)
+
+    def set_system(self, messages):
+        """替换全部系统消息（如按问题检索到的背景知识）"""
+        self.system_messages = []
+        self._system_tokens = 0
+        for message in messages:
+            self.add_system(message)
+
+    def clear(self):
+        """清空对话历史（保留系统消息）"""
+        self._history = deque()  # (消息, tokens)
+        self._history_tokens = 0
+        self._turns = 0
+        self.dropped = 0  # 累计丢弃的消息数
+
+    def append(self, message):
+        """追加一条消息"""
+        tokens = message_tokens(message)
+        self._history.append((message, tokens))
+        self._history_tokens += tokens
+        if message['role'] == 'user':
+            self._turns += 1
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def _drop_oldest(self):
+        message, tokens = self._history.popleft()
+        self._history_tokens -= tokens
+        if message['role'] == 'user':
+            self._turns -= 1
+        self.dropped += 1
+
+    @property
+    def tokens(self):
+        """当前上下文的估算 token 数"""
+        return self._system_tokens + self._history_tokens
+
+    @property
+    def history(self):
+        return [message for message, _ in self._history]
+
+    def _auto(self):
+        return self.auto_select and self.model in AUTO_MODELS
+
+    def limit(self):
+        """上下文可用的 token 上限"""
+        model = AUTO_MODELS[-1] if self._auto() else self.model
+        return MODEL_CONTEXT.get(model, MODEL_CONTEXT[AUTO_MODELS[-1]]) - self.reserve
+
+    def fit(self, keep=1):
+        """裁剪最早的对话使上下文符合预算，返回本次请求应使用的模型
+
+        最后 keep 条消息是本次请求（如单次运行的多个参数和文件），始终保留，合计为一轮。
+        """
+        limit = self.limit()
+        keep = min(keep, len(self._history))
+        current = sum(1 for i in range(len(self._history) - keep, len(self._history))
+                      if self._history[i][0]['role'] == 'user')
+        extra = max(0, current - 1)  # 本次请求中多出的用户消息不计入轮数
+        while len(self._history) > keep and (
+                self.tokens > limit
+                or (self.max_turns is not None and self._turns - extra > self.max_turns)):
+            self._drop_oldest()
+        # 保证历史以用户消息开头
+        while len(self._history) > keep and self._history[0][0]['role'] != 'user':
+            self._drop_oldest()
+        return self.select_model()
+
+    def select_model(self):
+        """未使用 moonshot-v1-auto 时，选择能容纳当前上下文的最小模型"""
+        if not self._auto():
+            return self.model
+        for model in AUTO_MODELS:
+            if self.tokens + self.reserve <= MODEL_CONTEXT[model]:
+                return model
+        return AUTO_MODELS[-1]
+
+    def messages(self):
+        """返回发送给 API 的完整消息列表"""
+        return self.system_messages + self.history
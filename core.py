@@ -1,20 +1,37 @@
 import os
 import sys
 import time
+import asyncio
 from . import f00_prepare as f00
+from . import config
+from .context import ContextWindow, content_text
 from .f01_load import loadBKG, loadTMP, loadNEW
 from .f02_write import writeTMP, writeLOG, save_history
-from .f03_util import print_cn, check_command, getTMP, print_help
+from .f03_util import print_cn, check_command, getTMP, print_help, searchLOG
 from .f04_run import get_result
+from .session import (StreamControl, LineReader, BackgroundWriter, run_interruptible,
+                      install_interrupt, remove_interrupt)
+
+def new_context(bkg_messages, history_messages):
+    """按配置创建上下文窗口"""
+    return ContextWindow(
+        bkg_messages, history_messages,
+        model=config.MODEL[config.MODEL_USE],
+        max_turns=config.MAX_HISTORY,
+        reserve=config.CONTEXT_RESERVE,
+        auto_select=config.AUTO_SELECT_MODEL
+    )
 
 class InteractiveSession:
     def __init__(self):
         self.history = []
         self.last_response = None
-        self.session_messages = []
+        self.context = None
+        self.control = None  # 正在输出的回答，Ctrl-C 时中断
+        self.reader = None
+        self.writer = None
         
-        # 加载背景知识和历史记录
-        self.bkg_messages = loadBKG()
+        # 加载历史记录（背景知识按每次的问题检索）
         self.tmp_messages = loadTMP()
         
         # 初始化会话消息
@@ -23,7 +40,7 @@ class InteractiveSession:
     def reset_session(self):
         """重置当前会话历史"""
         self.history = []
-        self.session_messages = self.bkg_messages + self.tmp_messages
+        self.context = new_context([], self.tmp_messages)
         print("\n对话历史已重置\n")
     
     def add_file(self, file_path):
@@ -35,12 +52,12 @@ class InteractiveSession:
         file_messages = loadNEW([file_path])
         if file_messages:
             self.history.extend(file_messages)
-            self.session_messages.extend(file_messages)
+            self.context.extend(file_messages)
             print(f"已添加文件: {file_path}")
             return True
         return False
     
-    def process_input(self, user_input):
+    async def process_input(self, user_input):
         """处理用户输入"""
         # 处理命令
         if user_input.startswith('!'):
@@ -49,10 +66,18 @@ class InteractiveSession:
         # 处理普通输入
         user_message = {'role': 'user', 'content': user_input}
         self.history.append(user_message)
-        self.session_messages.append(user_message)
+        self.context.append(user_message)
+        self.context.set_system(loadBKG(user_input))
         
-        # 获取AI响应
-        response = get_result(self.session_messages)
+        # 获取AI响应（超出预算时裁剪最早的对话）；中断时保留已收到的部分
+        model = self.context.fit()
+        messages = self.context.messages()
+        control = self.control = StreamControl()
+        try:
+            response = await run_interruptible(
+                lambda: get_result(messages, model=model, control=control), control)
+        finally:
+            self.control = None
         if not response:
             return True
         
@@ -60,12 +85,12 @@ class InteractiveSession:
         self.last_response = response
         assistant_message = {'role': 'assistant', 'content': response}
         self.history.append(assistant_message)
-        self.session_messages.append(assistant_message)
+        self.context.append(assistant_message)
         
-        # 写入日志
+        # 写入日志（后台进行，不阻塞下一次输入）
         tmp_content = getTMP(user_message, assistant_message)
         if f00.LOG_USE:
-            writeLOG(tmp_content)
+            self.writer.submit(writeLOG, tmp_content)
         
         return True
     
@@ -108,6 +133,14 @@ class InteractiveSession:
                 print("请指定保存路径: !save <文件路径>")
             return True
         
+        if cmd.startswith('!search '):
+            query = command[8:].strip()
+            if query:
+                searchLOG(query)
+            else:
+                print("请指定关键词: !search <关键词>")
+            return True
+        
         if cmd == '!help':
             print_help()
             return True
@@ -115,27 +148,48 @@ class InteractiveSession:
         print(f"未知命令: {command}")
         return True
     
+    def interrupt(self):
+        """Ctrl-C：正在输出回答时中断回答，否则退出"""
+        if self.control is not None and not self.control.cancelled:
+            self.control.cancel()
+        else:
+            print("\n退出交互模式")
+            self.reader.interrupt()
+    
     def run(self):
         """运行交互会话"""
-        print("\n进入交互模式 (输入 !help 查看帮助)")
-        while True:
-            try:
-                user_input = input("\n> ").strip()
+        print("\n进入交互模式 (输入 !help 查看帮助，回答输出时按 Ctrl-C 中断)")
+        try:
+            asyncio.run(self.run_async())
+        except KeyboardInterrupt:
+            print("\n退出交互模式")
+    
+    async def run_async(self):
+        """会话主循环：回答输出期间仍可输入，输入按顺序处理"""
+        loop = asyncio.get_running_loop()
+        self.reader = LineReader(loop)
+        self.writer = BackgroundWriter()
+        install_interrupt(loop, self.interrupt)
+        try:
+            while True:
+                user_input = await self.reader.readline("\n> ")
+                if user_input is None:
+                    break
+                user_input = user_input.strip()
                 if not user_input:
                     continue
                 
-                if not self.process_input(user_input):
-                    break
-            
-            except KeyboardInterrupt:
-                print("\n退出交互模式")
-                break
-            except Exception as e:
-                print(f"处理错误: {e}")
+                try:
+                    if not await self.process_input(user_input):
+                        break
+                except Exception as e:
+                    print(f"处理错误: {e}")
+        finally:
+            remove_interrupt(loop)
+            self.writer.close()
 
 def single_run(args):
     """单次运行模式"""
-    bkg_messages = loadBKG()
     tmp_messages = loadTMP()
     new_messages = loadNEW(args)
     
@@ -143,11 +197,15 @@ def single_run(args):
     if not check_command(new_messages):
         return
     
-    # 组合所有消息
-    all_messages = bkg_messages + tmp_messages + new_messages
+    # 只加载与本次问题相关的背景知识
+    bkg_messages = loadBKG(' '.join(content_text(m['content']) for m in new_messages))
+    
+    # 组合所有消息（超出预算时裁剪最早的历史，本次的输入全部保留）
+    context = new_context(bkg_messages, tmp_messages + new_messages)
+    model = context.fit(keep=len(new_messages))
     
     # 获取结果
-    result = get_result(all_messages)
+    result = get_result(context.messages(), model=model)
     if not result:
         return
     
@@ -157,7 +215,7 @@ def single_run(args):
     tmp_content = getTMP(user_message, assistant_message)
     
     if f00.TMP_USE:
-        writeTMP(tmp_content)
+        writeTMP(user_message, assistant_message, model)
     
     if f00.LOG_USE:
         writeLOG(tmp_content)
\ No newline at end of file
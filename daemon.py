@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""本地守护进程：常驻后台持有带连接池的 API 客户端
+
+命令行通过 Unix 域套接字把请求转发给守护进程，省去每次调用的
+DNS + TCP + TLS 握手；守护进程未运行时自动回退到直接创建客户端。
+
+协议：每个连接发送一行 JSON 请求，守护进程逐行返回 JSON 响应。
+  {"op": "ping"}                       -> {"ok": true, "base_url": ..., "pid": ...}
+  {"op": "stop"}                       -> {"ok": true}
+  {"op": "chat", "params": {...},      -> {"delta": "..."} ... {"done": true}
+   "options": {"max_retries": 0}}         或 {"error": "...", "status": 429, "retry_after": 2}
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+from types import SimpleNamespace
+
+try:
+    from .retry import retry_after
+except ImportError:
+    from retry import retry_after
+
+DEFAULT_IDLE_TIMEOUT = 1800  # 空闲多少秒后守护进程自动退出
+
+
+def default_socket_path():
+    """默认套接字路径（按用户区分）"""
+    return os.path.join(tempfile.gettempdir(), f'ai_daemon_{os.getuid()}.sock')
+
+
+class DaemonError(Exception):
+    """守护进程转发的 API 错误"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # 上游要求的等待秒数
+
+
+def _request(socket_path, payload, timeout=None):
+    """发送一个请求，返回(套接字, 读取文件)"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+    except Exception:
+        sock.close()
+        raise
+    return sock, sock.makefile('rb')
+
+
+def ping(socket_path, timeout=0.5):
+    """检查守护进程是否在运行，返回其信息或 None"""
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        sock, reader = _request(socket_path, {'op': 'ping'}, timeout)
+        with sock, reader:
+            return json.loads(reader.readline())
+    except (OSError, ValueError):
+        return None
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, stream=False, **params):
+        chunks = self._owner._chat(params)
+        if stream:
+            return chunks
+        # 非流式调用：合并为一个完整响应
+        parts = [c.choices[0].delta.content for c in chunks if c.choices[0].delta.content]
+        message = SimpleNamespace(role='assistant', content=''.join(parts))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')])
+
+
+class DaemonClient:
+    """通过守护进程访问 API 的客户端
+
+    接口与 OpenAI 客户端的 chat.completions.create 一致；其余属性
+    （如 files）按需转给 fallback 创建的直连客户端。
+    """
+
+    def __init__(self, socket_path, fallback=None, options=None):
+        self.socket_path = socket_path
+        self._fallback = fallback
+        self._options = options or {}  # 转给守护进程端客户端的 with_options 参数
+        self._direct = None
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def with_options(self, **options):
+        """与 OpenAI 客户端的 with_options 相同，由守护进程按请求应用"""
+        return DaemonClient(self.socket_path, self._fallback, {**self._options, **options})
+
+    def __getattr__(self, name):
+        if name.startswith('_') or self._fallback is None:
+            raise AttributeError(name)
+        if self._direct is None:
+            self._direct = self._fallback()
+        return getattr(self._direct, name)
+
+    def _chat(self, params):
+        sock, reader = _request(self.socket_path,
+                                {'op': 'chat', 'params': params, 'options': self._options})
+        with sock, reader:
+            for line in reader:
+                message = json.loads(line)
+                if 'error' in message:
+                    raise DaemonError(message['error'], message.get('status'),
+                                      message.get('retry_after'))
+                if message.get('done'):
+                    return
+                delta = SimpleNamespace(content=message.get('delta'))
+                choice = SimpleNamespace(delta=delta, finish_reason=message.get('finish_reason'))
+                yield SimpleNamespace(choices=[choice], usage=message.get('usage'))
+        raise DaemonError('守护进程连接意外中断')
+
+
+class LazyClient:
+    """延迟创建的客户端：首次访问属性时才调用 factory（导入SDK、建立连接）"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()  # 多线程同时首次访问时只创建一次
+        self.init_seconds = None  # 创建客户端耗时，未创建时为 None
+
+    @property
+    def initialized(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        with self._lock:
+            if self._client is None:
+                start = time.perf_counter()
+                self._client = self._factory()
+                self.init_seconds = time.perf_counter() - start
+        return getattr(self._client, name)
+
+
+def connect(socket_path, base_url, fallback):
+    """守护进程可用时返回 DaemonClient，否则返回 fallback() 创建的直连客户端"""
+    info = ping(socket_path)
+    if info and info.get('base_url') == base_url:
+        return DaemonClient(socket_path, fallback)
+    return fallback()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _send(self, message):
+        self.wfile.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        server.touch()
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        op = request.get('op')
+
+        if op == 'ping':
+            self._send({'ok': True, 'base_url': server.base_url, 'pid': os.getpid()})
+        elif op == 'stop':
+            self._send({'ok': True})
+            threading.Thread(target=server.shutdown, daemon=True).start()
+        elif op == 'chat':
+            self._chat(request.get('params') or {}, request.get('options'))
+        else:
+            self._send({'error': f'未知请求: {op}'})
+        server.touch()
+
+    def _chat(self, params, options=None):
+        stream = None
+        client = self.server.client
+        if options and hasattr(client, 'with_options'):
+            client = client.with_options(**options)
+        try:
+            stream = client.chat.completions.create(stream=True, **params)
+            for chunk in stream:
+                message = {}
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        message['delta'] = choice.delta.content
+                    if choice.finish_reason:
+                        message['finish_reason'] = choice.finish_reason
+                usage = getattr(chunk, 'usage', None)
+                if usage is None and chunk.choices:
+                    usage = getattr(chunk.choices[0], 'usage', None)  # Moonshot 放在 choice 中
+                if usage:
+                    message['usage'] = usage.model_dump() if hasattr(usage, 'model_dump') else dict(usage)
+                if message:
+                    self._send(message)
+            self._send({'done': True})
+        except (BrokenPipeError, ConnectionResetError):
+            # 命令行已断开，停止读取上游流
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+        except Exception as e:
+            try:
+                self._send({'error': str(e), 'status': getattr(e, 'status_code', None),
+                            'retry_after': retry_after(e)})
+            except OSError:
+                pass
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, client, base_url, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.client = client
+        self.base_url = base_url
+        self.idle_timeout = idle_timeout
+        self.last_active = time.monotonic()
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def watch_idle(self):
+        """空闲超时后关闭服务"""
+        while True:
+            time.sleep(min(30, self.idle_timeout))
+            if time.monotonic() - self.last_active > self.idle_timeout:
+                self.shutdown()
+                return
+
+
+def create_pooled_client(api_key, base_url, max_connections=10):
+    """创建带保活连接池的客户端"""
+    from openai import OpenAI
+    try:
+        import httpx
+    except ImportError:
+        # 没有 httpx 时使用 SDK 默认的连接池
+        return OpenAI(api_key=api_key, base_url=base_url)
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections,
+                            keepalive_expiry=300),
+        timeout=httpx.Timeout(600, connect=10)
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+def serve(socket_path, api_key, base_url, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """前台运行守护进程"""
+    if os.path.exists(socket_path):
+        if ping(socket_path):
+            print(f"守护进程已在运行: {socket_path}")
+            return
+        os.remove(socket_path)
+
+    client = create_pooled_client(api_key, base_url)
+    server = DaemonServer(socket_path, client, base_url, idle_timeout)
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def start(socket_path, api_key, base_url, idle_timeout=DEFAULT_IDLE_TIMEOUT, wait=5.0):
+    """在后台启动守护进程，成功返回 True"""
+    if ping(socket_path):
+        return True
+    import subprocess
+    env = dict(os.environ, MOONSHOT_API_KEY=api_key)
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--socket', socket_path,
+         '--base-url', base_url, '--idle', str(idle_timeout)],
+        env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if ping(socket_path):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stop(socket_path):
+    """停止守护进程，成功返回 True"""
+    if not ping(socket_path):
+        return False
+    try:
+        sock, reader = _request(socket_path, {'op': 'stop'}, timeout=2)
+        with sock, reader:
+            reader.readline()
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI命令行助手守护进程')
+    parser.add_argument('--socket', default=default_socket_path(), help='Unix 域套接字路径')
+    parser.add_argument('--base-url', required=True, help='API 地址')
+    parser.add_argument('--idle', type=int, default=DEFAULT_IDLE_TIMEOUT, help='空闲超时(秒)')
+    args = parser.parse_args()
+
+    api_key = os.getenv('MOONSHOT_API_KEY')
+    if not api_key:
+        print("错误: 未设置环境变量 MOONSHOT_API_KEY")
+        sys.exit(1)
+    serve(args.socket, api_key, args.base_url, args.idle)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,15 @@
 import os, sys, time
+import threading
 from datetime import datetime
-from openai import OpenAI
 import config
+from . import daemon
 
 # 初始化全局变量
 def init_globals():
     global KEY_FILE, BKG_USE, BKG_FILE, BKG_SPLIT
-    global TMP_USE, TMP_SPLIT, TMP_END, TMP_FILE
-    global LOG_USE, LOG_FILE, client, current_user
+    global TMP_USE, TMP_SPLIT, TMP_END, TMP_FILE, LEGACY_TMP_FILE
+    global LOG_USE, LOG_FILE, LOG_INDEX_FILE, CACHE_FILE, EXTRACT_CACHE_FILE, current_user
+    global BKG_INDEX_FILE, METRICS_FILE, CONTEXT_CACHE_FILE
     
     pyfile_name = os.path.basename(__file__)
     pyfile_path = os.path.dirname(os.path.abspath(__file__))
@@ -35,8 +37,9 @@ def init_globals():
         except Exception:
             current_user = str(os.getuid())
     
-    TMP_FILE = f'.tmp_ai_{current_user}.txt'
-    if os.path.exists(TMP_FILE):
+    TMP_FILE = f'.tmp_ai_{current_user}.db'
+    LEGACY_TMP_FILE = f'.tmp_ai_{current_user}.txt'  # 旧文本格式，首次加载时迁移
+    if os.path.exists(TMP_FILE) or os.path.exists(LEGACY_TMP_FILE):
         TMP_USE = True
     
     # 日志配置
@@ -48,14 +51,61 @@ def init_globals():
         os.chmod(LOG_FOLDER, 0o700)
     
     LOG_FILE = os.path.join(LOG_FOLDER, f'.log_ai_{current_user}.txt')
+    LOG_INDEX_FILE = os.path.join(LOG_FOLDER, f'.log_ai_{current_user}.idx')  # 日志全文索引
     
-    # 创建客户端
+    # 响应缓存
+    CACHE_FILE = os.path.join(LOG_FOLDER, f'.cache_ai_{current_user}.db')
+    
+    # 文件提取缓存（与 ai.py 共用 ai_data/ 下的缓存）
+    DATA_FOLDER = os.path.join(pyfile_path, 'ai_data')
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    EXTRACT_CACHE_FILE = os.path.join(DATA_FOLDER, 'extract_cache.db')
+    
+    # 背景知识检索索引（bkg.txt 变化时自动更新）
+    BKG_INDEX_FILE = os.path.join(DATA_FOLDER, 'bkg_index.db')
+    
+    # 请求耗时统计（与 ai.py 共用）
+    METRICS_FILE = os.path.join(DATA_FOLDER, 'metrics.jsonl')
+    
+    # 上下文缓存记录（前缀哈希 -> 服务端缓存 ID，与 ai.py 共用）
+    CONTEXT_CACHE_FILE = os.path.join(DATA_FOLDER, 'context_cache.db')
+
+_client_lock = threading.Lock()
+client_init_seconds = None  # 创建客户端耗时，未创建时为 None
+
+def get_client():
+    """首次调用API时才创建客户端（守护进程运行时复用其连接池）"""
+    with _client_lock:
+        return _create_client()
+
+def _create_client():
+    global client, client_init_seconds
+    if 'client' in globals():
+        return client
+    start = time.perf_counter()
     try:
         api_key = open(KEY_FILE).readline().rstrip()
-        client = OpenAI(api_key=api_key, base_url=config.API_URL)
+        
+        def create_client():
+            from openai import OpenAI
+            return OpenAI(api_key=api_key, base_url=config.API_URL)
+        
+        if config.USE_DAEMON:
+            socket_path = config.DAEMON_SOCKET or daemon.default_socket_path()
+            client = daemon.connect(socket_path, config.API_URL, fallback=create_client)
+        else:
+            client = create_client()
     except Exception as e:
         print(f"初始化API客户端失败: {e}")
         sys.exit(1)
+    client_init_seconds = time.perf_counter() - start
+    return client
+
+def __getattr__(name):
+    # f00.client 在首次访问时才创建，本地命令无需导入SDK
+    if name == 'client':
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 初始化全局变量
 init_globals()
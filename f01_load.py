@@ -2,11 +2,32 @@ import os
 import mimetypes
 from . import f00_prepare as f00
 from . import config
+from .history import HistoryStore, migrate_legacy, migrate_tmp_file
+from .cache import DiskCache, cached_extract
+from .ingest import ingest_files
+from .chunking import map_reduce, complete
+from .context import MODEL_CONTEXT
+from .knowledge import KnowledgeIndex
+from .metrics import RequestMetrics, save_metrics
+from .ooxml import OOXML_TYPES, extract_text
+from .pdftext import iter_text
+from .images import encode_image, image_content
 from pathlib import Path
-import base64
 
-def loadBKG():
+def loadBKG(query=None):
+    """加载背景知识；给出问题且开启检索时只返回最相关的部分"""
     bkg_messages = []
+    if f00.BKG_USE and query and config.BKG_RETRIEVAL:
+        try:
+            if os.path.exists(f00.BKG_FILE):
+                with KnowledgeIndex(f00.BKG_INDEX_FILE, f00.BKG_FILE, f00.BKG_SPLIT,
+                                    config.BKG_SECTION_TOKENS) as index:
+                    # 开启上下文缓存时尽量整体发送，前缀不随问题变化
+                    whole = config.CONTEXT_CACHE_BKG_TOKENS if config.CONTEXT_CACHE else None
+                    sections = index.select(query, config.BKG_TOP_K, config.BKG_TOKENS, whole)
+                return [{'role': 'system', 'content': content} for content in sections]
+        except Exception as e:
+            print(f"检索背景知识失败: {e}")
     if f00.BKG_USE:
         try:
             if os.path.exists(f00.BKG_FILE):
@@ -21,28 +42,47 @@ def loadBKG():
     return bkg_messages
 
 def loadTMP():
+    """读取最近 MAX_HISTORY 轮对话历史"""
     tmp_messages = []
-    if f00.TMP_USE and os.path.isfile(f00.TMP_FILE):
+    if f00.TMP_USE:
         try:
-            with open(f00.TMP_FILE, 'r', encoding='utf-8', errors='ignore') as f:
-                all_tmp = f.read()
-            
-            for line in all_tmp.rstrip().split(f00.TMP_END):
-                parts = line.strip().split(f00.TMP_SPLIT)
-                if len(parts) >= 2:
-                    user_msg = {'role': 'user', 'content': parts[-2]}
-                    assistant_msg = {'role': 'assistant', 'content': parts[-1]}
-                    tmp_messages.append(user_msg)
-                    tmp_messages.append(assistant_msg)
+            with HistoryStore(f00.TMP_FILE) as store:
+                count = migrate_legacy(store, f00.LEGACY_TMP_FILE, migrate_tmp_file,
+                                       f00.TMP_SPLIT, f00.TMP_END)
+                if count:
+                    print(f"已迁移{count}条旧格式历史记录")
+                tmp_messages = store.last_messages(config.MAX_HISTORY)
         except Exception as e:
             print(f"加载临时文件失败: {e}")
     return tmp_messages
 
-def process_file(file_path):
-    """处理单个文件并返回消息内容"""
+def is_large_text(file_path):
+    """是否为需要分段处理的大文本文件"""
+    ext = os.path.splitext(file_path)[1].lower()
+    return ext in config.SUPPORTED_TEXT_TYPES and os.path.getsize(file_path) > config.LARGE_TEXT_SIZE
+
+def is_large_pdf(file_path):
+    """是否为超过 MAX_FILE_SIZE、需要分段提取的 PDF"""
+    return (os.path.splitext(file_path)[1].lower() == '.pdf'
+            and os.path.getsize(file_path) > config.MAX_FILE_SIZE)
+
+def process_file(file_path, question=None):
+    """处理单个文件并返回消息内容，question 用于大文本文件的分段提问"""
     if not os.path.isfile(file_path):
         return f"文件不存在: {file_path}"
     
+    # 大文本文件逐段处理，不整体读入
+    if is_large_text(file_path):
+        return process_large_text(file_path, question)
+    
+    # PDF 分段提取，不受文件大小限制
+    if os.path.splitext(file_path)[1].lower() == '.pdf':
+        return process_pdf(file_path, question)
+    
+    # 图片在本地缩小到字节预算内，不受文件大小限制
+    if os.path.splitext(file_path)[1].lower() in config.SUPPORTED_IMAGE_TYPES:
+        return process_image(file_path)
+    
     # 检查文件大小
     file_size = os.path.getsize(file_path)
     if file_size > config.MAX_FILE_SIZE:
@@ -51,20 +91,23 @@ def process_file(file_path):
     # 获取文件扩展名
     ext = os.path.splitext(file_path)[1].lower()
     
-    # 图片处理
-    if ext in config.SUPPORTED_IMAGE_TYPES:
-        return config.IMAGE_PROMPT.format(file_name=os.path.basename(file_path))
-    
     # 音频处理
-    elif ext in config.SUPPORTED_AUDIO_TYPES:
+    if ext in config.SUPPORTED_AUDIO_TYPES:
         return config.AUDIO_PROMPT.format(file_name=os.path.basename(file_path))
     
-    # PDF处理（使用Moonshot API）
-    elif ext == '.pdf':
-        return process_pdf(file_path)
+    # Office 文档在本地解析（相同内容的文件直接使用缓存的提取结果）
+    elif ext in OOXML_TYPES:
+        try:
+            with open_extract_cache() as cache:
+                content = cached_extract(cache, 'ooxml', file_path, extract_text)
+            return (f"文件 '{os.path.basename(file_path)}' 内容:\n"
+                    f"{content}\n"
+                    f"# 文件内容结束")
+        except Exception as e:
+            return f"读取文件失败: {e}"
     
     # 文本文件处理
-    elif ext in config.SUPPORTED_TEXT_TYPES + config.SUPPORTED_DOC_TYPES:
+    elif ext in config.SUPPORTED_TEXT_TYPES:
         try:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
@@ -77,48 +120,114 @@ def process_file(file_path):
     else:
         return f"不支持的文件类型: {ext}"
 
-def process_pdf(file_path):
-    """使用API处理PDF文件"""
+def process_large_text(file_path, question=None, text=None):
+    """大文本文件（或 PDF 提取出的大段文字 text）分段提问（每段一次调用），返回合并后的各段结果"""
+    model = config.MODEL[config.MODEL_USE]
+    
+    def ask(messages):
+        return complete(f00.client, messages, model, config.TEMPERATURE)
+    
     try:
-        file_object = f00.client.files.create(
-            file=Path(file_path), 
-            purpose="file-extract"
-        )
-        
-        try:
-            file_content = f00.client.files.retrieve_content(file_id=file_object.id)
-        except:
-            file_content = f00.client.files.content(file_id=file_object.id).text
-        
-        f00.client.files.delete(file_id=file_object.id)
-        
-        # 保存提取内容（可选）
-        try:
-            with open(f"{file_path}.content.txt", 'w') as f:
-                f.write(file_content)
-        except:
-            pass
+        file_size = os.path.getsize(file_path) if text is None else len(text.encode('utf-8'))
+        notes, count = map_reduce(ask, file_path, question, config.CHUNK_TOKENS,
+                                  config.CHUNK_RESULT_TOKENS, config.INGEST_WORKERS, text=text,
+                                  context=MODEL_CONTEXT.get(model), reserve=config.CONTEXT_RESERVE)
+        return (f"文件 '{os.path.basename(file_path)}' 较大（{file_size/1024/1024:.1f}MB），"
+                f"已分 {count} 段处理，各段结果:\n"
+                f"{notes}\n"
+                f"# 文件内容结束")
+    except Exception as e:
+        return f"分段处理文件失败: {e}"
+
+def extract_pdf(file_path):
+    """上传PDF到API提取文本，失败时抛出异常"""
+    file_object = f00.client.files.create(
+        file=Path(file_path), 
+        purpose="file-extract"
+    )
+    
+    try:
+        file_content = f00.client.files.retrieve_content(file_id=file_object.id)
+    except:
+        file_content = f00.client.files.content(file_id=file_object.id).text
+    
+    f00.client.files.delete(file_id=file_object.id)
+    return file_content
+
+def open_extract_cache():
+    """打开文件提取缓存"""
+    return DiskCache(f00.EXTRACT_CACHE_FILE, config.EXTRACT_CACHE_MAX_MB * 1024 * 1024)
+
+def record_metrics(metrics):
+    """写入文件处理耗时统计"""
+    if config.METRICS:
+        save_metrics(f00.METRICS_FILE, metrics, config.METRICS_MAX_MB * 1024 * 1024)
+
+def process_pdf(file_path, question=None):
+    """处理PDF文件：文字层在本地读取，扫描页分段并发上传提取（相同内容的文件直接使用缓存的提取结果）
+
+    提取出的文字超过 LARGE_TEXT_SIZE 时与大文本文件一样分段提问，不整体放入消息。
+    """
+    metrics = RequestMetrics('pdf')
+    
+    def on_part(label, error, seconds):
+        if label is not None:
+            status = '完成' if error is None else f'失败: {error}'
+            print(f"  {os.path.basename(file_path)} 第 {label} 页提取{status} ({seconds:.1f}s)")
+    
+    def extract(path):
+        metrics.extra['cached'] = False
+        return ''.join(iter_text(path, extract_pdf, metrics.extra, config.PDF_LOCAL,
+                                 config.PDF_WORKERS, config.MAX_FILE_SIZE, config.PDF_PART_PAGES,
+                                 on_part))
+    
+    try:
+        metrics.extra.update(bytes=os.path.getsize(file_path), cached=True)
+        with open_extract_cache() as cache:
+            namespace = 'pdftext' if config.PDF_LOCAL else 'pdf'
+            file_content = cached_extract(cache, namespace, file_path, extract,
+                                          uploaded=not config.PDF_LOCAL)
+        record_metrics(metrics.finish())
         
+        if len(file_content.encode('utf-8')) > config.LARGE_TEXT_SIZE:
+            return process_large_text(file_path, question, file_content)
         return (f"PDF文件 '{os.path.basename(file_path)}' 提取内容:\n"
                 f"{file_content}\n"
                 f"# PDF内容结束")
     except Exception as e:
+        record_metrics(metrics.finish(e))
         return f"处理PDF失败: {e}"
 
+def process_image(file_path):
+    """把图片编码为图文消息内容（相同内容的图片直接使用缓存的编码结果）"""
+    def encode(path):
+        return encode_image(path, config.IMAGE_MAX_SIDE, config.IMAGE_MAX_KB * 1024,
+                            config.IMAGE_QUALITY)
+    
+    try:
+        namespace = f'image:{config.IMAGE_MAX_SIDE}:{config.IMAGE_MAX_KB}:{config.IMAGE_QUALITY}'
+        with open_extract_cache() as cache:
+            url = cached_extract(cache, namespace, file_path, encode)
+        return image_content(url, config.IMAGE_PROMPT.format(file_name=os.path.basename(file_path)))
+    except Exception as e:
+        return f"处理图片失败: {e}"
+
 def loadNEW(args):
-    """处理新的用户输入"""
-    new_messages = []
-    
-    for arg in args:
-        # 处理文件
-        if os.path.isfile(arg):
-            file_content = process_file(arg)
-            new_messages.append({'role': 'user', 'content': file_content})
-        # 处理文本输入
-        else:
-            new_messages.append({'role': 'user', 'content': arg})
+    """处理新的用户输入（多个文件并发处理，消息顺序与参数顺序一致）"""
+    new_messages = [{'role': 'user', 'content': arg} for arg in args]
+    
+    files = [i for i, arg in enumerate(args) if os.path.isfile(arg)]
+    question = ' '.join(arg for arg in args if not os.path.isfile(arg))
+    # 大文本文件和大 PDF 内部已分段并发，不受单个文件超时限制
+    large = [i for i in files if is_large_text(args[i]) or is_large_pdf(args[i])]
+    files = [i for i in files if i not in large]
+    if files:
+        contents = ingest_files(lambda path: process_file(path, question), [args[i] for i in files],
+                                config.INGEST_WORKERS, config.INGEST_TIMEOUT,
+                                progress=len(files) > 1)
+        for i, content in zip(files, contents):
+            new_messages[i]['content'] = content
+    for i in large:
+        new_messages[i]['content'] = process_file(args[i], question)
     
     return new_messages
-
-
-
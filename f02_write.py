@@ -1,11 +1,17 @@
-import os
+import time
 from . import f00_prepare as f00
+from . import config
+from .history import HistoryStore
+from .search import SearchIndex
+from .logfile import append_record, Rotation
+from .context import content_text
 
-def writeTMP(content):
+def writeTMP(user_message, assistant_message, model=None):
     try:
-        with open(f00.TMP_FILE, 'a+', encoding='utf-8') as file:
-            file.write(content + '\n')
-        os.chmod(f00.TMP_FILE, 0o600)
+        with HistoryStore(f00.TMP_FILE) as store:
+            store.append(content_text(user_message['content']), assistant_message['content'],
+                         model=model or config.MODEL[config.MODEL_USE],
+                         user=f00.current_user)
     except Exception as e:
         print(f"写入临时文件失败: {e}")
 
@@ -14,11 +20,31 @@ def writeLOG(content):
         return
     
     try:
-        with open(f00.LOG_FILE, 'a+', encoding='utf-8') as file:
-            file.write(content + '\n')
-        os.chmod(f00.LOG_FILE, 0o600)
+        rotation = Rotation(config.LOG_ROTATE_MB * 1024 * 1024, config.LOG_ROTATE_DAYS,
+                            config.LOG_MAX_TOTAL_MB * 1024 * 1024)
+        offset, length = append_record(f00.LOG_FILE, content + '\n', 0o600, config.LOG_FSYNC,
+                                       config.LOG_FSYNC_INTERVAL, rotation)
     except Exception as e:
         print(f"写入日志失败: {e}")
+        return
+    
+    indexLOG(content, offset, length)
+
+def indexLOG(content, offset, length):
+    """把一条 getTMP 格式的日志记录加入全文索引"""
+    fields = content.replace(f00.TMP_END, '').split(f00.TMP_SPLIT)
+    if len(fields) < 7:
+        return
+    
+    # 字段: 时间, 路径, 用户, 脚本, 模型, 问题, 回答
+    human_time, cwd, _, _, model, question, answer = fields[:7]
+    try:
+        timestamp = time.mktime(time.strptime(human_time, '%Y-%m-%d %H:%M:%S'))
+        with SearchIndex(f00.LOG_INDEX_FILE) as index:
+            index.add(question + '\n' + answer, timestamp, cwd, model, question,
+                      f00.LOG_FILE, offset, length)
+    except Exception as e:
+        print(f"更新日志索引失败: {e}")
 
 def save_history(messages, file_path):
     """保存对话历史到文件"""
@@ -26,7 +52,7 @@ def save_history(messages, file_path):
         with open(file_path, 'w', encoding='utf-8') as f:
             for msg in messages:
                 role = msg['role']
-                content = msg['content'].replace('\n', '\n    ')
+                content = content_text(msg['content']).replace('\n', '\n    ')
                 f.write(f"{role.capitalize()}:\n    {content}\n\n")
         print(f"对话已保存到: {file_path}")
         return True
@@ -4,9 +4,17 @@ import time
 from datetime import datetime
 from . import f00_prepare as f00
 from . import config
+from .history import HistoryStore, remove_store
+from .search import SearchIndex, print_hits, backfill_log
+from .metrics import load_metrics, print_metrics
+from .context import content_text
 
-def print_cn(text, chunk_size=5, delay=0.05):
-    """流式输出中文字符"""
+def print_cn(text, chunk_size=5, delay=0):
+    """输出中文字符，delay>0 时逐块输出（打字机效果）"""
+    if delay <= 0:
+        sys.stdout.buffer.write(text.encode('utf-8'))
+        sys.stdout.buffer.flush()
+        return
     for i in range(0, len(text), chunk_size):
         out_text = text[i:i + chunk_size]
         sys.stdout.buffer.write(out_text.encode('utf-8'))
@@ -24,32 +32,47 @@ def check_command(new_messages):
         print('错误: 输入内容为空!')
         return False
     
-    content = new_messages[0]['content'].strip().lower()
+    content = content_text(new_messages[0]['content']).strip().lower()
     
     if content in ['stoptmp', 'rmtmp']:
-        if os.path.exists(f00.TMP_FILE):
-            os.remove(f00.TMP_FILE)
+        if remove_store(f00.TMP_FILE):
             print(f"'{f00.TMP_FILE}' 已删除")
+        if os.path.exists(f00.LEGACY_TMP_FILE):
+            os.remove(f00.LEGACY_TMP_FILE)
         return False
     
     if content in ['usetmp', 'tmp']:
-        with open(f00.TMP_FILE, 'a+', encoding='utf-8') as file:
-            file.write('\n')
+        HistoryStore(f00.TMP_FILE).close()
         print(f"'{f00.TMP_FILE}' 已创建")
-        os.chmod(f00.TMP_FILE, 0o600)
+        return False
+    
+    if content == 'stats':
+        print_metrics(load_metrics(f00.METRICS_FILE, 200))
         return False
     
     if content == 'cleantmp':
-        if os.path.exists(f00.TMP_FILE):
-            os.remove(f00.TMP_FILE)
-        with open(f00.TMP_FILE, 'a+', encoding='utf-8') as file:
-            file.write('\n')
+        remove_store(f00.TMP_FILE)
+        if os.path.exists(f00.LEGACY_TMP_FILE):
+            os.remove(f00.LEGACY_TMP_FILE)
+        HistoryStore(f00.TMP_FILE).close()
         print(f"'{f00.TMP_FILE}' 已清理并重新创建")
-        os.chmod(f00.TMP_FILE, 0o600)
         return False
     
     return True
 
+def searchLOG(query, limit=10):
+    """在日志全文索引中检索"""
+    if not os.path.exists(f00.LOG_INDEX_FILE) and not os.path.exists(f00.LOG_FILE):
+        print("日志索引不存在")
+        return []
+    with SearchIndex(f00.LOG_INDEX_FILE) as index:
+        backfill_log(index, f00.LOG_FILE, f00.TMP_SPLIT, f00.TMP_END)
+        start = time.perf_counter()
+        hits = index.search(query, limit)
+    clean = lambda text: text.replace(f00.TMP_SPLIT.strip(), ' | ').replace(f00.TMP_END.strip(), '')
+    print_hits(hits, query, time.perf_counter() - start, clean)
+    return hits
+
 def getTMP(user_message, assistant_message):
     """生成临时文件内容"""
     timestamp = time.time()
@@ -57,7 +80,7 @@ def getTMP(user_message, assistant_message):
     current_path = os.getcwd()
     current_model = config.MODEL[config.MODEL_USE]
     
-    user_content = clean_content(user_message['content'])
+    user_content = clean_content(content_text(user_message['content']))
     assistant_content = clean_content(assistant_message['content'])
     
     return f00.TMP_SPLIT.join([
@@ -81,7 +104,8 @@ def print_help():
         ("!file [文件路径]", "添加文件进行分析"),
         ("!last", "显示上一条AI回复"),
         ("!clear", "清空屏幕"),
-        ("!model", "显示/切换AI模型")
+        ("!model", "显示/切换AI模型"),
+        ("!search [关键词]", "检索历史日志")
     ]
     
     for cmd, desc in commands:
@@ -91,5 +115,6 @@ def print_help():
     print("  stoptmp/rmtmp - 删除临时文件")
     print("  usetmp/tmp    - 创建临时文件")
     print("  cleantmp      - 清理并重建临时文件")
+    print("  stats         - 最近 200 次请求的耗时统计")
     
     print("=" * terminal_width + "\n")
\ No newline at end of file
@@ -1,39 +1,129 @@
-import time
 from . import f00_prepare as f00
 from . import config
+from .stream import StreamRenderer
+from .cache import DiskCache, response_key
+from .retry import RetryPolicy, RequestFailed, stream_with_retry, is_retryable
+from .metrics import RequestMetrics, save_metrics
+from .context import vision_model
+from .promptcache import apply_cache, forget_cache
 
-def get_result(messages, max_retries=3):
-    """获取AI结果，支持重试"""
-    for attempt in range(max_retries):
-        try:
-            stream = f00.client.chat.completions.create(
-                model=config.MODEL[config.MODEL_USE],
-                messages=messages,
-                temperature=config.TEMPERATURE,
-                stream=True
-            )
-            
-            result = ''
-            print('\n回答:')
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    # 使用工具函数确保中文字符正确显示
-                    from .f03_util import print_cn
-                    print_cn(content)
-                    result += content
-            
-            print('\n')
-            return result
-        
-        except Exception as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"请求失败，{wait_time}秒后重试... ({e})")
-                time.sleep(wait_time)
-            else:
-                print(f"请求失败: {e}")
-                return "抱歉，请求处理失败，请稍后再试。"
+def new_renderer():
+    """按配置创建流式渲染器"""
+    return StreamRenderer(
+        frame_ms=config.STREAM_FRAME_MS,
+        frame_bytes=config.STREAM_FRAME_BYTES,
+        typewriter=config.TYPEWRITER,
+        cps=config.TYPEWRITER_CPS
+    )
+
+def open_cache():
+    """打开响应缓存"""
+    return DiskCache(f00.CACHE_FILE, config.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+                     config.RESPONSE_CACHE_TTL)
+
+def open_context_cache():
+    """打开上下文缓存记录（有效期略短于服务端，不引用即将过期的缓存）"""
+    return DiskCache(f00.CONTEXT_CACHE_FILE, 1024 * 1024, config.CONTEXT_CACHE_TTL * 0.9)
+
+def use_context_cache(messages, model):
+    """用服务端上下文缓存代替不变的前缀，返回 (要发送的消息, 使用的缓存)；出错时发送完整消息"""
+    if not config.CONTEXT_CACHE:
+        return messages, None
+    try:
+        with open_context_cache() as registry:
+            return apply_cache(f00.client, registry, model, messages, config.CONTEXT_CACHE_TTL,
+                               config.CONTEXT_CACHE_MIN_TOKENS)
+    except Exception as e:
+        print(f"读取上下文缓存失败: {e}")
+        return messages, None
+
+def drop_context_cache(context_cache):
+    """服务端缓存已失效时删除本地记录"""
+    try:
+        with open_context_cache() as registry:
+            forget_cache(registry, context_cache)
+    except Exception as e:
+        print(f"更新上下文缓存失败: {e}")
 
+def record_request(metrics, fresh=False):
+    """写入一次请求的耗时统计（fresh 表示客户端是在本次请求中创建的）"""
+    if not config.METRICS:
+        return
+    if fresh:
+        metrics.client_init = f00.client_init_seconds
+    save_metrics(f00.METRICS_FILE, metrics, config.METRICS_MAX_MB * 1024 * 1024)
 
+def get_result(messages, max_retries=None, model=None, use_cache=None, control=None):
+    """获取AI结果，支持重试和响应缓存
 
+    可重试的错误（429、5xx、超时）按退避策略重试，中途断开时从已输出的内容继续；
+    最终失败时返回 None，不把错误提示当作回答。
+    control 为 session.StreamControl 时可从其他线程中断，中断后返回已收到的部分内容。
+    """
+    model = vision_model(model or config.MODEL[config.MODEL_USE], messages)
+    if use_cache is None:
+        use_cache = config.RESPONSE_CACHE
+    
+    cache_key = None
+    if use_cache:
+        cache_key = response_key(model, config.TEMPERATURE, messages)
+        try:
+            with open_cache() as cache:
+                cached = cache.get_text(cache_key)
+        except Exception as e:
+            print(f"读取缓存失败: {e}")
+            cached = None
+        if cached is not None:
+            print('\n回答(缓存):')
+            with new_renderer() as renderer:
+                renderer.write(cached)
+            print('\n')
+            return cached
+    
+    policy = RetryPolicy(max_retries or config.RETRY_ATTEMPTS, config.RETRY_BASE,
+                         config.RETRY_CAP, config.RETRY_DEADLINE)
+    metrics = RequestMetrics('chat', model)
+    fresh = f00.client_init_seconds is None
+    request, context_cache = use_context_cache(messages, model)
+    print('\n回答:')
+    renderer = new_renderer()
+    
+    def on_retry(error, wait, resumed):
+        action = '继续' if resumed else '重试'
+        renderer.write(f"\n[请求失败，{wait:.1f}秒后{action}... ({error})]\n")
+    
+    try:
+        try:
+            answer = stream_with_retry(f00.client, request, renderer.write, policy, control, on_retry,
+                                       metrics, model=model, temperature=config.TEMPERATURE)
+        except RequestFailed as e:
+            if context_cache is None or e.partial or is_retryable(e.error):
+                raise
+            # 缓存已过期或被删除：删除记录后发送完整消息
+            drop_context_cache(context_cache)
+            context_cache = None
+            answer = stream_with_retry(f00.client, messages, renderer.write, policy, control, on_retry,
+                                       metrics, model=model, temperature=config.TEMPERATURE)
+    except RequestFailed as e:
+        renderer.close()
+        record_request(metrics.finish(e), fresh)
+        print(f"\n请求失败（共尝试{e.attempts}次）: {e}")
+        return None
+    renderer.close()
+    metrics.cancelled = control is not None and control.cancelled
+    if context_cache is not None and metrics.cached_tokens is None:
+        metrics.extra['cached_tokens'] = context_cache['tokens']  # 服务端未返回时按缓存大小计
+    record_request(metrics.finish(), fresh)
+    
+    if control is not None and control.cancelled:
+        print('\n[回答已中断]\n')
+        return answer
+    
+    print('\n')
+    if cache_key:
+        try:
+            with open_cache() as cache:
+                cache.set_text(cache_key, answer)
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+    return answer
@@ -0,0 +1,199 @@
+import time
+import queue
+import socket
+import threading
+import unicodedata
+
+try:
+    from .stream import StreamBuffer
+except ImportError:
+    from stream import StreamBuffer
+
+class ModelRun:
+    """一个模型的流式请求：记录首字耗时、总耗时和回答内容"""
+
+    def __init__(self, model):
+        self.model = model
+        self.buffer = StreamBuffer()
+        self.ttft = None    # 首个 token 耗时(秒)
+        self.total = None   # 总耗时(秒)
+        self.error = None
+        self.cancelled = False
+        self._cancel = threading.Event()
+        self._stream = None
+        self._lock = threading.Lock()  # 请求结束后连接可能已回到连接池，不能再断开
+        self._finished = False
+
+    @property
+    def text(self):
+        return self.buffer.getvalue()
+
+    def cancel(self):
+        """取消请求：立即断开连接，仍在等待首个 token 的请求也不再占用上游"""
+        if self.total is None:
+            self.cancelled = True
+        self._cancel.set()
+        with self._lock:
+            if not self._finished:
+                self._abort()
+
+    def _abort(self):
+        """（持锁）断开连接：关闭底层 socket 的读写，正在阻塞读取的工作线程随即返回"""
+        response = getattr(self._stream, 'response', None)
+        network = getattr(response, 'extensions', {}).get('network_stream')
+        sock = network.get_extra_info('socket') if network is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._close()
+
+    def _close(self):
+        stream = self._stream
+        if stream is not None and hasattr(stream, 'close'):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def run(self, completions, messages, temperature, events):
+        """在工作线程中执行，每个增量和结束时向 events 发送 (self, 内容或 None)"""
+        start = time.perf_counter()
+        try:
+            self._stream = stream = completions.create(
+                model=self.model, messages=messages, temperature=temperature, stream=True)
+            # 在建立连接期间被取消时，cancel() 还拿不到连接，这里补上断开
+            with self._lock:
+                if self._cancel.is_set():
+                    self._abort()
+            if not self._cancel.is_set():
+                for chunk in stream:
+                    if self._cancel.is_set():
+                        break
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        if self.ttft is None:
+                            self.ttft = time.perf_counter() - start
+                        self.buffer.append(content)
+                        events.put((self, content))
+        except Exception as e:
+            # 被取消时关闭连接导致的读取错误不算失败
+            if not self._cancel.is_set():
+                self.error = e
+        finally:
+            with self._lock:
+                self._finished = True
+            self._close()
+        self.total = time.perf_counter() - start
+        events.put((self, None))
+
+def _start(client, messages, models, temperature):
+    # 先创建客户端，首字耗时不包含客户端初始化
+    completions = client.chat.completions
+    events = queue.SimpleQueue()
+    runs = [ModelRun(model) for model in models]
+    for run in runs:
+        threading.Thread(target=run.run, args=(completions, messages, temperature, events),
+                         daemon=True).start()
+    return runs, events
+
+def race(client, messages, models, temperature, write):
+    """同时请求多个模型，输出最先返回首个 token 的模型，其余取消
+
+    返回 (获胜的 ModelRun 或 None, 全部 ModelRun)；获胜的模型中途失败时 error 不为 None。
+    """
+    runs, events = _start(client, messages, models, temperature)
+    winner, finished = None, 0
+    while finished < len(runs):
+        run, content = events.get()
+        if content is None:
+            finished += 1
+            if run is winner:
+                break
+            continue
+        if winner is None:
+            winner = run
+            for other in runs:
+                if other is not winner:
+                    other.cancel()
+        if run is winner:
+            write(content)
+    return winner, runs
+
+def compare(client, messages, models, temperature, on_done=None):
+    """同时请求多个模型并等待全部完成，on_done(run) 在每个模型结束时回调"""
+    runs, events = _start(client, messages, models, temperature)
+    finished = 0
+    while finished < len(runs):
+        run, content = events.get()
+        if content is None:
+            finished += 1
+            if on_done is not None:
+                on_done(run)
+    return runs
+
+def _seconds(value):
+    return f'{value:.2f}s' if value is not None else '-'
+
+def status(run):
+    if run.error is not None:
+        return f'失败: {run.error}'
+    return '已取消' if run.cancelled else '完成'
+
+def print_summary(runs, winner=None):
+    """打印各模型的首字耗时和总耗时"""
+    width = max(len(run.model) for run in runs) + 2
+    print(f"\n{pad('模型', width)}{pad('首字', 8, True)} {pad('总耗时', 8, True)} "
+          f"{pad('字数', 7, True)}  状态")
+    for run in runs:
+        mark = ' *' if run is winner else ''
+        print(f"{run.model.ljust(width)}{_seconds(run.ttft):>8} {_seconds(run.total):>8} "
+              f"{len(run.text):>7}  {status(run)}{mark}")
+
+def display_width(text):
+    """终端显示宽度（全角字符占两列）"""
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+
+def pad(text, width, right=False):
+    """按显示宽度补齐空格"""
+    space = ' ' * max(0, width - display_width(text))
+    return space + text if right else text + space
+
+def wrap(text, width):
+    """按显示宽度折行"""
+    lines = []
+    for paragraph in text.splitlines() or ['']:
+        line, used = '', 0
+        for char in paragraph:
+            w = 2 if unicodedata.east_asian_width(char) in 'WF' else 1
+            if used + w > width:
+                lines.append(line)
+                line, used = '', 0
+            line += char
+            used += w
+        lines.append(line)
+    return lines
+
+def print_columns(runs, total_width, gap=3):
+    """把各模型的回答并排显示；终端太窄时逐个显示"""
+    column = (total_width - gap * (len(runs) - 1)) // len(runs)
+    if column < 20:
+        for run in runs:
+            print(f"\n[{run.model}] 首字 {_seconds(run.ttft)}，总耗时 {_seconds(run.total)}")
+            print(run.text if run.error is None else status(run))
+        return
+
+    blocks = []
+    for run in runs:
+        header = [run.model[:column], f"首字 {_seconds(run.ttft)} 总计 {_seconds(run.total)}",
+                  '-' * column]
+        body = wrap(run.text, column) if run.error is None else wrap(status(run), column)
+        blocks.append(header + body)
+    print()
+    for i in range(max(len(block) for block in blocks)):
+        cells = []
+        for block in blocks:
+            cell = block[i] if i < len(block) else ''
+            cells.append(cell + ' ' * (column - display_width(cell)))
+        print((' ' * gap).join(cells).rstrip())
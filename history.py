@@ -0,0 +1,160 @@
+import os
+import time
+import sqlite3
+
+try:
+    from .context import content_text
+except ImportError:
+    from context import content_text
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    cwd TEXT,
+    user TEXT,
+    model TEXT,
+    question TEXT NOT NULL,
+    answer TEXT
+)
+'''
+
+class HistoryStore:
+    """对话历史存储（SQLite WAL 模式）
+
+    每轮对话一条记录，按自增主键追加；读取最近 N 轮只走主键索引，
+    不需要扫描或解析整个文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(SCHEMA)
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def append(self, question, answer, model=None, cwd=None, user=None, timestamp=None):
+        """追加一轮对话"""
+        self.conn.execute(
+            'INSERT INTO turns (time, cwd, user, model, question, answer) VALUES (?, ?, ?, ?, ?, ?)',
+            (timestamp or time.time(), cwd if cwd is not None else os.getcwd(), user, model,
+             question, answer)
+        )
+
+    def append_many(self, rows):
+        """批量追加 (time, cwd, user, model, question, answer)"""
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                'INSERT INTO turns (time, cwd, user, model, question, answer) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def last_turns(self, n):
+        """最近 n 轮对话，按时间顺序返回 (question, answer) 列表"""
+        rows = self.conn.execute(
+            'SELECT question, answer FROM turns ORDER BY id DESC LIMIT ?', (n,)
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def last_messages(self, n):
+        """最近 n 轮对话，转换为消息列表"""
+        messages = []
+        for question, answer in self.last_turns(n):
+            messages.append({'role': 'user', 'content': question})
+            if answer:
+                messages.append({'role': 'assistant', 'content': answer})
+        return messages
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM turns').fetchone()[0]
+
+def pair_messages(messages):
+    """把 user/assistant 消息序列配成 (question, answer) 对，忽略系统消息"""
+    pairs = []
+    for message in messages:
+        if message['role'] == 'user':
+            pairs.append([content_text(message['content']), None])
+        elif message['role'] == 'assistant' and pairs and pairs[-1][1] is None:
+            pairs[-1][1] = message['content']
+    return [tuple(pair) for pair in pairs]
+
+def remove_store(path):
+    """删除历史库及其 WAL 文件，返回是否存在过"""
+    existed = False
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+            existed = True
+    return existed
+
+def migrate_tmp_file(store, legacy_path, tmp_split, tmp_end):
+    """迁移旧的 TMP 文本格式（字段以 tmp_split 分隔、记录以 tmp_end 结尾）"""
+    with open(legacy_path, 'r', encoding='utf-8', errors='ignore') as f:
+        all_tmp = f.read()
+
+    # 按去掉换行的分隔符切分，兼容文件末尾缺少换行的记录
+    rows = []
+    for record in all_tmp.split(tmp_end.strip()):
+        parts = [part.strip() for part in record.strip().split(tmp_split.strip())]
+        if len(parts) < 2:
+            continue
+        # 完整记录: 时间, 路径, 用户, 脚本, 模型, 问题, 回答
+        timestamp, cwd, user, model = time.time(), None, None, None
+        if len(parts) >= 7:
+            try:
+                timestamp = time.mktime(time.strptime(parts[0], '%Y-%m-%d %H:%M:%S'))
+            except ValueError:
+                pass
+            cwd, user, model = parts[1], parts[2], parts[4]
+        rows.append((timestamp, cwd, user, model, parts[-2], parts[-1]))
+    store.append_many(rows)
+    return len(rows)
+
+def migrate_line_file(store, legacy_path):
+    """迁移 ai.py 旧的 role|content 行格式"""
+    messages = []
+    with open(legacy_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if line.strip():
+                parts = line.split('|', 1)
+                if len(parts) == 2:
+                    messages.append({'role': parts[0].strip(), 'content': parts[1].strip()})
+
+    rows = [(time.time(), None, None, None, q, a) for q, a in pair_messages(messages)]
+    store.append_many(rows)
+    return len(rows)
+
+def migrate_legacy(store, legacy_path, migrate, *args):
+    """旧格式文件存在时导入一次，并改名为 .migrated 以免重复导入
+
+    先把文件改名认领，多个进程同时启动时只有一个会导入。导入失败时（导入在
+    同一个事务中，不会留下部分记录）改回原名，下次启动时重试。
+    """
+    claimed = f'{legacy_path}.{os.getpid()}.migrating'
+    try:
+        os.replace(legacy_path, claimed)
+    except FileNotFoundError:
+        return 0
+    try:
+        count = migrate(store, claimed, *args)
+    except BaseException:
+        os.replace(claimed, legacy_path)
+        raise
+    os.replace(claimed, legacy_path + '.migrated')
+    return count
@@ -0,0 +1,178 @@
+import io
+import os
+import struct
+import binascii
+
+try:
+    from .context import content_text
+except ImportError:
+    from context import content_text
+
+# API 接受的图片格式，其他格式（如 BMP）需要 Pillow 转换
+API_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+ENCODE_BLOCK = 3 * 16 * 1024  # base64 分块编码的块大小（3 的倍数，块之间不产生填充）
+MIN_SIDE = 256  # 降低质量仍超出字节预算时逐步缩小，长边不小于此值
+
+def _pillow():
+    """按需导入 Pillow；未安装时返回 (None, None)，只发送不超出预算的原图"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None, None
+    return Image, ImageOps
+
+def _jpeg_size(f):
+    """扫描 JPEG 标记段，从帧头（SOFn）读取尺寸"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        while marker[:1] == b'\xff' and marker[1:] == b'\xff':
+            marker = marker[1:] + f.read(1)  # 填充字节
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        code = marker[1]
+        if code in (0x01, 0xd8) or 0xd0 <= code <= 0xd7:
+            continue  # 无长度的标记
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+def image_info(file_path):
+    """从文件头识别图片格式和尺寸，不解码像素；返回 (MIME 类型, (宽, 高))，无法识别的部分为 None"""
+    with open(file_path, 'rb') as f:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return 'image/png', struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return 'image/gif', struct.unpack('<HH', head[6:10])
+        if head.startswith(b'\xff\xd8'):
+            return 'image/jpeg', _jpeg_size(f)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            chunk = head[12:16]
+            if chunk == b'VP8X':
+                width = int.from_bytes(head[24:27], 'little') + 1
+                height = int.from_bytes(head[27:30], 'little') + 1
+                return 'image/webp', (width, height)
+            if chunk == b'VP8L':
+                bits = int.from_bytes(head[21:25], 'little')
+                return 'image/webp', ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', head[26:30])
+                return 'image/webp', (width & 0x3fff, height & 0x3fff)
+            return 'image/webp', None
+        if head[:2] == b'BM':
+            width, height = struct.unpack('<ii', head[18:26])
+            return 'image/bmp', (width, abs(height))
+    return None, None
+
+def _file_blocks(f, size):
+    """按 ENCODE_BLOCK 读取文件，复用同一个缓冲区"""
+    view = memoryview(bytearray(min(ENCODE_BLOCK, size)))
+    while True:
+        filled = 0
+        while filled < len(view):
+            count = f.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        if not filled:
+            return
+        yield view[:filled]
+        if filled < len(view):
+            return
+
+def _data_url(blocks, size, mime):
+    """把逐块给出的二进制数据编码为 data URL
+
+    除最后一块外每块长度都是 3 的倍数；输出按最终长度预先分配，逐块写入，
+    不同时保留原图、编码结果和拼接后的多份副本。
+    """
+    prefix = f'data:{mime};base64,'.encode('ascii')
+    out = bytearray(len(prefix) + (size + 2) // 3 * 4)
+    out[:len(prefix)] = prefix
+    pos = len(prefix)
+    for block in blocks:
+        encoded = binascii.b2a_base64(block, newline=False)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    encoded = None
+    if pos != len(out):
+        raise ValueError("图片在编码过程中被修改")
+    return out.decode('ascii')
+
+def _downscale(file_path, max_side, max_bytes, quality):
+    """用 Pillow 缩小到长边 max_side 以内并重新编码，返回 (编码后的数据, MIME 类型)
+
+    PNG/GIF 等非 JPEG 来源（多为截图）按原文件每像素字节数估计缩小后仍在预算内时先尝试
+    无损 PNG，保持文字清晰；否则用 JPEG 并逐步降低质量，仍超出时继续缩小。
+    带透明通道的图片只用 PNG。
+    """
+    Image, ImageOps = _pillow()
+    with Image.open(file_path) as source:
+        lossless = source.format != 'JPEG'
+        pixels = source.size[0] * source.size[1]
+        source.draft('RGB', (max_side, max_side))  # JPEG 解码时直接按 1/2~1/8 缩小
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.BICUBIC, reducing_gap=2.0)
+    estimate = os.path.getsize(file_path) * image.size[0] * image.size[1] / max(1, pixels)
+    lossless = lossless and estimate <= max_bytes
+    alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if alpha else 'RGB')
+    options = [('PNG', 'image/png', {})] if lossless or alpha else []
+    if not alpha:
+        options += [('JPEG', 'image/jpeg', {'quality': q, 'optimize': True})
+                    for q in (quality, quality - 15, quality - 30)]
+    while True:
+        for fmt, mime, option in options:
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, **option)
+            if buffer.tell() <= max_bytes:
+                return buffer.getbuffer(), mime
+        width, height = image.size
+        if max(width, height) <= MIN_SIDE:
+            raise ValueError(f"图片缩小到 {width}x{height} 后仍超过 {max_bytes // 1024}KB")
+        image = image.resize((max(1, width * 3 // 4), max(1, height * 3 // 4)), Image.BICUBIC)
+
+def encode_image(file_path, max_side=1280, max_bytes=1024 * 1024, quality=85):
+    """把图片编码为可放入消息的 data URL
+
+    格式受支持、尺寸和大小都在预算内的图片直接分块编码，不解码像素，也不导入 Pillow；
+    否则用 Pillow 缩小并重新编码。未安装 Pillow 时超出预算的图片抛出异常。
+    """
+    mime, size = image_info(file_path)
+    file_size = os.path.getsize(file_path)
+    fits = mime in API_TYPES and file_size <= max_bytes
+    if fits and ((size is not None and max(size) <= max_side) or _pillow()[0] is None):
+        # 未安装 Pillow 时无法缩小，不超出字节预算的原图按原尺寸发送
+        with open(file_path, 'rb') as f:
+            return _data_url(_file_blocks(f, file_size), file_size, mime)
+    if _pillow()[0] is None:
+        raise ValueError(f"图片需要缩小或转换格式（{file_size / 1024:.0f}KB），请安装 Pillow")
+    data, mime = _downscale(file_path, max_side, max_bytes, quality)
+    with data:
+        blocks = (data[i:i + ENCODE_BLOCK] for i in range(0, len(data), ENCODE_BLOCK))
+        return _data_url(blocks, len(data), mime)
+
+def image_content(url, text):
+    """一张图片和一段说明组成的消息内容"""
+    return [{'type': 'image_url', 'image_url': {'url': url}}, {'type': 'text', 'text': text}]
+
+def split_content(content):
+    """把消息内容拆成 (文字, 图片部分列表)"""
+    if isinstance(content, str):
+        return content, []
+    return content_text(content), [part for part in content if part.get('type') == 'image_url']
+
+def user_content(text, images=()):
+    """文字和图片组成的消息内容；没有图片时仍为字符串"""
+    if not images:
+        return text
+    return list(images) + [{'type': 'text', 'text': text}]
@@ -0,0 +1,123 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def map_ordered(func, items, workers=4, timeout=None, on_done=None):
+    """用有界线程池并发处理 items，按输入顺序返回 [(成功与否, 结果或异常), ...]
+
+    timeout 为单个任务从开始执行起的最长秒数，超时的任务记为失败。工作线程为守护线程，
+    超时后仍在运行的任务不会阻止程序退出。
+    on_done(序号, 结果) 在每个任务结束时于调用线程中回调，可用于显示进度。
+    """
+    items = list(items)
+    results = [None] * len(items)
+    tasks = queue.SimpleQueue()
+    for index, item in enumerate(items):
+        tasks.put((index, item))
+    events = queue.SimpleQueue()
+    started = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                index, item = tasks.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                started[index] = time.monotonic()
+            try:
+                result = (True, func(item))
+            except Exception as e:
+                result = (False, e)
+            events.put((index, result))
+
+    for _ in range(min(max(1, workers), len(items))):
+        threading.Thread(target=worker, daemon=True).start()
+
+    def finish(index, result):
+        remaining.discard(index)
+        results[index] = result
+        if on_done is not None:
+            on_done(index, result)
+
+    remaining = set(range(len(items)))
+    while remaining:
+        try:
+            index, result = events.get(timeout=0.1 if timeout else None)
+        except queue.Empty:
+            pass
+        else:
+            if index in remaining:
+                finish(index, result)
+
+        if timeout:
+            now = time.monotonic()
+            with lock:
+                expired = [i for i in remaining if i in started and now - started[i] > timeout]
+            for index in expired:
+                finish(index, (False, TimeoutError(f"处理超时 ({timeout}秒)")))
+    return results
+
+def _call(task):
+    try:
+        return True, task()
+    except Exception as e:
+        return False, e
+
+def iter_ordered(tasks, workers=4, on_done=None):
+    """逐个读取 tasks：可调用对象放入有界线程池执行，其他值原样通过；按输入顺序产出 (成功与否, 结果或异常)
+
+    不必等全部完成：前面的结果都已就绪时立即产出，等待期间继续读取后面的任务提交执行。
+    on_done(序号, 结果) 在每个任务结束时于调用线程中回调。提前停止迭代时取消尚未开始的任务。
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    pending = {}  # 序号 -> Future
+    ready = {}    # 序号 -> 结果
+    tasks = iter(tasks)
+    count = emitted = 0
+    exhausted = False
+    try:
+        while emitted < count or not exhausted:
+            for index in [i for i, future in pending.items() if future.done()]:
+                ready[index] = pending.pop(index).result()
+                if on_done is not None:
+                    on_done(index, ready[index])
+            if emitted in ready:
+                yield ready.pop(emitted)
+                emitted += 1
+            elif not exhausted:
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    continue
+                if callable(task):
+                    pending[count] = executor.submit(_call, task)
+                else:
+                    ready[count] = (True, task)
+                count += 1
+            else:
+                wait(pending.values(), return_when=FIRST_COMPLETED)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def ingest_files(process, paths, workers=4, timeout=None, progress=True):
+    """并发处理多个文件，按参数顺序返回内容；失败的文件返回错误说明而不是中断整个请求"""
+    start = time.monotonic()
+    total = len(paths)
+    finished = [0]
+
+    def on_done(index, result):
+        finished[0] += 1
+        if progress:
+            status = '完成' if result[0] else f'失败: {result[1]}'
+            print(f"[{finished[0]}/{total}] {os.path.basename(paths[index])} "
+                  f"{status} ({time.monotonic() - start:.1f}s)")
+
+    contents = []
+    for path, (ok, value) in zip(paths, map_ordered(process, paths, workers, timeout, on_done)):
+        contents.append(value if ok else f"处理文件失败 '{os.path.basename(path)}': {value}")
+    return contents
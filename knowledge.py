@@ -0,0 +1,185 @@
+import os
+import sqlite3
+import hashlib
+
+try:
+    from .stream import estimate_tokens
+    from .search import tokenize
+except ImportError:
+    from stream import estimate_tokens
+    from search import tokenize
+
+MAX_QUERY_CHARS = 4000  # 问题中带有文件内容时只取开头部分检索
+MAX_QUERY_TERMS = 100   # 检索时最多使用的查询词数
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(
+    body, content='', tokenize='unicode61 remove_diacritics 0'
+);
+'''
+
+def split_sections(text, marker=None, max_tokens=1000):
+    """按分隔符切分背景知识；过长的部分再按空行分段，每段不超过 max_tokens"""
+    parts = text.split(marker) if marker else [text]
+    sections = []
+    for part in parts:
+        if not part.strip():
+            continue
+        if estimate_tokens(part) <= max_tokens:
+            sections.append(part.strip())
+            continue
+        current, current_tokens = [], 0
+        for paragraph in part.split('\n\n'):
+            if not paragraph.strip():
+                continue
+            tokens = estimate_tokens(paragraph)
+            if current and current_tokens + tokens > max_tokens:
+                sections.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(paragraph.strip())
+            current_tokens += tokens
+        if current:
+            sections.append('\n\n'.join(current))
+    return sections
+
+class KnowledgeIndex:
+    """背景知识的检索索引（SQLite FTS5 + BM25）
+
+    源文件的修改时间或大小变化时重新切分，只对新增或改动的部分更新索引；
+    每次提问只选取最相关的若干部分，而不是发送全部背景知识。
+    """
+
+    def __init__(self, path, source, marker=None, section_tokens=1000):
+        self.path = path
+        self.source = source
+        self.marker = marker
+        self.section_tokens = section_tokens
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._unique_digests()
+
+    def _unique_digests(self):
+        """为 sections.digest 建唯一索引；之前并发同步可能已写入重复的部分，先删除"""
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sections_digest'").fetchone():
+            return
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            duplicates = self.conn.execute(
+                'SELECT id, body FROM sections WHERE id NOT IN '
+                '(SELECT MIN(id) FROM sections GROUP BY digest)').fetchall()
+            for rowid, body in duplicates:
+                self._delete(rowid, body)
+            self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS sections_digest ON sections (digest)')
+
+    def _delete(self, rowid, body):
+        # 无正文的 FTS5 表需要用原来的词删除
+        self.conn.execute("INSERT INTO terms (terms, rowid, body) VALUES ('delete', ?, ?)",
+                          (rowid, ' '.join(tokenize(body))))
+        self.conn.execute('DELETE FROM sections WHERE id = ?', (rowid,))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _meta(self, name):
+        row = self.conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self):
+        """源文件有变化时增量更新索引，返回新增和删除的部分数
+
+        签名和已有部分在 IMMEDIATE 事务内重新读取，多个进程同时启动时只有一个更新，
+        其余发现签名已是最新后直接返回。
+        """
+        try:
+            stat = os.stat(self.source)
+            signature = f'{stat.st_mtime_ns}:{stat.st_size}:{self.marker}:{self.section_tokens}'
+        except OSError:
+            signature = 'missing'
+        if signature == self._meta('signature'):
+            return 0, 0
+
+        sections = []
+        if signature != 'missing':
+            with open(self.source, 'r', encoding='utf-8', errors='ignore') as f:
+                sections = split_sections(f.read(), self.marker, self.section_tokens)
+        wanted = {}
+        for position, body in enumerate(sections):
+            wanted.setdefault(hashlib.sha256(body.encode('utf-8')).hexdigest(), (position, body))
+
+        added = removed = 0
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if signature == self._meta('signature'):
+                return 0, 0  # 其他进程已经更新
+            existing = dict(self.conn.execute('SELECT digest, id FROM sections').fetchall())
+            for digest, rowid in existing.items():
+                if digest not in wanted:
+                    body = self.conn.execute('SELECT body FROM sections WHERE id = ?',
+                                             (rowid,)).fetchone()[0]
+                    self._delete(rowid, body)
+                    removed += 1
+            for digest, (position, body) in wanted.items():
+                if digest in existing:
+                    self.conn.execute('UPDATE sections SET position = ? WHERE digest = ?',
+                                      (position, digest))
+                    continue
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO sections (position, digest, tokens, body) VALUES (?, ?, ?, ?)',
+                    (position, digest, estimate_tokens(body), body))
+                if cursor.rowcount:
+                    self.conn.execute('INSERT INTO terms (rowid, body) VALUES (?, ?)',
+                                      (cursor.lastrowid, ' '.join(tokenize(body))))
+                    added += 1
+            self.conn.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+                              ('signature', signature))
+        return added, removed
+
+    def total_tokens(self):
+        return self.conn.execute('SELECT COALESCE(SUM(tokens), 0) FROM sections').fetchone()[0]
+
+    def all_sections(self):
+        return [row[0] for row in self.conn.execute('SELECT body FROM sections ORDER BY position')]
+
+    def search(self, query, limit=5):
+        """按 BM25 相关度返回 (正文, tokens)，任一检索词命中即可"""
+        tokens = list(dict.fromkeys(tokenize(query[:MAX_QUERY_CHARS])))[:MAX_QUERY_TERMS]
+        terms = ['"%s"' % token.replace('"', '') for token in tokens]
+        if not terms:
+            return []
+        return self.conn.execute(
+            'SELECT sections.body, sections.tokens FROM terms JOIN sections ON sections.id = terms.rowid '
+            'WHERE terms MATCH ? ORDER BY bm25(terms) LIMIT ?',
+            (' OR '.join(terms), limit)
+        ).fetchall()
+
+    def select(self, query, top_k=5, budget=4000, whole=None):
+        """选取与问题最相关的部分，总量不超过 budget；全部内容不超过 whole（默认为 budget）时直接全部返回"""
+        self.sync()
+        if self.total_tokens() <= max(budget, whole or 0):
+            return self.all_sections()
+        selected, used = [], 0
+        for body, tokens in self.search(query, top_k):
+            if used + tokens <= budget:
+                selected.append(body)
+                used += tokens
+        return selected
@@ -0,0 +1,263 @@
+import os
+import gzip
+import json
+import stat
+import time
+import atexit
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，不加锁
+    fcntl = None
+
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+_sync_lock = threading.Lock()
+_last_sync = {}   # 路径 -> 上次 fsync 时间
+_pending = set()  # 已写入但尚未 fsync 的路径（退出时补做）
+
+def _flush_pending():
+    with _sync_lock:
+        paths = list(_pending)
+        _pending.clear()
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+atexit.register(_flush_pending)
+
+def _sync(fd, path, policy, interval):
+    """按策略 fsync：always 每条都同步；batch 同一文件至多每 interval 秒同步一次，其余留到退出时"""
+    if policy == 'never':
+        return
+    now = time.monotonic()
+    with _sync_lock:
+        due = policy == 'always' or now - _last_sync.get(path, 0.0) >= interval
+        if due:
+            _last_sync[path] = now
+            _pending.discard(path)
+        else:
+            _pending.add(path)
+    if due:
+        os.fsync(fd)
+
+class Rotation:
+    """日志轮转设置，0 表示不限制
+
+    活动文件超过 max_bytes 或已使用 max_days 天时压缩为 gzip 分段；
+    分段总大小超过 max_total_bytes 时删除最早的分段（至少保留最新的一段）。
+    """
+
+    def __init__(self, max_bytes=0, max_days=0, max_total_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+        self.max_total_bytes = max_total_bytes
+
+    def due(self, size, adding, created):
+        if size == 0:
+            return False
+        if self.max_bytes and size + adding > self.max_bytes:
+            return True
+        return bool(self.max_days and created and time.time() - created > self.max_days * 86400)
+
+def manifest_path(path):
+    return path + '.manifest.json'
+
+def load_manifest(path):
+    """读取分段清单；偏移量为逻辑偏移（从第一条记录算起，轮转后不变）
+
+    segments: [{file, start, bytes, disk, created, closed}]，按时间顺序；
+    active_start: 活动文件第一个字节的逻辑偏移。
+    """
+    try:
+        with open(manifest_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'segments': [], 'active_start': 0, 'active_created': None, 'next': 1}
+
+def _save_manifest(path, manifest):
+    tmp_path = manifest_path(path) + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path(path))
+
+def _open_locked(path, mode):
+    """打开并锁定当前的活动文件；等待期间文件被其他进程轮转时重新打开"""
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, mode)
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+def _rotate(path, manifest, size, rotation):
+    """（持锁）把活动文件压缩为新的分段，按总大小删除最早的分段"""
+    segment = f"{os.path.basename(path)}.{manifest['next']}.gz"
+    segment_path = os.path.join(os.path.dirname(path), segment)
+    fd = os.open(segment_path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(path, 'rb') as source, os.fdopen(fd, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(segment_path + '.tmp', segment_path)
+
+    now = time.time()
+    manifest['segments'].append({
+        'file': segment, 'start': manifest['active_start'], 'bytes': size,
+        'disk': os.path.getsize(segment_path), 'created': manifest.get('active_created'),
+        'closed': now
+    })
+    manifest['next'] += 1
+    manifest['active_start'] += size
+    manifest['active_created'] = now
+
+    segments = manifest['segments']
+    if rotation.max_total_bytes:
+        while len(segments) > 1 and sum(s['disk'] for s in segments) > rotation.max_total_bytes:
+            oldest = segments.pop(0)
+            try:
+                os.remove(os.path.join(os.path.dirname(path), oldest['file']))
+            except FileNotFoundError:
+                pass
+    # 先写清单再删除活动文件，等待中的进程重新打开时已能读到新的起始偏移
+    _save_manifest(path, manifest)
+    os.remove(path)
+
+def append_record(path, content, mode=0o600, fsync='batch', interval=1.0, rotation=None):
+    """在文件锁内追加一条完整记录，返回 (逻辑偏移量, 字节数)
+
+    偏移量在持锁后取得，并发写入时也与记录的实际位置一致；写入中途失败时
+    截断回记录开头，不留下半条记录。新文件按 mode 创建，已有文件对其他用户
+    可读时收紧一次权限。rotation 为 Rotation 时按需轮转，偏移量仍可用
+    read_record 读取。
+    """
+    data = content.encode('utf-8')
+    fd = _open_locked(path, mode)
+    try:
+        if mode is not None and stat.S_IMODE(os.fstat(fd).st_mode) & ~mode:
+            os.fchmod(fd, mode)
+        offset = os.lseek(fd, 0, os.SEEK_END)
+        manifest = None
+        if rotation is not None:
+            manifest = load_manifest(path)
+            if manifest['active_created'] is None:
+                manifest['active_created'] = time.time()
+                _save_manifest(path, manifest)
+            if rotation.due(offset, len(data), manifest['active_created']):
+                _rotate(path, manifest, offset, rotation)
+                os.close(fd)
+                fd = _open_locked(path, mode)
+                offset = os.lseek(fd, 0, os.SEEK_END)
+                manifest = load_manifest(path)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except BaseException:
+            os.ftruncate(fd, offset)
+            raise
+        _sync(fd, path, fsync, interval)
+        if manifest is None:
+            # 未启用轮转，但之前可能轮转过
+            manifest = load_manifest(path)
+    finally:
+        os.close(fd)
+    return manifest['active_start'] + offset, len(data)
+
+def read_record(source, offset, length):
+    """按逻辑偏移量读取原始记录（已轮转的从 gzip 分段读取），已删除或无法读取时返回 None"""
+    return read_records([(source, offset, length)])[0]
+
+def read_records(requests):
+    """批量读取 [(source, 逻辑偏移量, 字节数)]，按原顺序返回记录文本（无法读取时为 None）
+
+    gzip 分段只能从头解压，同一分段中的多条记录按偏移量排序后在一次顺序读取中取出，
+    每个分段（和活动文件）只打开一次。
+    """
+    results = [None] * len(requests)
+    manifests = {}
+    groups = {}  # (source, 分段文件或 None, 分段起点) -> [(偏移量, 字节数, 序号)]
+    for index, (source, offset, length) in enumerate(requests):
+        if source not in manifests:
+            manifests[source] = load_manifest(source)
+        manifest = manifests[source]
+        if offset >= manifest['active_start']:
+            key = (source, None, manifest['active_start'])
+        else:
+            for segment in manifest['segments']:
+                if segment['start'] <= offset < segment['start'] + segment['bytes']:
+                    key = (source, segment['file'], segment['start'])
+                    break
+            else:
+                continue  # 所在分段已按总大小上限删除
+        groups.setdefault(key, []).append((offset, length, index))
+    for (source, segment, start), reads in groups.items():
+        try:
+            if segment is None:
+                f = open(source, 'rb')
+            else:
+                f = gzip.open(os.path.join(os.path.dirname(source), segment), 'rb')
+            with f:
+                for offset, length, index in sorted(reads):
+                    f.seek(offset - start)
+                    results[index] = f.read(length).decode('utf-8', errors='ignore')
+        except (OSError, EOFError):
+            continue
+    return results
+
+def iter_log(path, block_size=1024 * 1024, offset=0):
+    """按时间顺序读取全部保留的日志内容（分段和活动文件），逐块返回 (逻辑偏移量, 数据)
+
+    offset 为逻辑偏移量时从该处开始，跳过之前的分段。
+    """
+    manifest = load_manifest(path)
+    folder = os.path.dirname(path)
+    sources = [(s['start'], s['bytes'], os.path.join(folder, s['file']), gzip.open)
+               for s in manifest['segments']]
+    sources.append((manifest['active_start'], None, path, open))
+    for start, size, source, opener in sources:
+        if size is not None and start + size <= offset:
+            continue
+        try:
+            f = opener(source, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            if offset > start:
+                f.seek(offset - start)
+                start = offset
+            for block in iter(lambda: f.read(block_size), b''):
+                yield start, block
+                start += len(block)
+
+def log_size(path):
+    """日志的逻辑长度（已轮转的分段加活动文件），即下一条记录的逻辑偏移量"""
+    try:
+        active = os.path.getsize(path)
+    except OSError:
+        active = 0
+    return load_manifest(path)['active_start'] + active
+
+def disk_usage(path):
+    """日志占用的磁盘空间：(活动文件字节数, 分段数, 分段字节数)"""
+    try:
+        active = os.path.getsize(path)
+    except OSError:
+        active = 0
+    segments = load_manifest(path)['segments']
+    return active, len(segments), sum(s['disk'] for s in segments)
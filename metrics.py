@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+
+GAP_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000)  # 增量间隔直方图的上界(毫秒)，最后一档为更长
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+_write_lock = threading.Lock()
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def _usage_value(usage, name):
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value) if value is not None else None
+
+def _cached_tokens(usage):
+    """输入中由上下文缓存提供的 tokens：Moonshot 放在 cached_tokens，OpenAI 放在 prompt_tokens_details 中"""
+    value = _usage_value(usage, 'cached_tokens')
+    if value is None:
+        details = usage.get('prompt_tokens_details') if isinstance(usage, dict) else getattr(
+            usage, 'prompt_tokens_details', None)
+        if details:
+            value = _usage_value(details, 'cached_tokens')
+    return value
+
+class RequestMetrics:
+    """一次请求的耗时和吞吐：首字耗时、增量间隔分布、总耗时和 token 用量"""
+
+    def __init__(self, kind, model=None):
+        self.kind = kind
+        self.model = model
+        self.client_init = None  # 本次请求中创建客户端的耗时(秒)
+        self.start = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.gaps = [0] * (len(GAP_BUCKETS_MS) + 1)
+        self.max_gap = 0.0
+        self.chars = 0
+        self.chunks = 0
+        self._usage = {}  # 尝试序号 -> (输入 tokens, 输出 tokens, 缓存命中 tokens)，重试和续写的用量累加
+        self.attempts = 1
+        self.cancelled = False
+        self.error = None
+        self.total = None
+        self.extra = {}
+
+    def begin(self):
+        """从此刻开始计时（客户端创建完成后调用）"""
+        self.start = time.perf_counter()
+
+    def chunk(self, content):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            gap = (now - self.last) * 1000
+            self.gaps[bisect.bisect_right(GAP_BUCKETS_MS, gap)] += 1
+            self.max_gap = max(self.max_gap, gap)
+        self.last = now
+        self.chars += len(content)
+        self.chunks += 1
+
+    def usage(self, usage):
+        """记录本次尝试中 API 返回的 token 用量（对象或字典）"""
+        self._usage[self.attempts] = (_usage_value(usage, 'prompt_tokens'),
+                                      _usage_value(usage, 'completion_tokens'),
+                                      _cached_tokens(usage))
+
+    def _tokens(self, index):
+        values = [usage[index] for usage in self._usage.values() if usage[index] is not None]
+        return sum(values) if values else None
+
+    @property
+    def prompt_tokens(self):
+        return self._tokens(0)
+
+    @property
+    def completion_tokens(self):
+        return self._tokens(1)
+
+    @property
+    def cached_tokens(self):
+        return self._tokens(2)
+
+    def finish(self, error=None):
+        self.total = time.perf_counter() - self.start
+        if error is not None:
+            self.error = str(error)
+        return self
+
+    def record(self):
+        """可写入统计文件的字典"""
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        ttft = self.first - self.start if self.first is not None else None
+        streaming = total - ttft if ttft is not None else None
+        completion_tokens = self.completion_tokens
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'kind': self.kind, 'model': self.model,
+            'client_init': self.client_init, 'ttft': ttft, 'total': total,
+            'chars': self.chars, 'chunks': self.chunks,
+            'chars_per_second': self.chars / streaming if streaming else None,
+            'tokens_per_second': (completion_tokens / streaming
+                                  if streaming and completion_tokens else None),
+            'prompt_tokens': self.prompt_tokens, 'completion_tokens': completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'gaps': self.gaps, 'max_gap_ms': round(self.max_gap, 1),
+            'attempts': self.attempts, 'cancelled': self.cancelled, 'error': self.error,
+        }
+        record.update(self.extra)
+        return record
+
+def append_metrics(path, record, max_bytes=DEFAULT_MAX_BYTES):
+    """追加一条记录（JSON Lines）；文件超过 max_bytes 时只保留较新的一半"""
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with _write_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            size = f.tell()
+        if size > max_bytes:
+            with open(path, 'r', encoding='utf-8') as f:
+                f.seek(size - max_bytes // 2)
+                f.readline()  # 跳过不完整的行
+                keep = f.read()
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(keep)
+            os.replace(tmp_path, path)
+
+def save_metrics(path, metrics, max_bytes=DEFAULT_MAX_BYTES):
+    """写入统计文件，失败时只打印提示"""
+    try:
+        append_metrics(path, metrics.record(), max_bytes)
+    except Exception as e:
+        print(f"写入请求统计失败: {e}")
+
+def load_metrics(path, last=None):
+    """读取最近 last 条记录"""
+    records = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records[-last:] if last else records
+
+def _row(values, label, unit, scale=1.0, digits=2):
+    values = [v * scale for v in values if v is not None]
+    if not values:
+        return
+    cells = ''.join(f"{percentile(values, p):>10.{digits}f}" for p in (50, 95, 99))
+    print(f"  {cells}  {label}{f'({unit})' if unit else ''}")
+
+def print_metrics(records, title="请求耗时统计"):
+    """按类型和模型打印 p50/p95/p99"""
+    if not records:
+        print("暂无请求统计")
+        return
+    groups = {}
+    for record in records:
+        groups.setdefault((record.get('kind'), record.get('model')), []).append(record)
+
+    print(f"\n{title}（最近 {len(records)} 次）:")
+    for (kind, model), items in sorted(groups.items(), key=lambda g: (str(g[0][0]), str(g[0][1]))):
+        failed = sum(1 for r in items if r.get('error'))
+        cancelled = sum(1 for r in items if r.get('cancelled'))
+        retried = sum(max(0, (r.get('attempts') or 1) - 1) for r in items)
+        print(f"\n[{kind}] {model or '-'}  请求 {len(items)}，失败 {failed}，"
+              f"中断 {cancelled}，重试 {retried}")
+        print(f"  {'p50':>10}{'p95':>10}{'p99':>10}")
+        ok = [r for r in items if not r.get('error')]
+        _row([r.get('client_init') for r in items], '客户端创建', 'ms', 1000, 1)
+        _row([r.get('ttft') for r in ok], '首字耗时', '秒')
+        _row([r.get('total') for r in ok], '总耗时', '秒')
+        _row([r.get('max_gap_ms') for r in ok if r.get('chunks')], '最大增量间隔', 'ms', 1, 1)
+        _row([r.get('chars_per_second') for r in ok], '字符/秒', '', 1, 0)
+        _row([r.get('tokens_per_second') for r in ok], 'tokens/秒', '', 1, 0)
+        _row([r.get('bytes') for r in ok if r.get('bytes') is not None], '文件大小', 'KB', 1 / 1024, 0)
+        paged = [r for r in ok if r.get('pages') is not None]
+        if paged:
+            print(f"  页数: 共 {sum(r['pages'] for r in paged)}，"
+                  f"远程提取 {sum(r.get('remote_pages') or 0 for r in paged)}")
+
+        prompt = [r['prompt_tokens'] for r in ok if r.get('prompt_tokens') is not None]
+        completion = [r['completion_tokens'] for r in ok if r.get('completion_tokens') is not None]
+        if prompt or completion:
+            print(f"  tokens: 输入 {sum(prompt)}（平均 {sum(prompt) / max(1, len(prompt)):.0f}），"
+                  f"输出 {sum(completion)}（平均 {sum(completion) / max(1, len(completion)):.0f}）")
+        cached = sum(r.get('cached_tokens') or 0 for r in ok)
+        if cached:
+            hits = sum(1 for r in ok if r.get('cached_tokens'))
+            print(f"  上下文缓存: {hits} 次请求命中，共 {cached} tokens"
+                  f"（占输入 {cached / max(1, sum(prompt)) * 100:.0f}%）")
+
+        gaps = [0] * (len(GAP_BUCKETS_MS) + 1)
+        for r in ok:
+            for i, count in enumerate(r.get('gaps') or []):
+                if i < len(gaps):
+                    gaps[i] += count
+        total_gaps = sum(gaps)
+        if total_gaps:
+            labels = [f'<{ms}ms' for ms in GAP_BUCKETS_MS] + [f'>={GAP_BUCKETS_MS[-1]}ms']
+            print("  增量间隔分布: " + '  '.join(
+                f"{label} {count / total_gaps * 100:.0f}%"
+                for label, count in zip(labels, gaps) if count))
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""本地模拟的 OpenAI 兼容服务，用于离线测试和基准测试
+
+  python3 mock_server.py --port 8765 --ttft 0.3 --rate 200
+  MOONSHOT_BASE_URL=http://127.0.0.1:8765/v1 MOONSHOT_API_KEY=test python3 ai.py "你好"
+
+GET /stats 返回收到的连接数和请求数，可用于验证连接复用；图文消息中的图片数和字节数也计入统计。
+/v1/files 模拟文件上传、提取和删除，--file-delay 控制每个文件的提取耗时。
+--fail-every / --drop-every 按固定间隔注入错误响应或中途断开的流，用于测试重试。
+/v1/caching 模拟 Moonshot 上下文缓存：对话消息以 role=cache 引用缓存时，缓存部分不计入
+--prompt-rate 模拟的输入处理耗时，usage 中返回 cached_tokens。
+--cache-build 大于 0 时新建的缓存先返回 pending，经过该秒数后才变为 ready，之前引用会返回错误。
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_ANSWER = '这是模拟服务返回的回答。' * 20
+
+
+class MockOptions:
+    """模拟服务参数"""
+
+    def __init__(self, ttft=0.2, rate=200.0, chunk_chars=4, answer=DEFAULT_ANSWER,
+                 file_delay=0.5, file_delay_per_mb=0.0, model_ttft=None,
+                 fail_every=0, fail_status=429, retry_after=None, drop_every=0, prompt_rate=0.0,
+                 cache_build=0.0):
+        self.ttft = ttft                # 首个 token 延迟(秒)
+        self.rate = rate                # 每秒输出字符数
+        self.chunk_chars = chunk_chars  # 每个增量的字符数
+        self.answer = answer
+        self.file_delay = file_delay                # 每个文件的提取耗时(秒)
+        self.file_delay_per_mb = file_delay_per_mb  # 每 MB 额外的提取耗时(秒)
+        self.model_ttft = model_ttft or {}          # 按模型指定的首个 token 延迟
+        self.fail_every = fail_every    # 每 N 个对话请求返回一次 fail_status（0 表示不注入）
+        self.fail_status = fail_status
+        self.retry_after = retry_after  # 错误响应的 Retry-After 头(秒)
+        self.drop_every = drop_every    # 每 N 个流式请求在输出一半时断开连接
+        self.prompt_rate = prompt_rate  # 每秒处理的输入 tokens，首个 token 前按未缓存的输入计时（0 表示不计）
+        self.cache_build = cache_build  # 新建的缓存处于 pending 状态的秒数（0 表示创建时直接 ready）
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # 每个处理器实例对应一个 TCP 连接
+        with self.server.lock:
+            self.server.stats['connections'] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else {}
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json({'error': {'message': 'not found'}}, 404)
+
+    def _file_id(self):
+        """从 /v1/files/<id>[/content] 中取出文件 ID"""
+        match = re.search(r'/files/([^/?]+)', self.path)
+        return match.group(1) if match else None
+
+    def _cache_id(self):
+        """从 /v1/caching/<id> 中取出缓存 ID"""
+        match = re.search(r'/caching/([^/?]+)', self.path)
+        return match.group(1) if match else None
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/stats':
+            with self.server.lock:
+                self._send_json(dict(self.server.stats))
+        elif '/caching/' in path:
+            with self.server.lock:
+                self.server.stats['requests'] += 1
+                entry = self.server.live_cache(self._cache_id())
+            if entry is None:
+                self._not_found()
+            else:
+                self._send_json(self._cache_object(entry))
+        elif path.endswith('/content'):
+            with self.server.lock:
+                self.server.stats['requests'] += 1
+                entry = self.server.files.get(self._file_id())
+            if entry is None:
+                self._not_found()
+                return
+            body = entry['content'].encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+        if self.path.rstrip('/').endswith('/files'):
+            self._upload()
+            return
+        request = self._read_json()
+        if self.path.rstrip('/').endswith('/chat/completions'):
+            self._chat(request)
+        elif self.path.rstrip('/').endswith('/caching'):
+            self._create_cache(request)
+        else:
+            self._not_found()
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+            if '/caching/' in self.path:
+                entry = self.server.caches.pop(self._cache_id(), None)
+                kind = 'context_cache.object'
+            else:
+                entry = self.server.files.pop(self._file_id(), None)
+                kind = 'file'
+        if entry is None:
+            self._not_found()
+        else:
+            self._send_json({'id': entry['id'], 'object': kind, 'deleted': True})
+
+    def _cache_object(self, entry):
+        status = 'ready' if time.time() >= entry['ready'] else 'pending'
+        return {'id': entry['id'], 'object': 'context_cache.object', 'status': status,
+                'model': entry['model'], 'tokens': entry['tokens'],
+                'created_at': int(entry['created']), 'expired_at': int(entry['expires'])}
+
+    def _create_cache(self, request):
+        """创建上下文缓存：处理缓存内容的耗时与普通请求的输入相同；cache_build 时立即返回 pending"""
+        messages = request.get('messages') or []
+        tokens = self._prompt_tokens(messages)
+        build = self.server.options.cache_build
+        if self.server.options.prompt_rate and not build:
+            time.sleep(tokens / self.server.options.prompt_rate)
+        now = time.time()
+        with self.server.lock:
+            self.server.stats['caches'] += 1
+            cache_id = f"cache-mock-{self.server.stats['caches']}"
+            entry = self.server.caches[cache_id] = {
+                'id': cache_id, 'model': request.get('model'), 'messages': messages,
+                'tokens': tokens, 'ttl': request.get('ttl') or 300, 'created': now, 'ready': now + build,
+                'expires': now + (request.get('ttl') or 300)
+            }
+        self._send_json(self._cache_object(entry))
+
+    def _prompt_tokens(self, messages):
+        """按字符数估算输入 tokens（图片按固定值计），同时统计收到的图片"""
+        prompt_chars = 0
+        for message in messages:
+            content = message.get('content', '')
+            if isinstance(content, list):
+                # 图文消息：图片按固定 tokens 计，记录收到的图片数和 data URL 字节数
+                for part in content:
+                    if part.get('type') == 'image_url':
+                        url = part.get('image_url', {}).get('url', '')
+                        with self.server.lock:
+                            self.server.stats['images'] += 1
+                            self.server.stats['image_bytes'] += len(url)
+                        prompt_chars += 1024
+                    else:
+                        prompt_chars += len(part.get('text', ''))
+            else:
+                prompt_chars += len(str(content))
+        return prompt_chars
+
+    def _upload(self):
+        """接收 multipart 上传，按配置的耗时模拟提取"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        match = re.search(rb'filename="([^"]*)"', body)
+        filename = match.group(1).decode('utf-8', errors='ignore') if match else 'upload'
+        options = self.server.options
+        time.sleep(options.file_delay + length / 1024 / 1024 * options.file_delay_per_mb)
+
+        with self.server.lock:
+            self.server.stats['files'] += 1
+            file_id = f"file-mock-{self.server.stats['files']}"
+            self.server.files[file_id] = {
+                'id': file_id,
+                'content': f'文件 {filename} 的模拟提取内容（{length} 字节）'
+            }
+        self._send_json({
+            'id': file_id, 'object': 'file', 'bytes': length, 'created_at': int(time.time()),
+            'filename': filename, 'purpose': 'file-extract', 'status': 'ok'
+        })
+
+    def _chunk(self, request, delta, finish_reason=None, usage=None):
+        payload = {
+            'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk',
+            'created': int(time.time()), 'model': request.get('model', 'mock'),
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+        if usage:
+            payload['usage'] = usage
+        return payload
+
+    def _write_event(self, payload):
+        data = b'data: ' + json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _chat(self, request):
+        options = self.server.options
+        with self.server.lock:
+            self.server.stats['chats'] += 1
+            count = self.server.stats['chats']
+        if options.fail_every and count % options.fail_every == 0:
+            with self.server.lock:
+                self.server.stats['errors'] += 1
+            headers = {}
+            if options.retry_after is not None:
+                headers['Retry-After'] = f'{options.retry_after:g}'
+            self._send_json({'error': {'message': f'injected error {options.fail_status}',
+                                       'type': 'mock_error'}},
+                            options.fail_status, headers)
+            return
+        drop = bool(options.drop_every and request.get('stream')
+                    and count % options.drop_every == 0)
+
+        answer = options.answer
+        messages = request.get('messages') or [{}]
+        if messages[-1].get('partial') and answer.startswith(messages[-1].get('content', '')):
+            # partial 模式：从已有内容之后继续
+            answer = answer[len(messages[-1]['content']):]
+        cached = 0
+        while messages and messages[0].get('role') == 'cache':
+            # 以 role=cache 开头的消息引用已创建的上下文缓存，reset_ttl 为其续期
+            fields = dict(item.partition('=')[::2]
+                          for item in str(messages[0].get('content', '')).split(';'))
+            with self.server.lock:
+                entry = self.server.live_cache(fields.get('cache_id'))
+                if entry is not None and fields.get('reset_ttl'):
+                    entry['expires'] = time.time() + float(fields['reset_ttl'])
+            if entry is None:
+                self._send_json({'error': {'message': f"cache {fields.get('cache_id')} not found",
+                                           'type': 'resource_not_found_error'}}, 404)
+                return
+            if time.time() < entry['ready']:
+                self._send_json({'error': {'message': f"cache {entry['id']} is not ready",
+                                           'type': 'invalid_request_error'}}, 400)
+                return
+            cached += entry['tokens']
+            messages = messages[1:]
+        prompt = self._prompt_tokens(messages)
+        usage = {'prompt_tokens': cached + prompt, 'completion_tokens': len(answer),
+                 'total_tokens': cached + prompt + len(answer)}
+        if cached:
+            usage['cached_tokens'] = cached
+            with self.server.lock:
+                self.server.stats['cached_tokens'] += cached
+        ttft = options.model_ttft.get(request.get('model'), options.ttft)
+        if options.prompt_rate:
+            ttft += prompt / options.prompt_rate
+
+        if not request.get('stream'):
+            time.sleep(ttft + len(answer) / options.rate)
+            self._send_json({
+                'id': 'chatcmpl-mock', 'object': 'chat.completion',
+                'created': int(time.time()), 'model': request.get('model', 'mock'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': answer}}],
+                'usage': usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(ttft)
+        self._write_event(self._chunk(request, {'role': 'assistant', 'content': ''}))
+        step = options.chunk_chars
+        for i in range(0, len(answer), step):
+            if drop and i >= len(answer) // 2:
+                # 不发送结束块直接断开，模拟网络中断
+                with self.server.lock:
+                    self.server.stats['drops'] += 1
+                self.close_connection = True
+                return
+            self._write_event(self._chunk(request, {'content': answer[i:i + step]}))
+            time.sleep(step / options.rate)
+        self._write_event(self._chunk(request, {}, 'stop', usage))
+        data = b'data: [DONE]\n\n'
+        self.wfile.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options=None):
+        self.options = options or MockOptions()
+        self.lock = threading.Lock()
+        self.stats = {'connections': 0, 'requests': 0, 'files': 0, 'chats': 0,
+                      'errors': 0, 'drops': 0, 'images': 0, 'image_bytes': 0,
+                      'caches': 0, 'cached_tokens': 0}
+        self.files = {}  # 文件 ID -> 上传信息
+        self.caches = {}  # 缓存 ID -> 缓存内容
+        super().__init__(address, MockHandler)
+
+    def live_cache(self, cache_id):
+        """（持锁调用）返回未过期的缓存，已过期的删除"""
+        entry = self.caches.get(cache_id)
+        if entry is not None and entry['expires'] < time.time():
+            del self.caches[cache_id]
+            entry = None
+        return entry
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+
+def start_in_thread(options=None, host='127.0.0.1', port=0):
+    """在后台线程启动模拟服务，返回服务对象（port=0 时自动分配端口）"""
+    server = MockServer((host, port), options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟的 OpenAI 兼容服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ttft', type=float, default=0.2, help='首个 token 延迟(秒)')
+    parser.add_argument('--rate', type=float, default=200.0, help='每秒输出字符数')
+    parser.add_argument('--chunk-chars', type=int, default=4, help='每个增量的字符数')
+    parser.add_argument('--file-delay', type=float, default=0.5, help='每个文件的提取耗时(秒)')
+    parser.add_argument('--file-delay-per-mb', type=float, default=0.0,
+                        help='每 MB 额外的提取耗时(秒)')
+    parser.add_argument('--model-ttft', default='',
+                        help='按模型指定首个 token 延迟，如 kimi-latest=0.5,moonshot-v1-8k=0.1')
+    parser.add_argument('--fail-every', type=int, default=0,
+                        help='每 N 个对话请求返回一次错误（0 表示不注入）')
+    parser.add_argument('--fail-status', type=int, default=429, help='注入错误的状态码')
+    parser.add_argument('--retry-after', type=float, default=None,
+                        help='注入错误时返回的 Retry-After(秒)')
+    parser.add_argument('--drop-every', type=int, default=0,
+                        help='每 N 个流式请求在输出一半时断开连接')
+    parser.add_argument('--prompt-rate', type=float, default=0.0,
+                        help='每秒处理的输入 tokens，未缓存的输入按此计入首个 token 延迟（0 表示不计）')
+    parser.add_argument('--cache-build', type=float, default=0.0,
+                        help='新建的上下文缓存先处于 pending 状态的秒数（0 表示创建时直接 ready）')
+    args = parser.parse_args()
+
+    model_ttft = {}
+    for item in filter(None, args.model_ttft.split(',')):
+        model, _, seconds = item.partition('=')
+        model_ttft[model.strip()] = float(seconds)
+    options = MockOptions(args.ttft, args.rate, args.chunk_chars,
+                          file_delay=args.file_delay, file_delay_per_mb=args.file_delay_per_mb,
+                          model_ttft=model_ttft, fail_every=args.fail_every,
+                          fail_status=args.fail_status, retry_after=args.retry_after,
+                          drop_every=args.drop_every, prompt_rate=args.prompt_rate,
+                          cache_build=args.cache_build)
+    server = MockServer((args.host, args.port), options)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
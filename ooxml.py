@@ -0,0 +1,180 @@
+import re
+import zipfile
+import functools
+import posixpath
+import xml.etree.ElementTree as ET
+
+OOXML_TYPES = ('.docx', '.xlsx', '.pptx')
+
+_R_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_PROPERTIES = ('pPr', 'tabs', 'tabLst')
+
+def _name(tag):
+    """去掉命名空间的标签名（兼容 strict 和 transitional 两种命名空间）"""
+    return tag.rsplit('}', 1)[-1]
+
+def _iterparse(archive, member, events=('end',)):
+    with archive.open(member) as f:
+        yield from ET.iterparse(f, events)
+
+def _relationships(archive, rels_member):
+    """读取 .rels 文件：关系 ID -> 包内路径"""
+    if rels_member not in archive.namelist():
+        return {}
+    base = posixpath.dirname(posixpath.dirname(rels_member))
+    targets = {}
+    for _, elem in _iterparse(archive, rels_member):
+        if _name(elem.tag) == 'Relationship':
+            target = elem.get('Target', '')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(base, target))
+            targets[elem.get('Id')] = target
+    return targets
+
+def _paragraphs(archive, member):
+    """逐段读取 Word/PowerPoint 的 XML：段落按行输出，表格每行单元格以 | 分隔"""
+    lines, runs = [], []
+    rows = []   # 每层表格当前行的单元格
+    cells = []  # 每层单元格中的段落
+    properties = 0  # 段落属性（含制表位定义 w:tabs / a:tabLst）中的 tab 不是文字
+    for event, elem in _iterparse(archive, member, ('start', 'end')):
+        name = _name(elem.tag)
+        if event == 'start':
+            if name == 'tr':
+                rows.append([])
+            elif name == 'tc':
+                cells.append([])
+            elif name in _PROPERTIES:
+                properties += 1
+            continue
+        if name in _PROPERTIES:
+            properties -= 1
+        elif name == 't':
+            runs.append(elem.text or '')
+        elif name == 'tab' and not properties:
+            runs.append('\t')
+        elif name in ('br', 'cr'):
+            runs.append('\n')
+        elif name == 'p':
+            (cells[-1] if cells else lines).append(''.join(runs))
+            runs = []
+            elem.clear()
+        elif name == 'tc' and cells:
+            text = ' '.join(p.replace('\n', ' ') for p in cells.pop() if p)
+            if rows:
+                rows[-1].append(text)
+        elif name == 'tr' and rows:
+            # 嵌套表格的行归入外层单元格
+            (cells[-1] if cells else lines).append(' | '.join(rows.pop()))
+            elem.clear()
+        elif name == 'tbl' and not cells:
+            lines.append('')
+            elem.clear()
+    return lines
+
+def _docx(archive):
+    return '\n'.join(_paragraphs(archive, 'word/document.xml')).strip()
+
+def _pptx(archive):
+    """按演示文稿中的顺序输出每张幻灯片的文字和表格"""
+    targets = _relationships(archive, 'ppt/_rels/presentation.xml.rels')
+    slides = [targets[elem.get(_R_ID)]
+              for _, elem in _iterparse(archive, 'ppt/presentation.xml')
+              if _name(elem.tag) == 'sldId' and elem.get(_R_ID) in targets]
+    if not slides:
+        slides = sorted((n for n in archive.namelist() if re.fullmatch(r'ppt/slides/slide\d+\.xml', n)),
+                        key=lambda n: int(re.search(r'\d+', posixpath.basename(n)).group()))
+    parts = []
+    for number, slide in enumerate(slides, 1):
+        lines = [line for line in _paragraphs(archive, slide) if line.strip()]
+        parts.append(f"--- 幻灯片 {number} ---\n" + '\n'.join(lines))
+    return '\n\n'.join(parts)
+
+@functools.lru_cache(maxsize=4096)
+def _column_index(letters):
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings, runs = [], []
+    skip = 0  # 注音（rPh）中的文字不计入
+    for event, elem in _iterparse(archive, 'xl/sharedStrings.xml', ('start', 'end')):
+        name = _name(elem.tag)
+        if name == 'rPh':
+            skip += 1 if event == 'start' else -1
+        elif event == 'end':
+            if name == 't' and not skip:
+                runs.append(elem.text or '')
+            elif name == 'si':
+                strings.append(''.join(runs))
+                runs = []
+                elem.clear()
+    return strings
+
+def _cell_text(cell, strings):
+    kind, value, inline = cell.get('t'), None, []
+    for child in cell:
+        name = _name(child.tag)
+        if name == 'v':
+            value = child.text
+        elif name == 'is':
+            inline.extend(t.text or '' for t in child.iter() if _name(t.tag) == 't')
+    if kind == 's' and value is not None:
+        index = int(value)
+        return strings[index] if index < len(strings) else ''
+    if kind == 'inlineStr':
+        return ''.join(inline)
+    if kind == 'b':
+        return 'TRUE' if value == '1' else 'FALSE'
+    return value or ''
+
+def _sheet_rows(archive, member, strings):
+    """逐行读取工作表（每行读完即释放），按单元格位置补齐空列"""
+    for _, elem in _iterparse(archive, member):
+        if elem.tag != 'row' and not elem.tag.endswith('}row'):
+            continue
+        row = []
+        for cell in elem:
+            ref = cell.get('r')
+            column = _column_index(ref.rstrip('0123456789')) if ref else len(row)
+            row.extend([''] * (column - len(row)))
+            row.append(_cell_text(cell, strings).replace('\n', ' '))
+        elem.clear()
+        while row and not row[-1]:
+            row.pop()
+        if row:
+            yield row
+
+def _xlsx(archive):
+    """每个工作表输出为以 | 分隔的行"""
+    strings = _shared_strings(archive)
+    targets = _relationships(archive, 'xl/_rels/workbook.xml.rels')
+    sheets = [(elem.get('name'), targets.get(elem.get(_R_ID)))
+              for _, elem in _iterparse(archive, 'xl/workbook.xml')
+              if _name(elem.tag) == 'sheet']
+    parts = []
+    for title, member in sheets:
+        if not member or member not in archive.namelist():
+            continue
+        lines = [' | '.join(row) for row in _sheet_rows(archive, member, strings)]
+        parts.append(f"--- 工作表 {title} ---\n" + '\n'.join(lines))
+    return '\n\n'.join(parts)
+
+_EXTRACTORS = {'.docx': _docx, '.xlsx': _xlsx, '.pptx': _pptx}
+
+def extract_text(file_path):
+    """在本地提取 Office 文档（docx/xlsx/pptx）的文字，不整体解析 XML；格式错误时抛出异常"""
+    ext = posixpath.splitext(file_path.replace('\\', '/'))[1].lower()
+    if ext not in _EXTRACTORS:
+        raise ValueError(f"不支持的文档类型: {ext}")
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            return _EXTRACTORS[ext](archive)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise ValueError(f"无法解析 {ext} 文档: {e}") from e
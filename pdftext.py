@@ -0,0 +1,1173 @@
+import os
+import re
+import zlib
+import mmap
+import time
+import shutil
+import tempfile
+import base64
+import binascii
+import unicodedata
+from collections import namedtuple
+
+try:
+    from .ingest import iter_ordered
+except ImportError:
+    from ingest import iter_ordered
+
+SCANNED_MIN_CHARS = 50    # 含有图片且可读文字少于此数的页视为扫描页
+SCANNED_COVERAGE = 0.8    # 图片覆盖页面的比例达到此值时，文字少于 SCANNED_PAGE_CHARS 也视为扫描页
+SCANNED_PAGE_CHARS = 200
+UNDECODED_RATIO = 0.05    # 无法解码的字形占页面字形的比例达到此值（且不少于 UNDECODED_MIN 个）时远程提取
+UNDECODED_MIN = 3
+
+PageText = namedtuple('PageText', 'number text remote')  # remote: 需要远程提取（扫描页或文字无法解码）
+
+class PdfError(ValueError):
+    """无法在本地解析的 PDF（格式损坏、加密或使用了不支持的编码）"""
+
+class Name(str):
+    __slots__ = ()
+
+class Keyword(str):
+    __slots__ = ()
+
+Ref = namedtuple('Ref', 'num gen')
+
+class Stream:
+    """流对象：attrs 为字典部分，raw 为未解码的数据"""
+
+    def __init__(self, attrs, raw):
+        self.attrs = attrs
+        self.raw = raw
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+_END, _ACLOSE, _DCLOSE = object(), object(), object()
+
+_WS = rb'\x00\t\n\x0c\r '
+_DELIM = rb'()<>\[\]{}/%'
+_TOKEN = re.compile(rb'(?:[' + _WS + rb']+|%[^\r\n]*)*(?:'
+                    rb'(?P<num>[+-]?(?:\d+\.?\d*|\.\d+))(?=[' + _WS + _DELIM + rb']|\Z)'
+                    rb'|/(?P<name>[^' + _WS + _DELIM + rb']*)'
+                    rb'|(?P<dopen><<)|(?P<dclose>>>)'
+                    rb'|<(?P<hex>[0-9A-Fa-f' + _WS + rb']*)>'
+                    rb'|(?P<aopen>\[)|(?P<aclose>\])'
+                    rb'|(?P<lit>\()'
+                    rb'|(?P<kw>[^' + _WS + _DELIM + rb']+)'
+                    rb'|(?P<end>\Z)|(?P<junk>.))', re.S)
+_REF_TAIL = re.compile(rb'[' + _WS + rb']+(\d+)[' + _WS + rb']+R(?=[' + _WS + _DELIM + rb']|\Z)')
+_LITERAL_SPECIAL = re.compile(rb'[()\\]')
+_INLINE_END = re.compile(rb'[' + _WS + rb']EI(?=[' + _WS + _DELIM + rb']|\Z)')
+_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+_KEYWORDS = {b'true': True, b'false': False, b'null': None}
+
+class _Parser:
+    """PDF 对象和内容流的词法/语法解析；refs 为 False 时不识别间接引用（内容流中没有）"""
+
+    def __init__(self, data, pos=0, refs=True):
+        self.data = data
+        self.pos = pos
+        self.refs = refs
+
+    def object(self):
+        kind = 'junk'
+        while kind == 'junk':  # 跳过无法识别的单个字节
+            m = _TOKEN.match(self.data, self.pos)
+            self.pos = m.end()
+            kind = m.lastgroup
+        if kind == 'num':
+            text = m.group('num')
+            if b'.' in text:
+                return float(text)
+            value = int(text)
+            if self.refs:
+                ref = _REF_TAIL.match(self.data, self.pos)
+                if ref:
+                    self.pos = ref.end()
+                    return Ref(value, int(ref.group(1)))
+            return value
+        if kind == 'name':
+            raw = m.group('name')
+            if b'#' in raw:
+                raw = re.sub(rb'#([0-9A-Fa-f]{2})', lambda h: bytes([int(h.group(1), 16)]), raw)
+            return Name(raw.decode('latin-1'))
+        if kind == 'kw':
+            word = m.group('kw')
+            if word in _KEYWORDS:
+                return _KEYWORDS[word]
+            return Keyword(word.decode('latin-1'))
+        if kind == 'lit':
+            return self._literal()
+        if kind == 'hex':
+            digits = re.sub(rb'[^0-9A-Fa-f]', b'', m.group('hex'))
+            return binascii.unhexlify(digits + b'0' if len(digits) % 2 else digits)
+        if kind == 'aopen':
+            items = []
+            while True:
+                item = self.object()
+                if item is _ACLOSE or item is _END:
+                    return items
+                if item is not _DCLOSE:
+                    items.append(item)
+        if kind == 'dopen':
+            items = []
+            while True:
+                item = self.object()
+                if item is _DCLOSE or item is _END:
+                    break
+                if item is not _ACLOSE:
+                    items.append(item)
+            return {key: value for key, value in zip(items[::2], items[1::2])
+                    if isinstance(key, Name) and value is not None}
+        if kind == 'aclose':
+            return _ACLOSE
+        if kind == 'dclose':
+            return _DCLOSE
+        return _END
+
+    def _literal(self):
+        data, pos, depth = self.data, self.pos, 1
+        out = bytearray()
+        while True:
+            m = _LITERAL_SPECIAL.search(data, pos)
+            if m is None:
+                out += data[pos:]
+                pos = len(data)
+                break
+            out += data[pos:m.start()]
+            char, pos = data[m.start()], m.end()
+            if char == 0x5c:  # 反斜杠
+                escape = data[pos:pos + 1]
+                pos += 1
+                if escape in _ESCAPES:
+                    out += _ESCAPES[escape]
+                elif escape and escape in b'01234567':
+                    digits = re.match(rb'[0-7]{1,3}', data[pos - 1:pos + 2]).group()
+                    out.append(int(digits, 8) & 0xff)
+                    pos += len(digits) - 1
+                elif escape == b'\r':
+                    if data[pos:pos + 1] == b'\n':
+                        pos += 1
+                elif escape != b'\n':
+                    out += escape
+            elif char == 0x28:
+                depth += 1
+                out.append(char)
+            else:
+                depth -= 1
+                if depth == 0:
+                    break
+                out.append(char)
+        self.pos = pos
+        return bytes(out)
+
+    def skip_inline_image(self):
+        """跳过 ID 之后的内联图片数据"""
+        m = _INLINE_END.search(self.data, self.pos + 1)
+        self.pos = m.end() if m else len(self.data)
+
+def _unpredict(data, parms):
+    """还原 PNG/TIFF 预测器（xref 流和部分图片使用）"""
+    predictor = parms.get('Predictor', 1)
+    if predictor < 2:
+        return data
+    colors = parms.get('Colors', 1)
+    bits = parms.get('BitsPerComponent', 8)
+    columns = parms.get('Columns', 1)
+    bpp = max(1, colors * bits // 8)
+    row_size = (colors * bits * columns + 7) // 8
+    out = bytearray()
+    if predictor == 2:
+        for start in range(0, len(data), row_size):
+            row = bytearray(data[start:start + row_size])
+            for i in range(bpp, len(row)):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+            out += row
+        return bytes(out)
+    previous = bytearray(row_size)
+    for start in range(0, len(data), row_size + 1):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + row_size])
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xff
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xff
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xff
+            elif kind == 4:
+                corner = previous[i - bpp] if i >= bpp else 0
+                p = left + up - corner
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - corner)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else corner)) & 0xff
+        out += row
+        previous = row
+    return bytes(out)
+
+def _lzw(data):
+    table = [bytes([i]) for i in range(256)] + [None, None]
+    out, previous = bytearray(), None
+    buffer = bits = 0
+    width = 9
+    for byte in data:
+        buffer = (buffer << 8) | byte
+        bits += 8
+        while bits >= width:
+            bits -= width
+            code = (buffer >> bits) & ((1 << width) - 1)
+            if code == 256:
+                table, previous, width = table[:258], None, 9
+                continue
+            if code == 257:
+                return bytes(out)
+            if code < len(table):
+                entry = table[code]
+            elif previous is not None:
+                entry = previous + previous[:1]
+            else:
+                raise PdfError('LZW 数据损坏')
+            out += entry
+            if previous is not None:
+                table.append(previous + entry[:1])
+            previous = entry
+            if len(table) + 1 >= 1 << width and width < 12:
+                width += 1
+    return bytes(out)
+
+def _run_length(data):
+    out, i = bytearray(), 0
+    while i < len(data) and data[i] != 128:
+        length = data[i]
+        if length < 128:
+            out += data[i + 1:i + 2 + length]
+            i += length + 2
+        else:
+            out += data[i + 1:i + 2] * (257 - length)
+            i += 2
+    return bytes(out)
+
+def _inflate(data):
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        # 截断或带有多余字节的数据：尽量解出能解的部分
+        return zlib.decompressobj().decompress(data)
+
+def _decode_filter(name, data, parms):
+    if name in ('FlateDecode', 'Fl'):
+        return _unpredict(_inflate(data), parms)
+    if name in ('LZWDecode', 'LZW'):
+        return _unpredict(_lzw(data), parms)
+    if name in ('ASCIIHexDecode', 'AHx'):
+        digits = re.sub(rb'[^0-9A-Fa-f]', b'', data.split(b'>', 1)[0])
+        return binascii.unhexlify(digits + b'0' if len(digits) % 2 else digits)
+    if name in ('ASCII85Decode', 'A85'):
+        data = re.sub(rb'[' + _WS + rb']', b'', data)
+        if data.startswith(b'<~'):
+            data = data[2:]
+        if not data.endswith(b'~>'):
+            data += b'~>'
+        return base64.a85decode(data, adobe=True)
+    if name in ('RunLengthDecode', 'RL'):
+        return _run_length(data)
+    raise PdfError(f'不支持的压缩方式: {name}')
+
+_GLYPHS = dict(item.split(':', 1) for item in (
+    'space: ,exclam:!,quotedbl:",numbersign:#,dollar:$,percent:%,ampersand:&,quotesingle:\','
+    'parenleft:(,parenright:),asterisk:*,plus:+,hyphen:-,period:.,slash:/,colon::,semicolon:;,'
+    'less:<,equal:=,greater:>,question:?,at:@,bracketleft:[,backslash:\\,bracketright:],'
+    'asciicircum:^,underscore:_,grave:`,braceleft:{,bar:|,braceright:},asciitilde:~,'
+    'quoteleft:‘,quoteright:’,quotedblleft:“,quotedblright:”,quotesinglbase:‚,quotedblbase:„,'
+    'endash:–,emdash:—,bullet:•,ellipsis:…,dagger:†,daggerdbl:‡,minus:−,periodcentered:·,'
+    'section:§,paragraph:¶,copyright:©,registered:®,trademark:™,degree:°,multiply:×,divide:÷,'
+    'plusminus:±,guillemotleft:«,guillemotright:»,exclamdown:¡,questiondown:¿,sterling:£,'
+    'yen:¥,Euro:€,cent:¢,germandbls:ß,ae:æ,AE:Æ,oe:œ,OE:Œ,oslash:ø,Oslash:Ø,dotlessi:ı,'
+    'fi:ﬁ,fl:ﬂ,ff:ﬀ,ffi:ﬃ,ffl:ﬄ,nbspace: ,zero:0,one:1,two:2,three:3,four:4,five:5,'
+    'six:6,seven:7,eight:8,nine:9').split(','))
+_GLYPHS['comma'] = ','
+_ACCENTS = {'acute': '́', 'grave': '̀', 'circumflex': '̂', 'dieresis': '̈',
+            'tilde': '̃', 'ring': '̊', 'cedilla': '̧', 'caron': '̌'}
+
+def _glyph_char(name):
+    """按 Adobe 字形名推断字符，无法推断时返回 None"""
+    name = name.split('.', 1)[0]
+    if '_' in name:
+        parts = [_glyph_char(part) for part in name.split('_')]
+        return ''.join(parts) if all(parts) else None
+    if len(name) == 1 and name.isalpha():
+        return name
+    if name in _GLYPHS:
+        return _GLYPHS[name]
+    m = re.fullmatch(r'uni((?:[0-9A-F]{4})+)', name)
+    if m:
+        return ''.join(chr(int(m.group(1)[i:i + 4], 16)) for i in range(0, len(m.group(1)), 4))
+    m = re.fullmatch(r'u([0-9A-F]{4,6})', name)
+    if m:
+        return chr(int(m.group(1), 16))
+    for accent, mark in _ACCENTS.items():
+        if len(name) == len(accent) + 1 and name.endswith(accent):
+            return unicodedata.normalize('NFC', name[0] + mark)
+    return None
+
+def _printable(char):
+    return bool(char) and '�' not in char and not any(ord(c) < 32 for c in char)
+
+class _CMap:
+    """ToUnicode CMap：码字 -> Unicode 文本"""
+
+    def __init__(self, data):
+        self.codespace = []
+        self.chars = {}
+        self.ranges = []  # (起始码, 结束码, 字节数, 起始目标值, 目标字节数)
+        parser = _Parser(data, refs=False)
+        operands = []
+        while True:
+            item = parser.object()
+            if item is _END:
+                break
+            if not isinstance(item, Keyword):
+                operands.append(item)
+                continue
+            if item == 'endcodespacerange':
+                for lo, hi in zip(operands[::2], operands[1::2]):
+                    if isinstance(lo, bytes) and isinstance(hi, bytes) and len(lo) == len(hi):
+                        self.codespace.append((lo, hi))
+            elif item == 'endbfchar':
+                for code, target in zip(operands[::2], operands[1::2]):
+                    if isinstance(code, bytes):
+                        self.chars[code] = self._target(target)
+            elif item == 'endbfrange':
+                for lo, hi, target in zip(operands[::3], operands[1::3], operands[2::3]):
+                    if not (isinstance(lo, bytes) and isinstance(hi, bytes)):
+                        continue
+                    start, end = int.from_bytes(lo, 'big'), int.from_bytes(hi, 'big')
+                    if isinstance(target, list):
+                        for offset, value in enumerate(target[:end - start + 1]):
+                            self.chars[(start + offset).to_bytes(len(lo), 'big')] = self._target(value)
+                    elif isinstance(target, bytes) and target:
+                        self.ranges.append((start, end, len(lo), int.from_bytes(target, 'big'), len(target)))
+            operands = []
+        self.lengths = sorted({len(lo) for lo, _ in self.codespace})
+
+    @staticmethod
+    def _target(value):
+        if isinstance(value, Name):
+            return _glyph_char(value)
+        if isinstance(value, bytes):
+            return value.decode('utf-16-be', errors='replace')
+        return None
+
+    def lookup(self, code):
+        if code in self.chars:
+            return self.chars[code]
+        value = int.from_bytes(code, 'big')
+        for start, end, size, target, target_size in self.ranges:
+            if size == len(code) and start <= value <= end:
+                try:
+                    return (target + value - start).to_bytes(target_size, 'big').decode('utf-16-be', 'replace')
+                except OverflowError:
+                    return None
+        return None
+
+    def split(self, data, default):
+        """按码空间把字符串切分为码字"""
+        lengths = self.lengths or [default]
+        if len(lengths) == 1:
+            size = lengths[0]
+            return [data[i:i + size] for i in range(0, len(data), size)]
+        codes, i = [], 0
+        while i < len(data):
+            for size in lengths:
+                code = data[i:i + size]
+                if len(code) == size and any(
+                        len(lo) == size and all(a <= c <= b for a, c, b in zip(lo, code, hi))
+                        for lo, hi in self.codespace):
+                    break
+            else:
+                size = lengths[0]
+                code = data[i:i + size]
+            codes.append(code)
+            i += size
+        return codes
+
+# 预定义 CJK 编码对应的 Python 编解码器（无 ToUnicode 时使用）
+_CJK_CODECS = (('UCS2', 'utf-16-be'), ('UTF16', 'utf-16-be'), ('UTF8', 'utf-8'),
+               ('UTF32', 'utf-32-be'), ('GBK', 'gbk'), ('GB-EUC', 'gb2312'), ('GBpc', 'gb2312'),
+               ('GBT', 'gb18030'), ('RKSJ', 'cp932'), ('EUC', 'euc_jp'), ('B5', 'big5'),
+               ('ETen', 'big5'), ('KSC', 'cp949'), ('UHC', 'cp949'))
+
+class _Font:
+    """字体的解码和字宽（宽度以 1/1000 字号为单位）"""
+
+    def __init__(self, doc, spec):
+        spec = doc.resolve(spec)
+        spec = spec if isinstance(spec, dict) else {}
+        self.composite = spec.get('Subtype') == 'Type0'
+        self.cmap = None
+        self.codec = None
+        self.table = None
+        self.widths = {}
+        self.default_width = 500
+        self.glyphs = {}
+
+        to_unicode = doc.resolve(spec.get('ToUnicode'))
+        if isinstance(to_unicode, Stream):
+            try:
+                self.cmap = _CMap(doc.decode(to_unicode))
+            except Exception:
+                self.cmap = None
+
+        encoding = doc.resolve(spec.get('Encoding'))
+        if self.composite:
+            if isinstance(encoding, Name) and not encoding.startswith('Identity'):
+                self.codec = next((codec for key, codec in _CJK_CODECS if key in encoding), None)
+            descendants = doc.resolve(spec.get('DescendantFonts')) or [{}]
+            descendant = doc.resolve(descendants[0]) if descendants else {}
+            descendant = descendant if isinstance(descendant, dict) else {}
+            self.default_width = doc.resolve(descendant.get('DW', 1000))
+            self._cid_widths(doc, doc.resolve(descendant.get('W')) or [])
+        else:
+            self._simple_encoding(doc, encoding)
+            first = doc.resolve(spec.get('FirstChar', 0))
+            widths = doc.resolve(spec.get('Widths')) or []
+            for i, width in enumerate(widths):
+                width = doc.resolve(width)
+                if isinstance(width, (int, float)):
+                    self.widths[first + i] = width
+            descriptor = doc.resolve(spec.get('FontDescriptor'))
+            if isinstance(descriptor, dict) and descriptor.get('MissingWidth'):
+                self.default_width = doc.resolve(descriptor['MissingWidth'])
+
+    def _simple_encoding(self, doc, encoding):
+        base, differences = encoding, None
+        if isinstance(encoding, dict):
+            base, differences = encoding.get('BaseEncoding'), doc.resolve(encoding.get('Differences'))
+        codec = {'WinAnsiEncoding': 'cp1252', 'MacRomanEncoding': 'mac_roman'}.get(base, 'latin-1')
+        table = list(bytes(range(256)).decode(codec, errors='replace'))
+        if base not in ('WinAnsiEncoding', 'MacRomanEncoding'):
+            table[0x27], table[0x60] = '’', '‘'  # StandardEncoding
+        if differences:
+            code = 0
+            for item in differences:
+                if isinstance(item, int):
+                    code = item
+                elif isinstance(item, Name):
+                    if 0 <= code < 256:
+                        table[code] = _glyph_char(item)
+                    code += 1
+        self.table = table
+
+    def _cid_widths(self, doc, items):
+        i = 0
+        while i + 1 < len(items):
+            first, second = doc.resolve(items[i]), doc.resolve(items[i + 1])
+            if isinstance(second, list):
+                for offset, width in enumerate(second):
+                    self.widths[first + offset] = doc.resolve(width)
+                i += 2
+            elif i + 2 < len(items):
+                width = doc.resolve(items[i + 2])
+                if second - first <= 65535:
+                    for cid in range(first, second + 1):
+                        self.widths[cid] = width
+                i += 3
+            else:
+                break
+
+    def _glyph(self, code):
+        char = self.cmap.lookup(code) if self.cmap is not None else None
+        if char is None and not self.composite:
+            char = self.table[code[0]]
+        key = int.from_bytes(code, 'big')
+        width = self.widths.get(key, self.default_width)
+        return (char if _printable(char) else None), width if isinstance(width, (int, float)) else 0
+
+    def decode(self, data):
+        """返回 (文字, 总宽度, 码字数, 无法解码的码字数, 单字节空格数)"""
+        if self.codec is not None and self.cmap is None:
+            text = data.decode(self.codec, errors='replace')
+            missing = text.count('�')
+            text = ''.join(c for c in text if _printable(c))
+            return text, len(text) * self.default_width, len(text) + missing, missing, 0
+        if self.composite and self.codec is None:
+            codes = [data[i:i + 2] for i in range(0, len(data), 2)]  # Identity-H/V
+        elif self.cmap is not None:
+            codes = self.cmap.split(data, 2 if self.composite else 1)
+        else:
+            codes = [data[i:i + 1] for i in range(len(data))]
+        chars, width, missing = [], 0.0, 0
+        glyphs = self.glyphs
+        for code in codes:
+            glyph = glyphs.get(code)
+            if glyph is None:
+                glyph = glyphs[code] = self._glyph(code)
+            if glyph[0] is None:
+                missing += 1
+            else:
+                chars.append(glyph[0])
+            width += glyph[1]
+        spaces = data.count(b' ') if not self.composite else 0
+        return ''.join(chars), width, len(codes), missing, spaces
+
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + b * c2, a * b2 + b * d2, c * a2 + d * c2, c * b2 + d * d2,
+            e * a2 + f * c2 + e2, e * b2 + f * d2 + f2)
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+class _PageReader:
+    """解释页面内容流，按文字出现的位置拼成行"""
+
+    def __init__(self, doc, page_area):
+        self.doc = doc
+        self.page_area = page_area
+        self.lines = []
+        self.line = []
+        self.last = None  # 上一段文字结束处 (x, y, 字号)
+        self.chars = 0
+        self.missing = 0
+        self.images = 0
+        self.coverage = 0.0
+        self.fonts = {}
+
+    def text(self):
+        lines = self.lines + [''.join(self.line)]
+        return '\n'.join(line.rstrip() for line in lines).strip()
+
+    def _font(self, resources, name):
+        fonts = self.doc.resolve(resources.get('Font')) if resources else None
+        spec = fonts.get(name) if isinstance(fonts, dict) else None
+        # 间接引用的字体在整个文档内共用，ToUnicode 只解析一次
+        cache = self.doc.fonts if isinstance(spec, Ref) else self.fonts
+        key = spec if isinstance(spec, Ref) else (id(fonts), name)
+        if key not in cache:
+            cache[key] = _Font(self.doc, spec)
+        return cache[key]
+
+    def _show(self, state, data):
+        font = state['font']
+        if font is None:
+            return
+        text, width, count, missing, spaces = font.decode(data)
+        tm, ctm, size = state['tm'], state['ctm'], state['size']
+        a, b, c, d, e, f = _multiply(tm, ctm)
+        scale = (c * c + d * d) ** 0.5 * size or 1.0
+        if text:
+            if self.last is not None:
+                x, y, last_size = self.last
+                height = max(scale, last_size)
+                if abs(f - y) > height * 0.5:
+                    self.lines.append(''.join(self.line))
+                    self.line = []
+                elif (e - x > height * 0.15 and self.line and not self.line[-1].endswith(' ')
+                      and not text.startswith(' ')):
+                    self.line.append(' ')
+            self.line.append(text)
+            self.chars += len(text) - text.count(' ')
+        self.missing += missing
+        advance = (width / 1000 * size + count * state['tc'] + spaces * state['tw']) * state['tz']
+        state['tm'] = (tm[0], tm[1], tm[2], tm[3], tm[4] + advance * tm[0], tm[5] + advance * tm[1])
+        if text:
+            ex, ey = _multiply(state['tm'], ctm)[4:]
+            self.last = (ex, ey, scale)
+
+    def run(self, data, resources, ctm=_IDENTITY, depth=0, seen=()):
+        parser = _Parser(data, refs=False)
+        state = {'ctm': ctm, 'tm': _IDENTITY, 'tlm': _IDENTITY, 'font': None, 'size': 0.0,
+                 'tc': 0.0, 'tw': 0.0, 'tz': 1.0, 'tl': 0.0}
+        stack = []
+        operands = []
+        while True:
+            item = parser.object()
+            if item is _END:
+                break
+            if type(item) is not Keyword:
+                if item is not _ACLOSE and item is not _DCLOSE:
+                    operands.append(item)
+                continue
+            op = item
+            try:
+                if op == 'Tj' or op == 'TJ':
+                    if op == 'Tj':
+                        self._show(state, operands[-1])
+                    else:
+                        for part in operands[-1]:
+                            if isinstance(part, bytes):
+                                self._show(state, part)
+                            elif isinstance(part, (int, float)):
+                                tm = state['tm']
+                                shift = -part / 1000 * state['size'] * state['tz']
+                                state['tm'] = (tm[0], tm[1], tm[2], tm[3],
+                                               tm[4] + shift * tm[0], tm[5] + shift * tm[1])
+                elif op == 'Td' or op == 'TD' or op == 'T*' or op == "'" or op == '"':
+                    if op == 'Td' or op == 'TD':
+                        tx, ty = operands[-2], operands[-1]
+                        if op == 'TD':
+                            state['tl'] = -ty
+                    else:
+                        tx, ty = 0, -state['tl']
+                    a, b, c, d, e, f = state['tlm']
+                    state['tlm'] = state['tm'] = (a, b, c, d, tx * a + ty * c + e, tx * b + ty * d + f)
+                    if op == '"':
+                        state['tw'], state['tc'] = operands[-3], operands[-2]
+                    if op == "'" or op == '"':
+                        self._show(state, operands[-1])
+                elif op == 'Tm':
+                    state['tlm'] = state['tm'] = tuple(float(v) for v in operands[-6:])
+                elif op == 'BT':
+                    state['tlm'] = state['tm'] = _IDENTITY
+                elif op == 'Tf':
+                    state['font'] = self._font(resources, operands[-2])
+                    state['size'] = operands[-1]
+                elif op == 'TL':
+                    state['tl'] = operands[-1]
+                elif op == 'Tc':
+                    state['tc'] = operands[-1]
+                elif op == 'Tw':
+                    state['tw'] = operands[-1]
+                elif op == 'Tz':
+                    state['tz'] = operands[-1] / 100
+                elif op == 'cm':
+                    state['ctm'] = _multiply(tuple(float(v) for v in operands[-6:]), state['ctm'])
+                elif op == 'q':
+                    stack.append(dict(state))
+                elif op == 'Q':
+                    if stack:
+                        saved = stack.pop()
+                        saved['tm'], saved['tlm'] = state['tm'], state['tlm']
+                        state = saved
+                elif op == 'Do':
+                    self._xobject(resources, operands[-1], state['ctm'], depth, seen)
+                elif op == 'ID':
+                    parser.skip_inline_image()
+                    self._image(state['ctm'])
+            except (IndexError, TypeError, ValueError, KeyError, AttributeError):
+                pass  # 操作数缺失或类型不符，忽略这个操作符
+            operands = []
+
+    def _image(self, ctm):
+        a, b, c, d = ctm[:4]
+        self.images += 1
+        if self.page_area:
+            self.coverage = max(self.coverage, abs(a * d - b * c) / self.page_area)
+
+    def _xobject(self, resources, name, ctm, depth, seen):
+        objects = self.doc.resolve(resources.get('XObject')) if resources else None
+        ref = objects.get(name) if isinstance(objects, dict) else None
+        xobject = self.doc.resolve(ref)
+        if not isinstance(xobject, Stream):
+            return
+        subtype = xobject.get('Subtype')
+        if subtype == 'Image':
+            self._image(ctm)
+        elif subtype == 'Form' and depth < 10 and ref not in seen:
+            matrix = self.doc.resolve(xobject.get('Matrix'))
+            if isinstance(matrix, list) and len(matrix) == 6:
+                ctm = _multiply(tuple(float(v) for v in matrix), ctm)
+            inner = self.doc.resolve(xobject.get('Resources')) or resources
+            self.run(self.doc.decode(xobject), inner, ctm, depth + 1, seen + (ref,))
+
+    def remote(self):
+        """是否需要远程提取：部分文字无法解码（如缺少 ToUnicode 的中日文字体），或者页面基本只有图片"""
+        if (self.missing >= UNDECODED_MIN
+                and self.missing >= UNDECODED_RATIO * (self.chars + self.missing)):
+            return True
+        if self.images and self.chars < SCANNED_MIN_CHARS:
+            return True
+        return self.coverage >= SCANNED_COVERAGE and self.chars < SCANNED_PAGE_CHARS
+
+_INHERITED = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
+
+class PdfDocument:
+    """只读的 PDF 文档：按需解析对象，逐页提取文字层
+
+    文件以 mmap 方式打开，只读取用到的对象；格式无法解析或已加密时抛出 PdfError。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PdfError('文件为空')
+        self.xref = {}      # 对象号 -> (1, 偏移量) 或 (2, 对象流号, 序号)
+        self.trailer = {}
+        self.objects = {}
+        self.object_streams = {}
+        self.fonts = {}
+        self.rebuilt = False
+        try:
+            if b'%PDF' not in self.data[:1024]:
+                raise PdfError('不是 PDF 文件')
+            try:
+                self._load_xref()
+            except Exception:
+                self._rebuild_xref()
+            if 'Encrypt' in self.trailer:
+                raise PdfError('PDF 已加密')
+            self.pages = self._collect_pages()
+        except Exception as e:
+            self.close()
+            raise e if isinstance(e, PdfError) else PdfError(f'无法解析 PDF: {e}') from e
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+    # ---- 交叉引用表 ----
+
+    def _load_xref(self):
+        tail = self.data[max(0, len(self.data) - 4096):]
+        matches = list(re.finditer(rb'startxref\s+(\d+)', tail))
+        if not matches:
+            raise PdfError('找不到 startxref')
+        offset, seen = int(matches[-1].group(1)), set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            trailer = self._read_xref(offset)
+            if 'XRefStm' in trailer:
+                self._read_xref(trailer['XRefStm'])
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get('Prev')
+        if 'Root' not in self.trailer:
+            raise PdfError('缺少 Root')
+
+    def _read_xref(self, offset):
+        """读取一节交叉引用（表或流），较新的条目优先；返回该节的 trailer"""
+        data = self.data
+        m = re.compile(rb'\s*xref\s*').match(data, offset)
+        if m is None:
+            parser = _Parser(data, offset)
+            parser.object(), parser.object(), parser.object()  # n g obj
+            stream = self._finish_object(parser)
+            if not isinstance(stream, Stream) or stream.get('Type') != 'XRef':
+                raise PdfError('交叉引用位置错误')
+            self._read_xref_stream(stream)
+            return stream.attrs
+        pos = m.end()
+        header = re.compile(rb'(\d+)\s+(\d+)\s*')
+        entry = re.compile(rb'\s*(\d+)\s+(\d+)\s+([nf])')
+        while True:
+            section = header.match(data, pos)
+            if section is None:
+                break
+            start, count = int(section.group(1)), int(section.group(2))
+            pos = section.end()
+            for number in range(start, start + count):
+                item = entry.match(data, pos)
+                if item is None:
+                    raise PdfError('交叉引用表损坏')
+                pos = item.end()
+                if item.group(3) == b'n':
+                    self.xref.setdefault(number, (1, int(item.group(1))))
+                else:
+                    self.xref.setdefault(number, None)
+        m = re.compile(rb'\s*trailer\s*').match(data, pos)
+        if m is None:
+            raise PdfError('缺少 trailer')
+        trailer = _Parser(data, m.end()).object()
+        return trailer if isinstance(trailer, dict) else {}
+
+    def _read_xref_stream(self, stream):
+        widths = [self.resolve(w) for w in stream.get('W', [])]
+        if len(widths) != 3:
+            raise PdfError('交叉引用流格式错误')
+        index = stream.get('Index') or [0, stream.get('Size', 0)]
+        data = self.decode(stream)
+        row = sum(widths)
+        pos = 0
+        for start, count in zip(index[::2], index[1::2]):
+            for number in range(start, start + count):
+                if pos + row > len(data):
+                    return
+                fields, p = [], pos
+                for width in widths:
+                    fields.append(int.from_bytes(data[p:p + width], 'big'))
+                    p += width
+                pos += row
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.xref.setdefault(number, (1, fields[1]))
+                elif kind == 2:
+                    self.xref.setdefault(number, (2, fields[1], fields[2]))
+                else:
+                    self.xref.setdefault(number, None)
+
+    def _rebuild_xref(self):
+        """交叉引用损坏时扫描整个文件重建（后出现的对象优先）"""
+        self.xref, self.trailer, self.objects = {}, {}, {}
+        self.rebuilt = True
+        data = self.data
+        for m in re.finditer(rb'(?<![0-9])(\d+)\s+(\d+)\s+obj\b', data):
+            self.xref[int(m.group(1))] = (1, m.start())
+        for m in re.finditer(rb'trailer\s*<<', data):
+            trailer = _Parser(data, m.end() - 2).object()
+            if isinstance(trailer, dict) and 'Root' in trailer:
+                self.trailer.update(trailer)
+        if 'Root' not in self.trailer:
+            for number in list(self.xref):
+                try:
+                    obj = self.resolve(Ref(number, 0))
+                except Exception:
+                    continue
+                attrs = obj.attrs if isinstance(obj, Stream) else obj
+                if isinstance(attrs, dict):
+                    if attrs.get('Type') == 'XRef' and 'Root' in attrs:
+                        self.trailer.update(attrs)
+                        break
+                    if attrs.get('Type') == 'Catalog':
+                        self.trailer['Root'] = Ref(number, 0)
+        if 'Root' not in self.trailer:
+            raise PdfError('找不到文档目录')
+        # 重建时已扫到的对象流中的对象
+        for number in list(self.xref):
+            try:
+                obj = self.resolve(Ref(number, 0))
+            except Exception:
+                continue
+            if isinstance(obj, Stream) and obj.get('Type') == 'ObjStm':
+                for inner, _ in self._object_stream(number)[1]:
+                    self.xref.setdefault(inner, (2, number, None))
+
+    # ---- 对象 ----
+
+    def _finish_object(self, parser):
+        obj = parser.object()
+        if not isinstance(obj, dict):
+            return obj
+        m = re.compile(rb'[' + _WS + rb']*stream(?:\r\n|\n|\r)?').match(self.data, parser.pos)
+        if m is None:
+            return obj
+        start = m.end()
+        length = obj.get('Length')
+        if isinstance(length, Ref):
+            try:
+                length = self.resolve(length)
+            except Exception:
+                length = None
+        end = None
+        if isinstance(length, int) and 0 <= length:
+            tail = re.compile(rb'[' + _WS + rb']*endstream').match(self.data, start + length)
+            if tail is not None:
+                end = start + length
+        if end is None:
+            found = self.data.find(b'endstream', start)
+            if found < 0:
+                raise PdfError('流没有结束标记')
+            end = found
+            while end > start and self.data[end - 1] in b'\r\n':
+                end -= 1
+        return Stream(obj, self.data[start:end])
+
+    def _object_stream(self, number):
+        """解析对象流：返回 (解码后的数据, [(对象号, 偏移量)])"""
+        if number not in self.object_streams:
+            stream = self.resolve(Ref(number, 0))
+            if not isinstance(stream, Stream):
+                raise PdfError(f'对象流 {number} 不存在')
+            data = self.decode(stream)
+            first = self.resolve(stream.get('First', 0))
+            header = _Parser(data[:first], refs=False)
+            numbers = []
+            for _ in range(self.resolve(stream.get('N', 0))):
+                obj_number, offset = header.object(), header.object()
+                if not isinstance(obj_number, int) or not isinstance(offset, int):
+                    break
+                numbers.append((obj_number, first + offset))
+            self.object_streams[number] = (data, numbers)
+        return self.object_streams[number]
+
+    def _load(self, number):
+        entry = self.xref.get(number)
+        if entry is None:
+            return None
+        if entry[0] == 1:
+            parser = _Parser(self.data, entry[1])
+            head = parser.object(), parser.object(), parser.object()
+            if head[0] != number or head[2] != 'obj':
+                if not self.rebuilt:
+                    self._rebuild_xref()
+                    return self._load(number)
+                raise PdfError(f'对象 {number} 位置错误')
+            return self._finish_object(parser)
+        data, numbers = self._object_stream(entry[1])
+        for index, (obj_number, offset) in enumerate(numbers):
+            if obj_number == number and (entry[2] is None or entry[2] == index):
+                return _Parser(data, offset).object()
+        return None
+
+    def resolve(self, obj):
+        """解析间接引用（结果缓存）"""
+        while isinstance(obj, Ref):
+            number = obj.num
+            if number not in self.objects:
+                self.objects[number] = None  # 防止循环引用
+                self.objects[number] = self._load(number)
+            obj = self.objects[number]
+        return obj
+
+    def decode(self, stream):
+        """按 Filter 解码流数据"""
+        filters = self.resolve(stream.get('Filter'))
+        parms = self.resolve(stream.get('DecodeParms'))
+        if filters is None:
+            return stream.raw
+        if not isinstance(filters, list):
+            filters, parms = [filters], [parms]
+        elif not isinstance(parms, list):
+            parms = [parms] * len(filters)
+        data = stream.raw
+        for name, parm in zip(filters, parms + [None] * len(filters)):
+            parm = self.resolve(parm)
+            data = _decode_filter(self.resolve(name), data, parm if isinstance(parm, dict) else {})
+        return data
+
+    # ---- 页面 ----
+
+    def _collect_pages(self):
+        root = self.resolve(self.trailer.get('Root'))
+        if not isinstance(root, dict):
+            raise PdfError('文档目录损坏')
+        pages, seen = [], set()
+        stack = [(root.get('Pages'), {})]
+        while stack:
+            ref, inherited = stack.pop()
+            if isinstance(ref, Ref):
+                if ref.num in seen:
+                    continue
+                seen.add(ref.num)
+            node = self.resolve(ref)
+            if not isinstance(node, dict):
+                continue
+            inherited = dict(inherited)
+            for key in _INHERITED:
+                if key in node:
+                    inherited[key] = node[key]
+            kids = self.resolve(node.get('Kids'))
+            if node.get('Type') == 'Pages' or (kids and node.get('Type') != 'Page'):
+                for kid in reversed(kids or []):
+                    stack.append((kid, inherited))
+            else:
+                pages.append((ref, node, inherited))
+        return pages
+
+    def page_text(self, index):
+        """提取第 index 页（从 0 开始）的文字，返回 PageText"""
+        _, page, inherited = self.pages[index]
+        try:
+            resources = self.resolve(inherited.get('Resources'))
+            resources = resources if isinstance(resources, dict) else {}
+            box = [self.resolve(v) for v in (self.resolve(inherited.get('MediaBox')) or [])]
+            area = abs((box[2] - box[0]) * (box[3] - box[1])) if len(box) == 4 else 0
+            reader = _PageReader(self, area)
+            contents = self.resolve(page.get('Contents'))
+            streams = contents if isinstance(contents, list) else [contents]
+            data = b'\n'.join(self.decode(s) for s in map(self.resolve, streams)
+                              if isinstance(s, Stream))
+            reader.run(data, resources)
+        except Exception:
+            return PageText(index + 1, '', True)
+        return PageText(index + 1, reader.text(), reader.remote())
+
+    def iter_pages(self, start=0, stop=None):
+        """逐页提取（惰性），每次只解码一页的内容流"""
+        for index in range(start, min(stop or self.page_count, self.page_count)):
+            yield self.page_text(index)
+
+    # ---- 写出部分页面 ----
+
+    def write_pages(self, indices, path):
+        """把指定页（从 0 开始）写成一个新的 PDF，流数据原样复制不重新压缩"""
+        numbers = {}   # 原对象号 -> 新对象号
+        pending = []
+
+        def convert(obj):
+            if isinstance(obj, Ref):
+                if obj.num not in numbers:
+                    numbers[obj.num] = len(numbers) + len(indices) + 3
+                    pending.append(obj.num)
+                return Ref(numbers[obj.num], 0)
+            if isinstance(obj, Stream):
+                return Stream(convert(obj.attrs), obj.raw)
+            if isinstance(obj, dict):
+                return {key: convert(value) for key, value in obj.items()}
+            if isinstance(obj, list):
+                return [convert(value) for value in obj]
+            return obj
+
+        with open(path, 'wb') as out:
+            offsets = {}
+
+            def write(number, obj):
+                offsets[number] = out.tell()
+                out.write(b'%d 0 obj\n' % number)
+                if isinstance(obj, Stream):
+                    attrs = dict(obj.attrs, Length=len(obj.raw))
+                    out.write(_serialize(attrs) + b'\nstream\n' + obj.raw + b'\nendstream')
+                else:
+                    out.write(_serialize(obj))
+                out.write(b'\nendobj\n')
+
+            out.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+            write(1, {'Type': Name('Catalog'), 'Pages': Ref(2, 0)})
+            kids = [Ref(3 + i, 0) for i in range(len(indices))]
+            write(2, {'Type': Name('Pages'), 'Kids': kids, 'Count': len(kids)})
+            for i, index in enumerate(indices):
+                _, page, inherited = self.pages[index]
+                page = {key: value for key, value in page.items()
+                        if key not in ('Parent', 'Annots', 'B', 'Thumb', 'StructParents', 'Metadata')}
+                for key, value in inherited.items():
+                    page.setdefault(key, value)
+                page = convert(page)
+                page['Parent'] = Ref(2, 0)
+                write(3 + i, page)
+            while pending:
+                number = pending.pop()
+                write(numbers[number], convert(self.resolve(Ref(number, 0))))
+
+            start = out.tell()
+            size = len(offsets) + 1
+            out.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+            for number in range(1, size):
+                out.write(b'%010d 00000 n \n' % offsets[number])
+            out.write(b'trailer\n' + _serialize({'Size': size, 'Root': Ref(1, 0)})
+                      + b'\nstartxref\n%d\n%%%%EOF\n' % start)
+
+def page_ranges(numbers):
+    """把页码列表写成 "1-3、7" 的形式"""
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return '、'.join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def _part_task(remote, path, label, on_part):
+    """远程提取一个部分的任务；label 为 None 表示整个文件"""
+    def run():
+        start = time.monotonic()
+        try:
+            text = remote(path)
+        except Exception as e:
+            if on_part is not None:
+                on_part(label, e, time.monotonic() - start)
+            raise
+        if on_part is not None:
+            on_part(label, None, time.monotonic() - start)
+        return text if label is None else f"--- 第 {label} 页（远程提取）---\n{text}\n"
+    return run
+
+def _part_tasks(doc, indices, remote, stats, part_size, folder, on_part):
+    """把连续的若干页写成临时 PDF；超过 part_size 时对半拆分"""
+    label = page_ranges([index + 1 for index in indices])
+    path = os.path.join(folder, f"{os.path.splitext(os.path.basename(doc.path))[0]}_p{label}.pdf")
+    doc.write_pages(indices, path)
+    if os.path.getsize(path) > part_size and len(indices) > 1:
+        os.remove(path)
+        middle = len(indices) // 2
+        yield from _part_tasks(doc, indices[:middle], remote, stats, part_size, folder, on_part)
+        yield from _part_tasks(doc, indices[middle:], remote, stats, part_size, folder, on_part)
+        return
+    stats['parts'] += 1
+    yield _part_task(remote, path, label, on_part)
+
+def _page_tasks(doc, remote, stats, local, part_size, part_pages, folder, on_part):
+    """按页码顺序产出本地页的文字和远程部分的任务"""
+    run, whole = [], True  # whole: 目前为止全部页都需要远程提取，且还没有提交任何部分
+    for index in range(doc.page_count):
+        page = doc.page_text(index) if local else None
+        if page is None or page.remote:
+            run.append(index)
+            stats['remote_pages'] += 1
+            if len(run) >= part_pages and index + 1 < doc.page_count:
+                whole = False
+                yield from _part_tasks(doc, run, remote, stats, part_size, folder, on_part)
+                run = []
+            continue
+        whole = False
+        if run:
+            yield from _part_tasks(doc, run, remote, stats, part_size, folder, on_part)
+            run = []
+        yield f"--- 第 {page.number} 页 ---\n{page.text}\n"
+    if run and whole and os.path.getsize(doc.path) <= part_size:
+        stats['parts'] += 1
+        yield _part_task(remote, doc.path, None, on_part)
+    elif run:
+        yield from _part_tasks(doc, run, remote, stats, part_size, folder, on_part)
+
+def iter_text(file_path, remote, stats=None, local=True, workers=4, part_size=5 * 1024 * 1024,
+              part_pages=20, on_part=None):
+    """按页码顺序产出 PDF 的文字：文字层在本地读取，扫描页（和无法解码的页）交给 remote(path) 提取
+
+    需要远程提取的连续页切成不超过 part_pages 页、part_size 字节的部分，由有界线程池并发提取；
+    前面的内容都已就绪时立即产出，总耗时取决于最慢的部分而不是整个文件。
+    local 为 False 时全部页面都远程提取（同样分段并发）。全部页面都需要远程提取、且页数和大小
+    都不超过上限的文件整体上传；本地无法解析的文件只能整体上传，超过 part_size 时抛出 PdfError。
+    任一部分提取失败时抛出该异常。
+    stats 为字典时记录总页数(pages)、远程提取的页数(remote_pages)和上传的部分数(parts)。
+    on_part(页段, 异常或 None, 秒数) 在每个部分结束时于工作线程中调用，页段为 None 表示整个文件。
+    """
+    stats = stats if stats is not None else {}
+    try:
+        doc = PdfDocument(file_path)
+    except PdfError as e:
+        if os.path.getsize(file_path) > part_size:
+            raise PdfError(f"{e}，且文件超过 {part_size / 1024 / 1024:.0f}MB，无法整体上传") from e
+        stats.update(pages=None, remote_pages=None, parts=1)
+        yield _part_task(remote, file_path, None, on_part)()
+        return
+    folder = tempfile.mkdtemp()
+    try:
+        with doc:
+            stats.update(pages=doc.page_count, remote_pages=0, parts=0)
+            tasks = _page_tasks(doc, remote, stats, local, part_size, part_pages, folder, on_part)
+            for ok, value in iter_ordered(tasks, workers):
+                if not ok:
+                    raise value
+                yield value
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def _serialize(obj):
+    if obj is None:
+        return b'null'
+    if obj is True:
+        return b'true'
+    if obj is False:
+        return b'false'
+    if isinstance(obj, Name):
+        raw = obj.encode('latin-1')
+        return b'/' + re.sub(rb'[^!-~]|[#()<>\[\]{}/%]', lambda m: b'#%02X' % m.group()[0], raw)
+    if isinstance(obj, int):
+        return b'%d' % obj
+    if isinstance(obj, float):
+        return (b'%.6f' % obj).rstrip(b'0').rstrip(b'.') or b'0'
+    if isinstance(obj, Ref):
+        return b'%d %d R' % obj
+    if isinstance(obj, (bytes, bytearray)):
+        return b'<' + binascii.hexlify(obj) + b'>'
+    if isinstance(obj, list):
+        return b'[' + b' '.join(_serialize(value) for value in obj) + b']'
+    if isinstance(obj, dict):
+        return b'<<' + b''.join(_serialize(Name(key)) + b' ' + _serialize(value)
+                                for key, value in obj.items()) + b'>>'
+    if isinstance(obj, str):
+        return obj.encode('latin-1')
+    raise PdfError(f'无法写出的对象: {type(obj).__name__}')
@@ -0,0 +1,150 @@
+import json
+import hashlib
+
+try:
+    from .context import message_tokens, message_images
+except ImportError:
+    from context import message_tokens, message_images
+
+# 支持显式上下文缓存的模型组（kimi-latest 由服务端自动缓存，只需保持前缀稳定）
+CACHE_FAMILIES = ('moonshot-v1',)
+
+def cache_family(model):
+    """模型所属、可创建上下文缓存的模型组，不支持时返回 None"""
+    if 'vision' in model:
+        return None
+    for family in CACHE_FAMILIES:
+        if model.startswith(family):
+            return family
+    return None
+
+def prefix_digests(family, messages):
+    """逐条累加哈希，返回每个可缓存前缀的 [(消息数, 哈希)]，从短到长
+
+    前缀只在轮次边界（用户消息开始处）结束，因此不含最后一轮的问题；
+    含图片的消息及其之后不缓存。
+    """
+    digest = hashlib.sha256(family.encode('utf-8'))
+    prefixes = []
+    for i, message in enumerate(messages):
+        if message_images(message) or message.get('role') not in ('system', 'user', 'assistant'):
+            break
+        if i and message['role'] == 'user' and messages[i - 1]['role'] != 'user':
+            prefixes.append((i, digest.hexdigest()))
+        digest.update(json.dumps([message['role'], message['content']], ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\n')
+    return prefixes
+
+def cache_message(cache_id, ttl):
+    """引用上下文缓存的消息，放在消息列表开头代替缓存的前缀，并为缓存续期"""
+    return {'role': 'cache', 'content': f'cache_id={cache_id};reset_ttl={ttl}'}
+
+def create_cache(client, family, messages, ttl):
+    """在服务端创建上下文缓存（POST /caching），返回缓存对象"""
+    return client.post('/caching', cast_to=object,
+                       body={'model': family, 'messages': messages, 'ttl': ttl})
+
+def get_cache(client, cache_id):
+    """查询服务端上下文缓存（GET /caching/{id}），返回缓存对象"""
+    return client.get(f'/caching/{cache_id}', cast_to=object)
+
+def delete_cache(client, cache_id):
+    """删除服务端上下文缓存，失败时忽略（缓存到期后服务端也会清理）"""
+    try:
+        client.delete(f'/caching/{cache_id}', cast_to=object)
+    except Exception as e:
+        print(f"删除上下文缓存失败: {e}")
+
+def _save_cache(registry, digest, cache_id, tokens, status):
+    registry.set_text(f'id:{digest}', json.dumps({'id': cache_id, 'tokens': tokens, 'status': status}))
+
+def _ready_cache(client, registry, digest, record):
+    """本地记录的缓存仍在创建中（pending）时向服务端查询状态
+
+    返回 'ready'（已更新本地记录）、'pending'，失败或已失效的缓存会被删除并返回 None。
+    """
+    if record.get('status', 'ready') == 'ready':
+        return 'ready'
+    try:
+        current = get_cache(client, record['id'])
+    except Exception as e:
+        if getattr(e, 'status_code', None) != 404:
+            print(f"查询上下文缓存失败: {e}")
+            return 'pending'
+        current = {'status': 'missing'}
+    status = current.get('status', 'ready')
+    if status == 'ready':
+        record.update(status='ready', tokens=current.get('tokens', record.get('tokens')))
+        _save_cache(registry, digest, record['id'], record['tokens'], 'ready')
+        return 'ready'
+    if status == 'pending':
+        return 'pending'
+    if status != 'missing':
+        delete_cache(client, record['id'])
+    registry.delete(f'id:{digest}')
+    return None
+
+def apply_cache(client, registry, model, messages, ttl=900, min_tokens=1024):
+    """用服务端上下文缓存代替消息列表中不变的前缀
+
+    registry 为 cache.DiskCache，按前缀哈希记录缓存 ID 和状态。返回 (要发送的消息, 使用的缓存)，
+    缓存为 {'id', 'tokens', 'digest', 'size'}，未使用时为 None。
+    只有在之前的请求中出现过、本次仍是前缀的部分才创建缓存（未缓存部分不少于
+    min_tokens），对话窗口滑动使前缀每轮都变化时不会反复创建只用一次的缓存。
+    服务端返回 pending 的缓存同样记录下来，之后每次使用前查询，ready 后才引用；
+    等待期间退回较短的缓存，也不会为同一前缀重复创建。
+    """
+    family = cache_family(model)
+    prefixes = prefix_digests(family, messages) if family else []
+    if not prefixes:
+        return messages, None
+
+    cache = None
+    pending = 0
+    for size, digest in reversed(prefixes):
+        value = registry.get_text(f'id:{digest}')
+        if value is None:
+            continue
+        record = json.loads(value)
+        status = _ready_cache(client, registry, digest, record)
+        if status == 'ready':
+            cache = {'id': record['id'], 'tokens': record.get('tokens'), 'digest': digest, 'size': size}
+            break
+        if status == 'pending':
+            pending = max(pending, size)
+
+    start = max(cache['size'] if cache else 0, pending)
+    for size, digest in reversed(prefixes):
+        if size <= start or sum(message_tokens(m) for m in messages[start:size]) < min_tokens:
+            break
+        if registry.get(f'seen:{digest}') is None:
+            continue
+        try:
+            created = create_cache(client, family, messages[:size], ttl)
+        except Exception as e:
+            print(f"创建上下文缓存失败: {e}")
+            break
+        status = created.get('status', 'ready')
+        if status == 'ready':
+            cache = {'id': created['id'], 'tokens': created.get('tokens'), 'digest': digest, 'size': size}
+        elif status == 'pending':
+            _save_cache(registry, digest, created['id'], created.get('tokens'), 'pending')
+            pending = size
+        else:
+            print(f"上下文缓存创建失败: {created['id']} 状态 {status}")
+            delete_cache(client, created['id'])
+        break
+
+    # 记录本次的背景知识前缀和最长前缀，下次仍出现时再创建缓存
+    for size, digest in {prefixes[0], prefixes[-1]}:
+        if size > max(cache['size'] if cache else 0, pending):
+            registry.set(f'seen:{digest}', b'1')
+    if cache is None:
+        return messages, None
+    # 每次使用都会续期，本地记录同时刷新
+    _save_cache(registry, cache['digest'], cache['id'], cache['tokens'], 'ready')
+    return [cache_message(cache['id'], ttl)] + messages[cache['size']:], cache
+
+def forget_cache(registry, cache):
+    """服务端缓存已失效（过期或被删除）时删除本地记录"""
+    registry.delete(f"id:{cache['digest']}")
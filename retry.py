@@ -0,0 +1,145 @@
+import time
+import random
+import email.utils
+
+try:
+    from .stream import StreamBuffer
+except ImportError:
+    from stream import StreamBuffer
+
+RETRY_STATUS = {408, 409, 429}  # 以及全部 5xx
+NETWORK_WORDS = ('Timeout', 'Connection', 'Protocol', 'ReadError', 'NetworkError', 'Incomplete')
+
+class RequestFailed(Exception):
+    """重试后仍然失败；partial 为已经收到的部分回答"""
+
+    def __init__(self, error, partial='', attempts=1):
+        super().__init__(str(error))
+        self.error = error
+        self.partial = partial
+        self.attempts = attempts
+
+def status_code(error):
+    """错误对应的 HTTP 状态码，没有时返回 None"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def retry_after(error):
+    """从错误中读取 Retry-After（秒），没有时返回 None"""
+    value = getattr(error, 'retry_after', None)
+    if value is not None:
+        return float(value)
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            # HTTP 日期格式
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error):
+    """429/408/409/5xx 和超时、连接错误可以重试；其他 4xx 和程序错误不重试"""
+    status = status_code(error)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    if name == 'DaemonError':
+        return True  # 守护进程连接中断或上游未给出状态码
+    return any(word in name for word in NETWORK_WORDS)
+
+class RetryPolicy:
+    """重试策略：指数退避加随机抖动，优先遵循 Retry-After，总耗时不超过 deadline 秒"""
+
+    def __init__(self, max_attempts=4, base=0.5, cap=8.0, deadline=60.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    def delay(self, attempt, error):
+        """第 attempt 次失败后的等待秒数"""
+        after = retry_after(error)
+        if after is not None:
+            return after + random.uniform(0, self.base)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+def continuation(messages, partial):
+    """中途断开时让模型从已输出的内容继续（Moonshot 的 partial 模式）"""
+    return messages + [{'role': 'assistant', 'content': partial, 'partial': True}]
+
+def without_sdk_retries(client):
+    """由本模块负责重试，关闭 SDK 自带的重试"""
+    with_options = getattr(client, 'with_options', None)
+    return with_options(max_retries=0) if with_options is not None else client
+
+def stream_with_retry(client, messages, write, policy=None, control=None, on_retry=None,
+                      metrics=None, **params):
+    """流式请求并按策略重试，返回完整回答
+
+    write(text) 接收每个增量；中途断开时保留已收到的内容，让模型接着写。
+    control 为 session.StreamControl 时可被中断，中断后返回已收到的部分。
+    on_retry(error, wait, resumed) 在每次等待重试前调用。
+    metrics 为 metrics.RequestMetrics 时记录首字耗时、增量间隔、token 用量和尝试次数。
+    无法重试或超出次数/期限时抛出 RequestFailed。
+    """
+    policy = policy or RetryPolicy()
+    completions = without_sdk_retries(client).chat.completions
+    buffer = StreamBuffer()
+    if control is not None:
+        control.buffer = buffer
+    if metrics is not None:
+        metrics.begin()
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        if control is not None and control.cancelled:
+            return buffer.getvalue()
+        if metrics is not None:
+            metrics.attempts = attempt + 1
+        partial = buffer.getvalue()
+        request = continuation(messages, partial) if partial else messages
+        try:
+            stream = completions.create(messages=request, stream=True, **params)
+            for chunk in stream:
+                if control is not None and control.cancelled:
+                    if hasattr(stream, 'close'):
+                        stream.close()
+                    return buffer.getvalue()
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    if metrics is not None:
+                        metrics.chunk(content)
+                    write(content)
+                    buffer.append(content)
+                if metrics is not None:
+                    # OpenAI 放在 chunk.usage，Moonshot 放在最后一个 choice 中
+                    usage = getattr(chunk, 'usage', None)
+                    if usage is None and chunk.choices:
+                        usage = getattr(chunk.choices[0], 'usage', None)
+                    if usage:
+                        metrics.usage(usage)
+            return buffer.getvalue()
+        except Exception as e:
+            if control is not None and control.cancelled:
+                return buffer.getvalue()
+            attempt += 1
+            wait = policy.delay(attempt, e)
+            if (not is_retryable(e) or attempt >= policy.max_attempts
+                    or time.monotonic() - start + wait > policy.deadline):
+                raise RequestFailed(e, buffer.getvalue(), attempt)
+            if on_retry is not None:
+                on_retry(e, wait, bool(buffer.getvalue()))
+            time.sleep(wait)
@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import sqlite3
+
+try:
+    from .logfile import read_records, iter_log, log_size
+except ImportError:
+    from logfile import read_records, iter_log, log_size
+
+# 中日韩文字按二元组切分，其他按字母数字单词切分
+_TOKEN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[A-Za-z0-9_]+')
+
+# 日志记录的两种格式：getTMP 的字段分隔格式，以及 ai.py 的 "[时间] USER: ... [时间] AI: ..."
+TMP_SPLIT = '\n_|_SPLIT_|_\n'
+TMP_END = '\n_|_END_|_\n'
+_USER_START = re.compile(rb'^\[\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\] USER: ', re.M)
+_AI_RECORD = re.compile(r'\[([^\]]+)\] USER: (.*?)\n\[[^\]]+\] AI: (.*)', re.S)
+BACKFILL_BATCH = 500  # 补建索引时每个事务写入的记录数（中断后从已提交的位置继续）
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    time REAL,
+    cwd TEXT,
+    model TEXT,
+    title TEXT,
+    source TEXT,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS docs_position ON docs (source, offset);
+CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(
+    body, content='', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+'''
+
+def tokenize(text):
+    """切分为检索词：中文二元组 + 小写英文单词"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if run[0].isascii():
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def _match_expression(query):
+    """把查询转换为 FTS5 表达式（各词同时出现）"""
+    terms = []
+    for token in dict.fromkeys(tokenize(query)):
+        token = token.replace('"', '')
+        # 单个汉字没有对应的二元组，按前缀匹配
+        if len(token) == 1 and not token.isascii():
+            terms.append(f'"{token}"*')
+        else:
+            terms.append(f'"{token}"')
+    return ' '.join(terms)
+
+class SearchIndex:
+    """聊天日志的全文倒排索引（SQLite FTS5，只存索引不存正文）
+
+    每条日志记录写入时增量更新；命中后按来源文件和偏移量回读原文。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _insert(self, text, timestamp, cwd, model, title, source, offset, length):
+        """（事务内）写入一条记录，同一来源和偏移量已索引时跳过"""
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO docs (time, cwd, model, title, source, offset, length) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (timestamp or time.time(), cwd, model, title[:200], source, offset, length)
+        )
+        if cursor.rowcount:
+            self.conn.execute('INSERT INTO terms (rowid, body) VALUES (?, ?)',
+                              (cursor.lastrowid, ' '.join(tokenize(text))))
+        return cursor.rowcount
+
+    def add(self, text, timestamp=None, cwd=None, model=None, title='',
+            source=None, offset=None, length=None):
+        """索引一条日志记录"""
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self._insert(text, timestamp, cwd, model, title, source, offset, length)
+            if source is not None and offset is not None:
+                # 紧接在已补建部分之后的记录，前移补建位置，下次补建不必重新读取
+                self.conn.execute('UPDATE meta SET value = ? WHERE key = ? AND value >= ?',
+                                  (offset + length, f'backfill:{source}', offset))
+
+    def indexed_offset(self, source):
+        """source 中已补建索引的逻辑偏移量"""
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?',
+                                (f'backfill:{source}',)).fetchone()
+        return row[0] if row else 0
+
+    def backfill(self, source, tmp_split=TMP_SPLIT, tmp_end=TMP_END, block_size=1024 * 1024):
+        """为 source 中尚未索引的已有日志补建索引（包括轮转后的 gzip 分段），返回新增的记录数
+
+        从上次补建到的位置继续，每 BACKFILL_BATCH 条提交一次并记录位置；
+        写入时已索引的记录按来源和偏移量跳过。
+        """
+        added = 0
+        batch = []
+
+        def commit(position):
+            nonlocal added
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                for offset, text in batch:
+                    fields = parse_record(text, tmp_split, tmp_end)
+                    if fields is not None:
+                        timestamp, cwd, model, question, answer = fields
+                        added += self._insert(question + '\n' + answer, timestamp, cwd, model,
+                                              question, source, offset, len(text.encode('utf-8')))
+                self.conn.execute(
+                    'INSERT INTO meta (key, value) VALUES (?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value)',
+                    (f'backfill:{source}', position))
+            batch.clear()
+
+        position = self.indexed_offset(source)
+        blocks = iter_log(source, block_size, position)
+        for offset, position, text in iter_records(blocks, tmp_end.strip().encode('utf-8')):
+            batch.append((offset, text))
+            if len(batch) >= BACKFILL_BATCH:
+                commit(position)
+        if batch:
+            commit(position)
+        return added
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def search(self, query, limit=10):
+        """按相关度返回命中记录"""
+        expression = _match_expression(query)
+        if not expression:
+            return []
+        rows = self.conn.execute(
+            'SELECT docs.time, docs.cwd, docs.model, docs.title, docs.source, docs.offset, '
+            'docs.length, bm25(terms) AS score '
+            'FROM terms JOIN docs ON docs.id = terms.rowid '
+            'WHERE terms MATCH ? ORDER BY score LIMIT ?',
+            (expression, limit)
+        ).fetchall()
+        keys = ('time', 'cwd', 'model', 'title', 'source', 'offset', 'length', 'score')
+        return [dict(zip(keys, row)) for row in rows]
+
+def _record_end(data, pos, end_marker):
+    """data[pos:] 中第一条记录的结束位置，需要更多数据才能判断时返回 None
+
+    以 "[时间] USER:" 开头的是 ai.py 的记录，到下一条这样的行之前结束；
+    其他按 getTMP 记录处理，到结束标记为止。
+    """
+    if _USER_START.match(data, pos):
+        following = _USER_START.search(data, pos + 1)
+        if following:
+            return following.start()
+    else:
+        marker = data.find(end_marker, pos)
+        if marker >= 0:
+            return marker + len(end_marker)
+    return None
+
+def iter_records(blocks, end_marker=TMP_END.strip().encode('utf-8')):
+    """把逐块给出的日志 (逻辑偏移量, 数据) 切分为记录，产出 (偏移量, 下一条记录的偏移量, 文本)"""
+    buffer = bytearray()
+    base = None  # buffer[0] 的逻辑偏移量
+    for offset, block in blocks:
+        if base is None or not buffer:
+            base = offset
+        buffer += block
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in b'\r\n':
+                pos += 1  # 记录之间的空行
+            if pos >= len(buffer):
+                break
+            end = _record_end(buffer, pos, end_marker)
+            if end is None:
+                break
+            text = buffer[pos:end].decode('utf-8', errors='ignore')
+            start, pos = pos, end
+            while pos < len(buffer) and buffer[pos] in b'\r\n':
+                pos += 1
+            # 结束偏移量包括记录后的空行，即下一条记录的开头
+            yield base + start, base + pos, text
+        del buffer[:pos]
+        base += pos
+    if buffer.strip():
+        start = len(buffer) - len(buffer.lstrip(b'\r\n'))
+        yield base + start, base + len(buffer), buffer[start:].decode('utf-8', errors='ignore')
+
+def parse_record(text, tmp_split=TMP_SPLIT, tmp_end=TMP_END):
+    """解析一条日志记录，返回 (时间戳, 路径, 模型, 问题, 回答)，无法识别时返回 None"""
+    match = _AI_RECORD.match(text)
+    if match:
+        human_time, question, answer = match.groups()
+        cwd = model = None
+    else:
+        fields = [field.strip() for field in
+                  text.replace(tmp_end.strip(), '').split(tmp_split.strip())]
+        if len(fields) < 2:
+            return None
+        question, answer = fields[-2], fields[-1]
+        human_time, cwd, model = (fields[0], fields[1], fields[4]) if len(fields) >= 7 else ('', None, None)
+    try:
+        timestamp = time.mktime(time.strptime(human_time.strip(), '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        timestamp = None
+    return timestamp, cwd, model, question.strip(), answer.strip()
+
+def backfill_log(index, source, tmp_split=TMP_SPLIT, tmp_end=TMP_END):
+    """检索前为已有日志补建索引（只读取上次之后的部分），失败时只打印提示"""
+    try:
+        if index.indexed_offset(source) < log_size(source):
+            print("正在为已有日志补建索引...")
+            added = index.backfill(source, tmp_split, tmp_end)
+            if added:
+                print(f"已补建索引 {added} 条")
+    except Exception as e:
+        print(f"补建日志索引失败: {e}")
+
+def snippet(text, query, width=60):
+    """截取命中位置附近的文本"""
+    text = ' '.join(text.split())
+    position = -1
+    for token in tokenize(query):
+        position = text.lower().find(token)
+        if position >= 0:
+            break
+    start = max(0, position - width) if position >= 0 else 0
+    end = start + 2 * width
+    return ('...' if start else '') + text[start:end] + ('...' if end < len(text) else '')
+
+def print_hits(hits, query, elapsed, clean=None):
+    """打印检索结果，clean 用于去掉原始记录中的格式标记"""
+    print(f"\n找到 {len(hits)} 条结果 ({elapsed * 1000:.1f} ms)")
+    # 同一 gzip 分段中的命中一次读出，不必每条都从分段开头解压
+    records = read_records([(hit['source'], hit['offset'], hit['length']) for hit in hits])
+    for i, (hit, record) in enumerate(zip(hits, records), 1):
+        human_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(hit['time']))
+        print(f"\n{i}. [{human_time}] {hit['model'] or '-'}  {hit['cwd'] or '-'}")
+        if record and clean:
+            record = clean(record)
+        print(f"   {snippet(record if record else hit['title'], query)}")
@@ -0,0 +1,134 @@
+import sys
+import signal
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .stream import StreamBuffer
+except ImportError:
+    from stream import StreamBuffer
+
+class StreamControl:
+    """流式回答的中断控制：保存已收到的内容，可从其他线程请求中断"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.buffer = StreamBuffer()  # 当前这次请求已收到的内容
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def partial(self):
+        return self.buffer.getvalue()
+
+class LineReader:
+    """在后台线程读取输入行，回答输出期间也可以继续输入（预输入）"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        while True:
+            try:
+                line = input()
+            except (EOFError, OSError):
+                line = None
+            try:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, line)
+            except RuntimeError:  # 会话已结束
+                return
+            if line is None:
+                return
+
+    def interrupt(self):
+        """让正在等待的 readline 返回 None"""
+        self.queue.put_nowait(None)
+
+    async def readline(self, prompt='> '):
+        """读取下一行，输入结束或中断时返回 None；已有预输入时直接返回"""
+        sys.stdout.write(prompt)
+        if not self.queue.empty():
+            line = self.queue.get_nowait()
+            if line is not None:
+                sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+            return line
+        sys.stdout.flush()
+        return await self.queue.get()
+
+class BackgroundWriter:
+    """在单个后台线程中按顺序执行写日志等操作，不阻塞对话"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"后台写入失败: {e}")
+
+    def submit(self, func, *args):
+        self._executor.submit(self._run, func, args)
+
+    def close(self):
+        """等待已提交的写入完成"""
+        self._executor.shutdown(wait=True)
+
+def install_interrupt(loop, handler):
+    """用 handler 处理 Ctrl-C；平台不支持时返回 False（仍按 KeyboardInterrupt 处理）"""
+    try:
+        loop.add_signal_handler(signal.SIGINT, handler)
+        return True
+    except (NotImplementedError, RuntimeError):
+        return False
+
+def remove_interrupt(loop):
+    try:
+        loop.remove_signal_handler(signal.SIGINT)
+    except (NotImplementedError, RuntimeError):
+        pass
+
+async def run_interruptible(func, control, grace=1.0):
+    """在守护线程中执行 func 并等待结果
+
+    control 被中断后最多再等 grace 秒；func 仍未返回（如网络卡住）时不再等待，
+    直接返回已收到的部分内容。
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(ok, value):
+        if future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def target():
+        try:
+            result = (True, func())
+        except Exception as e:
+            result = (False, e)
+        try:
+            loop.call_soon_threadsafe(deliver, *result)
+        except RuntimeError:  # 已放弃等待且会话已结束
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+    while not future.done():
+        if control.cancelled:
+            await asyncio.wait({future}, timeout=grace)
+            if not future.done():
+                return control.partial()
+            break
+        await asyncio.wait({future}, timeout=0.05)
+    return future.result()
@@ -0,0 +1,158 @@
+import re
+import sys
+import time
+import queue
+import threading
+
+_STOP = object()
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+def count_cjk(text):
+    """统计中日韩字符（含全角标点）数量"""
+    return len(_CJK_RE.findall(text))
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约每字 1 个，其他约每 4 个字符 1 个"""
+    cjk = count_cjk(text)
+    return cjk + (len(text) - cjk + 3) // 4
+
+class StreamBuffer:
+    """流式增量累加器：分块保存增量，避免重复拼接字符串
+
+    维护已接收的字符数和估算 token 数，每次追加的开销与回答总长度无关。
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.chars = 0
+        self._cjk_chars = 0
+
+    def append(self, text):
+        """追加一个增量"""
+        if text:
+            self._chunks.append(text)
+            self.chars += len(text)
+            self._cjk_chars += count_cjk(text)
+
+    @property
+    def tokens(self):
+        """已接收内容的估算 token 数"""
+        other = self.chars - self._cjk_chars
+        return self._cjk_chars + (other + 3) // 4
+
+    def getvalue(self):
+        """返回完整文本"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def __len__(self):
+        return self.chars
+
+class StreamRenderer:
+    """流式渲染器：增量写出，按帧合并小块输出，可选打字机效果
+
+    网络循环只调用 write() 把增量放入队列，真正的输出在后台线程中完成，
+    因此无论是否开启打字机效果，都不会拖慢对网络流的读取。
+    """
+
+    def __init__(self, out=None, frame_ms=30, frame_bytes=512, typewriter=False, cps=200):
+        if out is None:
+            # 先刷新文本层缓冲，避免与之前的 print 输出乱序
+            sys.stdout.flush()
+            out = sys.stdout.buffer
+        self.out = out
+        self.frame_interval = frame_ms / 1000
+        self.frame_bytes = frame_bytes
+        self.typewriter = typewriter
+        # 打字机模式下每帧输出的字符数
+        self.frame_chars = max(1, int(cps * self.frame_interval))
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._render_loop, daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        """接收一个增量（非阻塞）"""
+        if text:
+            self._queue.put(text)
+
+    def close(self):
+        """结束输出，等待已接收的内容全部写出"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _emit(self, data):
+        self.out.write(data)
+        self.out.flush()
+
+    def _render_loop(self):
+        if self.typewriter:
+            self._typewriter_loop()
+        else:
+            self._frame_loop()
+
+    def _frame_loop(self):
+        """每 frame_ms 毫秒或累计 frame_bytes 字节输出一帧"""
+        pending = []
+        pending_bytes = 0
+        last_emit = float('-inf')
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, last_emit + self.frame_interval - time.perf_counter())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                if pending:
+                    self._emit(b''.join(pending))
+                return
+            if item is not None:
+                data = item.encode('utf-8')
+                pending.append(data)
+                pending_bytes += len(data)
+
+            now = time.perf_counter()
+            if pending and (pending_bytes >= self.frame_bytes
+                            or now - last_emit >= self.frame_interval):
+                self._emit(b''.join(pending))
+                pending = []
+                pending_bytes = 0
+                last_emit = now
+
+    def _typewriter_loop(self):
+        """按固定速度逐帧输出，积压内容留在内存中"""
+        backlog = ''
+        stopped = False
+        while True:
+            if not backlog and not stopped:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                backlog = item
+            # 取走队列中已到达的全部增量
+            while not stopped:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopped = True
+                else:
+                    backlog += item
+            if not backlog:
+                return
+
+            frame, backlog = backlog[:self.frame_chars], backlog[self.frame_chars:]
+            self._emit(frame.encode('utf-8'))
+            if backlog or not stopped:
+                time.sleep(self.frame_interval)